@@ -4,15 +4,14 @@ import time
 from django.apps import AppConfig
 from django.utils import timezone
 import sys
-from django.db.models import F
-from django.db import transaction
 
 def background_dummy_event_generator():
     """
-    Continuously inserts dummy ToolEventTracking events and updates Inventory correctly.
-    Will skip updates if available_quantity is 0 for issue/damage, or in_use is 0 for return.
+    Continuously inserts dummy ToolEventTracking events; the inventory projector applies them.
+    Will skip events if available_quantity is 0 for issue/damage, or in_use is 0 for return.
     """
     from detection.models import ToolEventTracking, Inventory
+    from detection.projector import project_pending
 
     print("🔄 [Background Event Generator] Started generating dummy events...")
 
@@ -36,6 +35,9 @@ def background_dummy_event_generator():
     ]
 
     while True:
+        # Apply the events written so far before looking at stock levels
+        project_pending()
+
         user_id, user_name = random.choice(users)
         tool_id, tool_name = random.choice(tools)
 
@@ -72,37 +74,19 @@ def background_dummy_event_generator():
             time.sleep(5)
             continue  # skip invalid event
 
-        # Apply event safely
-        with transaction.atomic():
-            ToolEventTracking.objects.create(
-                timestamp=timezone.now(),
-                user_id=user_id,
-                user_name=user_name,
-                event=event,
-                tray_id=1,
-                unit_id=1,
-                tool_id=tool_id,
-                tool_name=tool_name,
-            )
-
-            if event == "tool_Issued":
-                Inventory.objects.filter(pk=inventory.pk).update(
-                    in_use=F('in_use') + 1,
-                    available_quantity=F('available_quantity') - 1
-                )
-            elif event == "tool_Returned":
-                Inventory.objects.filter(pk=inventory.pk).update(
-                    in_use=F('in_use') - 1,
-                    available_quantity=F('available_quantity') + 1
-                )
-            elif event == "tool_Damaged":
-                Inventory.objects.filter(pk=inventory.pk).update(
-                    damaged=F('damaged') + 1,
-                    available_quantity=F('available_quantity') - 1
-                )
-            inventory.refresh_from_db()
+        # Inventory is updated from the event by the projector
+        ToolEventTracking.objects.create(
+            timestamp=timezone.now(),
+            user_id=user_id,
+            user_name=user_name,
+            event=event,
+            tray_id=1,
+            unit_id=1,
+            tool_id=tool_id,
+            tool_name=tool_name,
+        )
 
-        print(f"✅ Event: {event} | Tool: {tool_name} | User: {user_name} | In Use: {inventory.in_use} | Damaged: {inventory.damaged} | Available: {inventory.available_quantity}")
+        print(f"✅ Event: {event} | Tool: {tool_name} | User: {user_name}")
         time.sleep(5)
 
 class DetectionConfig(AppConfig):
@@ -110,6 +94,8 @@ class DetectionConfig(AppConfig):
     name = "detection"
 
     def ready(self):
+        from . import signals  # noqa: F401
+
         if "runserver" in sys.argv:
             thread = threading.Thread(target=background_dummy_event_generator, daemon=True)
             thread.start()
\ No newline at end of file
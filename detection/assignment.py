@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import response_cache
+from .models import Inventory, TrayTool
+
+
+class AssignmentError(ValueError):
+    """Carries every problem found in a batch; nothing was written."""
+
+    def __init__(self, errors, conflict=False):
+        super().__init__("; ".join(e["detail"] for e in errors))
+        self.errors = errors
+        # True when the batch was well-formed but stock ran short
+        self.conflict = conflict
+
+
+def parse_items(items):
+    """
+    Normalizes [{"inventory_id", "quantity", "remarks"?}, ...] into a list of
+    (inventory_id, quantity, remarks). Raises AssignmentError listing every
+    malformed item.
+    """
+    if not isinstance(items, list) or not items:
+        raise AssignmentError([{"item": None, "detail": "'items' must be a non-empty list"}])
+    parsed, errors, seen = [], [], set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"item": index, "detail": "Each item must be an object"})
+            continue
+        inventory_id = str(item.get("inventory_id") or "").strip()
+        quantity = item.get("quantity")
+        if not inventory_id:
+            errors.append({"item": index, "detail": "inventory_id is required"})
+        elif inventory_id in seen:
+            errors.append({"item": index, "detail": f"{inventory_id} appears more than once"})
+        elif isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            errors.append({"item": index, "detail": f"{inventory_id}: quantity must be a positive integer"})
+        else:
+            seen.add(inventory_id)
+            parsed.append((inventory_id, quantity, str(item.get("remarks") or "").strip()))
+    if errors:
+        raise AssignmentError(errors)
+    return parsed
+
+
+def assign_batch(tray, items, assigned_by=None):
+    """
+    Assigns a batch of (inventory_id, quantity, remarks) to ``tray``, all or
+    nothing.
+
+    Every affected Inventory row is locked with one SELECT ... FOR UPDATE
+    (in inventory_id order, so concurrent batches cannot deadlock), the whole
+    batch is checked against the locked stock, and then the counters are
+    written with one bulk UPDATE and the TrayTool rows with one bulk INSERT.
+    Raises AssignmentError without writing anything if any item fails.
+    """
+    wanted = [inventory_id for inventory_id, _, _ in items]
+    with transaction.atomic():
+        locked = {
+            inv.inventory_id: inv
+            for inv in (Inventory.objects.select_for_update(of=('self',))
+                        .select_related('tool').filter(inventory_id__in=wanted)
+                        .order_by('inventory_id'))
+        }
+
+        errors, unknown = [], False
+        for index, (inventory_id, quantity, _) in enumerate(items):
+            inv = locked.get(inventory_id)
+            if inv is None:
+                unknown = True
+                errors.append({"item": index, "detail": f"Unknown inventory {inventory_id}"})
+            elif quantity > inv.in_stock:
+                errors.append({
+                    "item": index,
+                    "detail": f"Cannot assign {quantity} units of {inv.tool.tool_name}. "
+                              f"Only {inv.in_stock} available.",
+                })
+        if errors:
+            raise AssignmentError(errors, conflict=not unknown)
+
+        now = timezone.now()
+        rows = []
+        for inventory_id, quantity, remarks in items:
+            inv = locked[inventory_id]
+            inv.in_stock -= quantity
+            inv.assigned_quantity += quantity
+            inv.available_quantity = inv.assigned_quantity
+            inv.last_updated = now
+            rows.append(TrayTool(tray=tray, inventory=inv, assigned_quantity=quantity,
+                                 remarks=remarks, assigned_by=assigned_by))
+
+        Inventory.objects.bulk_update(
+            list(locked.values()), ['in_stock', 'assigned_quantity', 'available_quantity', 'last_updated'],
+        )
+        TrayTool.objects.bulk_create(rows)
+        transaction.on_commit(lambda: response_cache.bump('inventory'))
+    return rows
@@ -0,0 +1,207 @@
+"""
+Synthetic datasets and per-route timing for the benchmark_views command.
+
+Everything here runs against throwaway test databases created by the
+command (the replica, if any, mirrors the primary); nothing touches the
+configured ones.
+"""
+import datetime
+import json
+import random
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import ids, urls
+from .models import (
+    Inventory, ProjectorCheckpoint, ServiceStation, ToolCreation, ToolEventTracking, ToolsTracking, Tray,
+    TrayTool, Unit,
+)
+
+CHUNK = 5000
+TRAYS_PER_UNIT = 10
+UNITS_PER_STATION = 5
+EVENT_CYCLE = ['tool_Issued', 'tool_Returned', 'tray_open', 'tray_close', 'tool_Issued', 'tool_Damaged']
+
+# Routes that cannot be timed as a plain request/response.
+SKIP = {
+    'inventory_stream',          # endless SSE stream
+    'receive_detections_async',  # only times the enqueue; flushes on a background thread
+    'logout',                    # would end the benchmark session
+}
+
+
+def _chunks(total, start=0):
+    for offset in range(start, total, CHUNK):
+        yield range(offset, min(offset + CHUNK, total))
+
+
+def _top_up(model, size, build):
+    """Adds rows until ``model`` has ``size`` of them; ``build(i)`` makes row i."""
+    existing = model.objects.count()
+    for indexes in _chunks(size, existing):
+        # bulk_create skips save(), so business ids come in one block per chunk
+        model.objects.bulk_create(ids.assign([build(i) for i in indexes]), batch_size=1000)
+    return max(size - existing, 0)
+
+
+def seed(size, stdout=None):
+    """
+    Grows the synthetic dataset to ``size`` rows each of ToolEventTracking,
+    ToolsTracking, TrayTool and Inventory (one ToolCreation per Inventory),
+    with a station/unit/tray hierarchy scaled to match. Re-running with a
+    bigger size only inserts the difference.
+    """
+    rng = random.Random(size)
+    now = timezone.now()
+    span = datetime.timedelta(days=90).total_seconds()
+
+    def log(message):
+        if stdout:
+            stdout.write(message)
+
+    stations = max(1, size // 10000)
+    _top_up(ServiceStation, stations, lambda i: ServiceStation(name=f"Station {i + 1}"))
+    station_ids = list(ServiceStation.objects.order_by('id').values_list('id', flat=True))
+    _top_up(Unit, stations * UNITS_PER_STATION, lambda i: Unit(
+        name=f"Unit {i + 1}", station_id=station_ids[i // UNITS_PER_STATION],
+    ))
+    unit_ids = list(Unit.objects.order_by('id').values_list('id', flat=True))
+    _top_up(Tray, len(unit_ids) * TRAYS_PER_UNIT, lambda i: Tray(
+        tray_name=f"Tray {i + 1}", unit_id=unit_ids[i // TRAYS_PER_UNIT],
+    ))
+    tray_ids = list(Tray.objects.order_by('id').values_list('id', flat=True))
+
+    added = _top_up(ToolCreation, size, lambda i: ToolCreation(
+        tool_id=f"BT-{i:07d}", tool_name=f"Bench tool {i}", brand=rng.choice(["Stanley", "Bosch", "Makita", "Taparia"]),
+        tool_type=rng.choice(["Spanner", "Hammer", "Driver", "Socket"]), part_number=f"PN{i:07d}",
+    ))
+    log(f"  tools +{added}")
+    tool_pks = dict(ToolCreation.objects.filter(tool_id__startswith="BT-").values_list('tool_id', 'id'))
+    added = _top_up(Inventory, size, lambda i: Inventory(
+        tool_id=tool_pks[f"BT-{i:07d}"],
+        total_quantity=20, in_stock=10, assigned_quantity=10, available_quantity=8, in_use=2,
+    ))
+    log(f"  inventory +{added}")
+    inventory_ids = list(Inventory.objects.values_list('inventory_id', flat=True))
+
+    added = _top_up(TrayTool, size, lambda i: TrayTool(
+        tray_id=rng.choice(tray_ids), inventory_id=rng.choice(inventory_ids), assigned_quantity=rng.randint(1, 3),
+    ))
+    log(f"  tray tools +{added}")
+
+    def event(i):
+        tool = rng.randrange(min(size, 5000))
+        return ToolEventTracking(
+            timestamp=now - datetime.timedelta(seconds=span * (1 - i / size)),
+            user_id=str(i % 200), user_name=f"mechanic{i % 200}",
+            event=EVENT_CYCLE[i % len(EVENT_CYCLE)], tray_id=1, unit_id=1,
+            tool_id=f"BT-{tool:07d}", tool_name=f"Bench tool {tool}",
+        )
+    added = _top_up(ToolEventTracking, size, event)
+    log(f"  events +{added}")
+
+    added = _top_up(ToolsTracking, size, lambda i: ToolsTracking(
+        device_id=f"cam-{i % 12}", tool_name=f"Bench tool {rng.randrange(100)}",
+        confidence=rng.uniform(0.3, 1.0), timestamp=now - datetime.timedelta(seconds=span * (1 - i / size)),
+        frame_id=str(i),
+    ))
+    log(f"  detections +{added}")
+
+    # Derived tables are normally kept in step by signals, which bulk_create skips.
+    from .stats import reconcile
+    from .usage import rebuild_sessions
+    rebuild_sessions()
+    reconcile(days=None)
+    last_event = ToolEventTracking.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    ProjectorCheckpoint.objects.update_or_create(name='inventory', defaults={'last_event_id': last_event})
+
+
+def route_requests():
+    """
+    Yields (name, method, path, body) for every named route in detection/urls.py.
+    Routes with URL parameters get the first matching row of the dataset;
+    routes with a parameter not listed here are skipped.
+    """
+    first = {
+        'station_id': ServiceStation.objects.order_by('id').values_list('id', flat=True).first(),
+        'unit_id': Unit.objects.order_by('id').values_list('id', flat=True).first(),
+        'tray_id': Tray.objects.order_by('id').values_list('id', flat=True).first(),
+        'dataset': 'events',
+    }
+    detection_body = json.dumps({
+        "device_id": "bench", "frames": [
+            {"frame_id": str(n), "detections": [{"tool": "Bench tool 1", "confidence": 0.9}] * 3}
+            for n in range(10)
+        ],
+    })
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name or pattern.name in SKIP:
+            continue
+        if not set(pattern.pattern.converters) <= first.keys():
+            continue
+        kwargs = {key: first[key] for key in pattern.pattern.converters}
+        path = reverse(pattern.name, kwargs=kwargs)
+        if pattern.name == 'receive_detections':
+            yield pattern.name, 'post', path, detection_body
+        elif pattern.name == 'inventory_changes_api':
+            yield pattern.name, 'get', f"{path}?wait=0", None
+        else:
+            yield pattern.name, 'get', path, None
+
+
+def measure_routes(repeat=3):
+    """Returns {route: {"ms", "queries", "status"}} using the median of ``repeat`` runs."""
+    user, _ = User.objects.get_or_create(username='bench-admin', defaults={'is_staff': True, 'is_superuser': True})
+    client = Client(HTTP_HOST='localhost')
+    client.force_login(user)
+    headers = {'HTTP_AUTHORIZATION': 'Bearer MY_SECRET_KEY'}
+
+    results = {}
+    for name, method, path, body in route_requests():
+        timings, queries, status = [], 0, None
+        for _ in range(repeat):
+            with ExitStack() as stack:
+                # Replica-routed views query another connection
+                captured = [stack.enter_context(CaptureQueriesContext(conn)) for conn in connections.all()]
+                started = time.perf_counter()
+                if method == 'post':
+                    response = client.post(path, body, content_type='application/json', **headers)
+                else:
+                    response = client.get(path, **headers)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = sum(len(c) for c in captured)
+            status = response.status_code
+        results[name] = {'ms': round(statistics.median(timings), 2), 'queries': queries, 'status': status}
+    return results
+
+
+def compare(results, baseline, time_tolerance=0.5, min_ms=5.0, query_tolerance=0):
+    """
+    Returns a list of human-readable regressions of ``results`` against
+    ``baseline`` (same shape). A view regresses when it issues more queries
+    than before (plus ``query_tolerance``), or when it is slower than
+    baseline * (1 + time_tolerance) and by more than ``min_ms``.
+    """
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if current['queries'] > before['queries'] + query_tolerance:
+            regressions.append(f"{name}: {before['queries']} -> {current['queries']} queries")
+        limit = before['ms'] * (1 + time_tolerance)
+        if current['ms'] > limit and current['ms'] - before['ms'] > min_ms:
+            regressions.append(f"{name}: {before['ms']}ms -> {current['ms']}ms")
+        if current['status'] >= 500 and before['status'] < 500:
+            regressions.append(f"{name}: now returns {current['status']}")
+    return regressions
@@ -0,0 +1,41 @@
+import os
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+_MISSING = object()
+
+
+class LRUFileBasedCache(FileBasedCache):
+    """
+    FileBasedCache that evicts least recently used entries instead of a
+    random sample: a hit refreshes the file's mtime, and culling removes the
+    oldest MAX_ENTRIES / CULL_FREQUENCY files.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))
+        except OSError:
+            pass  # culled by another process meanwhile
+        return value
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+
+        def mtime(fname):
+            try:
+                return os.path.getmtime(fname)
+            except OSError:
+                return 0
+
+        filelist.sort(key=mtime)
+        for fname in filelist[:max(1, num_entries // self._cull_frequency)]:
+            self._delete(fname)
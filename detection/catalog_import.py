@@ -0,0 +1,302 @@
+"""
+Bulk import of the tool catalog and purchases from CSV or XLSX.
+
+One row per tool, with optional purchase columns:
+
+    tool_id, tool_name, description, part_number, brand, tool_type, remarks,
+    supplier_name, invoice_number, quantity, unit_cost, purchase_date,
+    calibration, purchase_remarks
+
+Rows with a quantity also record a purchase. The file is read one row at a
+time and handled in chunks. Each chunk validates its rows, upserts
+ToolCreation in bulk, bulk-inserts ToolPurchase and applies one Inventory
+update per tool with the summed quantity, all in one transaction. Blank
+cells never overwrite stored values. Invalid rows are skipped and reported
+by row number.
+"""
+import csv
+import datetime
+import io
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import ids, response_cache
+from .models import Inventory, ToolCreation, ToolPurchase
+
+try:
+    import openpyxl
+except ImportError:  # optional: only needed for .xlsx files
+    openpyxl = None
+
+CHUNK_ROWS = getattr(settings, 'CATALOG_IMPORT_CHUNK_ROWS', 1000)
+MAX_REPORTED_ERRORS = getattr(settings, 'CATALOG_IMPORT_MAX_REPORTED_ERRORS', 1000)
+
+TOOL_FIELDS = ('tool_name', 'description', 'part_number', 'brand', 'tool_type', 'remarks')
+PURCHASE_FIELDS = ('supplier_name', 'invoice_number', 'quantity', 'unit_cost', 'purchase_date',
+                   'calibration', 'purchase_remarks')
+COLUMNS = ('tool_id',) + TOOL_FIELDS + PURCHASE_FIELDS
+
+
+class ImportFileError(ValueError):
+    """Raised when the file as a whole cannot be read."""
+
+
+class RowError(ValueError):
+    pass
+
+
+# --- reading -----------------------------------------------------------
+
+def _header(cells):
+    header = [str(c or "").strip().lower().replace(" ", "_") for c in cells]
+    if "tool_id" not in header:
+        raise ImportFileError("Header row must include a tool_id column")
+    unknown = [h for h in header if h and h not in COLUMNS]
+    if unknown:
+        raise ImportFileError(f"Unknown columns: {', '.join(unknown)}")
+    return header
+
+
+def iter_csv(fileobj):
+    """Yields (row_number, {column: value}); row 1 is the header."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        try:
+            header = _header(next(reader))
+        except StopIteration:
+            raise ImportFileError("File is empty")
+        for number, cells in enumerate(reader, 2):
+            if any(c.strip() for c in cells):
+                yield number, dict(zip(header, cells))
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFileError(f"Unreadable CSV: {e}")
+    finally:
+        text.detach()
+
+
+def iter_xlsx(fileobj):
+    """Same as iter_csv, for the first worksheet of an .xlsx workbook."""
+    if openpyxl is None:
+        raise ImportFileError("XLSX import needs openpyxl installed")
+    try:
+        workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f"Unreadable XLSX: {e}")
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        try:
+            header = _header(next(rows))
+        except StopIteration:
+            raise ImportFileError("File is empty")
+        for number, cells in enumerate(rows, 2):
+            if any(c not in (None, "") for c in cells):
+                yield number, dict(zip(header, cells))
+    finally:
+        workbook.close()
+
+
+def iter_file(fileobj, name):
+    if name.lower().endswith(".xlsx"):
+        return iter_xlsx(fileobj)
+    if name.lower().endswith((".csv", ".txt")):
+        return iter_csv(fileobj)
+    raise ImportFileError("Expected a .csv or .xlsx file")
+
+
+# --- validation --------------------------------------------------------
+
+def _text(row, field, model=None, required=False):
+    value = row.get(field)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f"{field} is required")
+    if model is not None and value:
+        max_length = model._meta.get_field(field).max_length
+        if max_length and len(value) > max_length:
+            raise RowError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def _date(row, field, required=False):
+    value = row.get(field)
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    value = "" if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise RowError(f"{field} is required")
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise RowError(f"Invalid {field}: {value!r} (use YYYY-MM-DD)")
+    return parsed
+
+
+def _number(row, field, cast):
+    value = row.get(field)
+    try:
+        return cast(str(value).strip())
+    except (TypeError, ValueError):
+        raise RowError(f"Invalid {field}: {value!r}")
+
+
+def parse_row(row):
+    """Returns (tool_id, tool_fields, purchase_fields or None) or raises RowError."""
+    tool_id = _text(row, "tool_id", ToolCreation, required=True)
+    # Blank cells leave the stored value alone
+    tool = {f: value for f in TOOL_FIELDS if (value := _text(row, f, ToolCreation))}
+
+    purchase = None
+    if _text(row, "quantity"):
+        quantity = _number(row, "quantity", float)
+        if quantity <= 0 or not quantity.is_integer():
+            raise RowError("quantity must be a positive whole number")
+        quantity = int(quantity)
+        unit_cost = _number(row, "unit_cost", float)
+        if unit_cost < 0:
+            raise RowError("unit_cost cannot be negative")
+        purchase = {
+            "supplier_name": _text(row, "supplier_name", ToolPurchase, required=True),
+            "invoice_number": _text(row, "invoice_number", ToolPurchase, required=True),
+            "quantity": quantity,
+            "unit_cost": unit_cost,
+            "purchase_cost": quantity * unit_cost,
+            "purchase_date": _date(row, "purchase_date", required=True),
+            "calibration": _date(row, "calibration"),
+            "remarks": _text(row, "purchase_remarks"),
+        }
+    return tool_id, tool, purchase
+
+
+# --- writing -----------------------------------------------------------
+
+def _upsert_tools(tools, summary):
+    """tools: {tool_id: fields}. Returns {tool_id: pk} for every tool_id given."""
+    existing = dict(ToolCreation.objects.filter(tool_id__in=tools).values_list("tool_id", "id"))
+    new = [ToolCreation(tool_id=t, **fields) for t, fields in tools.items() if t not in existing]
+    ToolCreation.objects.bulk_create(new, batch_size=500)
+    summary["tools_created"] += len(new)
+
+    # One bulk_update per distinct set of filled-in columns
+    by_columns = {}
+    for tool_id, fields in tools.items():
+        if tool_id in existing and fields:
+            by_columns.setdefault(tuple(sorted(fields)), []).append(
+                ToolCreation(id=existing[tool_id], tool_id=tool_id, **fields))
+    now = timezone.now()
+    for columns, objs in by_columns.items():
+        for obj in objs:
+            obj.updated_at = now
+        ToolCreation.objects.bulk_update(objs, list(columns) + ["updated_at"], batch_size=500)
+        summary["tools_updated"] += len(objs)
+
+    if new:
+        existing.update(ToolCreation.objects.filter(tool_id__in=[t.tool_id for t in new])
+                        .values_list("tool_id", "id"))
+    return existing
+
+
+def _apply_inventory(deltas, summary):
+    """deltas: {tool pk: quantity}. Same arithmetic as tool_purchase_view, once per tool."""
+    inventories = {}
+    for inv in Inventory.objects.filter(tool_id__in=deltas).order_by("inventory_id").only("inventory_id", "tool_id"):
+        inventories.setdefault(inv.tool_id, inv.inventory_id)
+
+    now = timezone.now()
+    for tool_pk, inventory_id in inventories.items():
+        quantity = deltas[tool_pk]
+        Inventory.objects.filter(pk=inventory_id).update(
+            total_quantity=F("total_quantity") + quantity,
+            in_stock=F("total_quantity") + quantity - F("assigned_quantity"),
+            last_updated=now,
+        )
+    created = ids.assign([
+        Inventory(tool_id=tool_pk, total_quantity=quantity, in_stock=quantity)
+        for tool_pk, quantity in deltas.items() if tool_pk not in inventories
+    ])
+    Inventory.objects.bulk_create(created, batch_size=500)
+    summary["inventory_updated"] += len(inventories)
+    summary["inventory_created"] += len(created)
+
+
+def _error(summary, number, detail):
+    summary["rejected"] += 1
+    if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({"row": number, "detail": detail})
+
+
+def _import_chunk(chunk, summary, dry_run):
+    parsed = []
+    for number, row in chunk:
+        try:
+            parsed.append((number,) + parse_row(row))
+        except RowError as e:
+            _error(summary, number, str(e))
+
+    # Purchase-only rows must name a tool that exists or is defined in the file
+    named = {tool_id for _, tool_id, tool, _ in parsed if tool.get("tool_name")}
+    known = set(ToolCreation.objects.filter(tool_id__in={p[1] for p in parsed} - named)
+                .values_list("tool_id", flat=True))
+    valid = []
+    for number, tool_id, tool, purchase in parsed:
+        if tool_id not in named and tool_id not in known:
+            _error(summary, number, f"Unknown tool_id {tool_id!r}; tool_name is required for new tools")
+        else:
+            valid.append((number, tool_id, tool, purchase))
+    summary["rows"] += len(valid)
+    if dry_run or not valid:
+        return
+
+    tools = {}
+    for _, tool_id, tool, _ in valid:
+        tools.setdefault(tool_id, {}).update(tool)
+    with transaction.atomic():
+        tool_pks = _upsert_tools(tools, summary)
+        purchases, deltas = [], {}
+        for _, tool_id, _, purchase in valid:
+            if purchase:
+                pk = tool_pks[tool_id]
+                purchases.append(ToolPurchase(tool_id=pk, **purchase))
+                deltas[pk] = deltas.get(pk, 0) + purchase["quantity"]
+        ToolPurchase.objects.bulk_create(purchases, batch_size=500)
+        summary["purchases"] += len(purchases)
+        if deltas:
+            _apply_inventory(deltas, summary)
+        # Bulk writes skip the save signals
+        transaction.on_commit(lambda: response_cache.bump('tools', 'inventory'))
+
+
+def import_rows(rows, chunk_rows=CHUNK_ROWS, dry_run=False):
+    """
+    Imports an iterator of (row_number, {column: value}) and returns a
+    summary. Chunks already written stay written if a later one fails to
+    read; the summary then carries an "aborted" reason.
+    """
+    summary = {"rows": 0, "rejected": 0, "tools_created": 0, "tools_updated": 0, "purchases": 0,
+               "inventory_updated": 0, "inventory_created": 0, "errors": []}
+    chunk = []
+    try:
+        for item in rows:
+            chunk.append(item)
+            if len(chunk) >= chunk_rows:
+                _import_chunk(chunk, summary, dry_run)
+                chunk = []
+    except ImportFileError as e:
+        summary["aborted"] = str(e)
+    _import_chunk(chunk, summary, dry_run)
+    summary["errors"].sort(key=lambda e: e["row"])
+    return summary
+
+
+def import_file(fileobj, name, chunk_rows=CHUNK_ROWS, dry_run=False):
+    return import_rows(iter_file(fileobj, name), chunk_rows, dry_run)
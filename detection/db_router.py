@@ -0,0 +1,96 @@
+"""
+Read/write routing between the primary ('default') and a read replica.
+
+Only views wrapped in @replica_reads read from the replica, and only for
+models of REPLICA_APPS (sessions and auth always stay on the primary). All
+writes go to the primary, and so does every read after a write in the same
+request. A write also sets a short-lived cookie (ReplicaRoutingMiddleware);
+until it expires that client reads from the primary everywhere, so the page
+shown after a form post is not missing the row replication has yet to copy.
+
+Without a REPLICA_DATABASE alias in DATABASES everything uses the primary.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DATABASE = getattr(settings, 'REPLICA_DATABASE', 'replica')
+REPLICA_APPS = frozenset(getattr(settings, 'REPLICA_APPS', ('detection',)))
+STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+STICKY_COOKIE = 'primary_until'
+
+_current = contextvars.ContextVar('db_routing', default=None)
+
+
+class RequestRouting:
+    __slots__ = ('replica', 'wrote', 'sticky')
+
+    def __init__(self, sticky=False):
+        self.replica = False  # inside a @replica_reads view
+        self.wrote = False
+        self.sticky = sticky  # client wrote within the last STICKY_SECONDS
+
+    @property
+    def use_replica(self):
+        return self.replica and not (self.wrote or self.sticky)
+
+
+@contextmanager
+def request_routing(sticky=False):
+    state = RequestRouting(sticky)
+    token = _current.set(state)
+    try:
+        yield state
+    finally:
+        _current.reset(token)
+
+
+def is_sticky(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def set_sticky(response):
+    until = time.time() + STICKY_SECONDS
+    response.set_cookie(STICKY_COOKIE, f"{until:.3f}", max_age=STICKY_SECONDS, httponly=True, samesite='Lax')
+
+
+def replica_reads(view):
+    """Lets ``view``'s GET requests read from the replica."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _current.get()
+        if state is None or request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        state.replica = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            state.replica = False
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if (state is not None and state.use_replica and model._meta.app_label in REPLICA_APPS
+                and REPLICA_DATABASE in settings.DATABASES):
+            return REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
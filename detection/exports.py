@@ -0,0 +1,122 @@
+"""
+Full CSV / NDJSON dumps of ToolEventTracking and ToolsTracking.
+
+Rows are read with QuerySet.iterator() (a server-side cursor on PostgreSQL)
+in (timestamp, id) order, serialized in blocks of about BLOCK_BYTES and
+optionally gzipped on the fly, so memory stays flat however many rows
+match. Used by the export view and the export_tracking command.
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+
+from .models import ToolEventTracking, ToolsTracking
+
+CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+BLOCK_BYTES = 64 * 1024
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# name: (model, columns, {filter parameter: lookup})
+DATASETS = {
+    'events': (
+        ToolEventTracking,
+        ('id', 'timestamp', 'event', 'user_id', 'user_name', 'tray_id', 'unit_id', 'tool_id', 'tool_name',
+         'created_at'),
+        {'event': 'event', 'user_id': 'user_id', 'tool_id': 'tool_id', 'tool_name': 'tool_name'},
+    ),
+    'detections': (
+        ToolsTracking,
+        ('id', 'timestamp', 'device_id', 'tool_name', 'confidence', 'frame_id', 'meta'),
+        {'device_id': 'device_id', 'tool_name': 'tool_name'},
+    ),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def queryset(dataset, start=None, end=None, **filters):
+    """Rows of ``dataset`` with start <= timestamp < end and the given filters."""
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset {dataset!r}; expected one of {', '.join(DATASETS)}")
+    model, columns, allowed = DATASETS[dataset]
+    rows = model.objects.all()
+    if start:
+        rows = rows.filter(timestamp__gte=start)
+    if end:
+        rows = rows.filter(timestamp__lt=end)
+    for name, value in filters.items():
+        if name not in allowed:
+            raise ExportError(f"Cannot filter {dataset} by {name}")
+        if value:
+            rows = rows.filter(**{allowed[name]: value})
+    return rows.order_by('timestamp', 'id').values_list(*columns)
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'))
+    return value
+
+
+def _csv_blocks(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_text(v) for v in row])
+        if buffer.tell() >= BLOCK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _ndjson_blocks(columns, rows):
+    lines, size = [], 0
+    for row in rows:
+        line = json.dumps(
+            {c: (v.isoformat() if hasattr(v, 'isoformat') else v) for c, v in zip(columns, row)},
+            separators=(',', ':'),
+        )
+        lines.append(line)
+        size += len(line) + 1
+        if size >= BLOCK_BYTES:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines, size = [], 0
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def _gzip(blocks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(dataset, rows, fmt='csv', compress=False, chunk_size=CHUNK_SIZE):
+    """Yields the encoded export of ``rows`` (from queryset(dataset, ...)) in blocks."""
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    columns = DATASETS[dataset][1]
+    serialize = _csv_blocks if fmt == 'csv' else _ndjson_blocks
+    blocks = serialize(columns, rows.iterator(chunk_size=chunk_size))
+    return _gzip(blocks) if compress else blocks
+
+
+def filename(dataset, fmt, compress=False):
+    return f"{dataset}.{FORMATS[fmt][1]}" + (".gz" if compress else "")
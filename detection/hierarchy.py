@@ -0,0 +1,101 @@
+"""
+In-process snapshot of the station -> unit -> tray hierarchy.
+
+The snapshot is built with three queries and reused until its version
+changes. The version token lives in the default cache (like the scope tokens
+in scope.py), so an edit in one process invalidates every process sharing
+that cache; signals bump it whenever a ServiceStation, Unit or Tray is saved
+or deleted. Edits that skip signals (bulk updates, other clients of the
+database) show up once the snapshot is HIERARCHY_MAX_AGE seconds old.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import ServiceStation, Tray, Unit
+
+VERSION_KEY = 'hierarchy-version'
+MAX_AGE = getattr(settings, 'HIERARCHY_MAX_AGE', 300)
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+class Hierarchy:
+    """Plain dicts, ordered by id, plus parent -> children lookups."""
+
+    def __init__(self, version, stations, units, trays):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.stations = stations
+        self.units = units
+        self.trays = trays
+        self.units_by_station = {}
+        self.trays_by_unit = {}
+        self.unit_station = {}
+        for unit in units:
+            self.units_by_station.setdefault(unit['station_id'], []).append(unit)
+            self.unit_station[unit['id']] = unit['station_id']
+        for tray in trays:
+            self.trays_by_unit.setdefault(tray['unit_id'], []).append(tray)
+
+    def trays_of_station(self, station_id):
+        return [t for u in self.units_by_station.get(station_id, []) for t in self.trays_by_unit.get(u['id'], [])]
+
+    def scoped(self, permitted):
+        """Copy restricted to the trays in ``permitted`` and their ancestors (None = everything)."""
+        if permitted is None:
+            return self
+        trays = [t for t in self.trays if t['id'] in permitted]
+        unit_ids = {t['unit_id'] for t in trays}
+        units = [u for u in self.units if u['id'] in unit_ids]
+        station_ids = {u['station_id'] for u in units}
+        stations = [s for s in self.stations if s['id'] in station_ids]
+        return Hierarchy(self.version, stations, units, trays)
+
+    def children(self, kind=None, node_id=None):
+        """Stations for no node, units of a station, trays of a unit."""
+        if kind is None:
+            return self.stations
+        if kind == 'station':
+            return self.units_by_station.get(node_id, [])
+        if kind == 'unit':
+            return self.trays_by_unit.get(node_id, [])
+        raise ValueError(f"Unknown node type {kind!r}")
+
+
+def _version():
+    return cache.get_or_set(VERSION_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def invalidate():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def _fresh(snapshot, version):
+    return snapshot is not None and snapshot.version == version and time.monotonic() - snapshot.built_at < MAX_AGE
+
+
+def get():
+    """The current Hierarchy, rebuilt when the version has moved on or it is MAX_AGE old."""
+    global _snapshot
+    version = _version()
+    snapshot = _snapshot
+    if _fresh(snapshot, version):
+        return snapshot
+    with _lock:
+        if _fresh(_snapshot, version):
+            return _snapshot
+        # Read from the primary so a lagging replica cannot pin old rows to the new version
+        db = DEFAULT_DB_ALIAS
+        _snapshot = Hierarchy(
+            version,
+            list(ServiceStation.objects.using(db).order_by('id').values('id', 'station_id', 'name')),
+            list(Unit.objects.using(db).order_by('id').values('id', 'unit_id', 'name', 'station_id')),
+            list(Tray.objects.using(db).order_by('id').values('id', 'tray_id', 'tray_name', 'unit_id')),
+        )
+        return _snapshot
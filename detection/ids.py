@@ -0,0 +1,54 @@
+"""
+Business ids (INV001, SS001, U001, T001) from counter rows in IdSequence.
+
+A block of ``count`` ids costs one UPDATE and one SELECT however large it is,
+and the UPDATE takes the row's write lock first, so concurrent allocators
+queue up instead of handing out the same number. Inside a caller's
+transaction the counter stays locked until it commits, and a rollback hands
+the ids back.
+"""
+from django.db import transaction
+from django.db.models import F
+
+# model label -> (field, prefix)
+SEQUENCES = {
+    'detection.inventory': ('inventory_id', 'INV'),
+    'detection.servicestation': ('station_id', 'SS'),
+    'detection.unit': ('unit_id', 'U'),
+    'detection.tray': ('tray_id', 'T'),
+}
+
+
+def format_id(prefix, number):
+    return f"{prefix}{number:03d}"
+
+
+def allocate(name, count=1):
+    """Reserves ``count`` consecutive numbers from sequence ``name``; returns a range."""
+    from .models import IdSequence
+
+    with transaction.atomic():
+        sequence = IdSequence.objects.filter(name=name)
+        if not sequence.update(next_value=F('next_value') + count):
+            IdSequence.objects.get_or_create(name=name)
+            sequence.update(next_value=F('next_value') + count)
+        end = sequence.values_list('next_value', flat=True).get()
+    return range(end - count, end)
+
+
+def assign(objs):
+    """
+    Fills the business id of every unsaved instance in ``objs`` that does not
+    have one yet, with a single allocation. All objects must share a model.
+    """
+    if not objs:
+        return objs
+    label = objs[0]._meta.label_lower
+    if label not in SEQUENCES:
+        return objs
+    field, prefix = SEQUENCES[label]
+    missing = [obj for obj in objs if not getattr(obj, field)]
+    if missing:
+        for obj, number in zip(missing, allocate(label, len(missing))):
+            setattr(obj, field, format_id(prefix, number))
+    return objs
@@ -0,0 +1,396 @@
+"""
+Server-side object detection for the objectDetection page and cameras.
+
+Request threads decode and preprocess their own frame (runner.prepare) and
+hand it to a MicroBatcher, which groups concurrent frames into batches of at
+most INFERENCE_MAX_BATCH, waiting no longer than INFERENCE_MAX_WAIT_MS after
+the first frame arrives, and runs one forward pass (runner.predict) per
+batch. More cameras fill bigger batches instead of queueing more passes.
+
+INFERENCE_RUNNER picks the model:
+
+- 'stub': deterministic fake detections with no dependencies (tests, demos).
+- 'onnx': ONNX Runtime on the CPU with a YOLOv8-style export at
+  INFERENCE_MODEL_PATH (needs onnxruntime, numpy and Pillow). Frames are
+  decoded in INFERENCE_PREPROCESS_WORKERS processes when that is set.
+- the dotted path of any class with the same prepare/predict methods (and,
+  if prepared frames hold resources, discard).
+"""
+import ast
+import atexit
+import hashlib
+import logging
+import queue
+import struct
+import threading
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from . import preprocess
+
+try:
+    import numpy as np
+    import onnxruntime as ort
+except ImportError:  # optional: only needed for the 'onnx' runner
+    np = ort = None
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = getattr(settings, 'INFERENCE_MAX_BATCH', 8)
+MAX_WAIT_MS = getattr(settings, 'INFERENCE_MAX_WAIT_MS', 10)
+MAX_PENDING = getattr(settings, 'INFERENCE_MAX_PENDING', 256)
+WORKERS = getattr(settings, 'INFERENCE_WORKERS', 1)
+# Runners drop anything below this; requests filter further with their own threshold.
+MIN_SCORE = getattr(settings, 'INFERENCE_MIN_SCORE', 0.05)
+
+
+class InferenceError(ValueError):
+    """The frame could not be read."""
+
+
+class Overloaded(Exception):
+    """Too many frames are already waiting, or preprocessing is restarting."""
+
+
+def image_size(data):
+    """(width, height) of a PNG or JPEG, read from its header."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    if data[:2] == b'\xff\xd8':
+        pos = 2
+        while pos + 9 < len(data):
+            if data[pos] != 0xFF:
+                break
+            marker = data[pos + 1]
+            length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+                return width, height
+            pos += 2 + length
+    raise InferenceError("Expected a PNG or JPEG image")
+
+
+class StubRunner:
+    """
+    Fake model: a few boxes derived from a hash of the frame, so the same
+    frame always gives the same answer. ``batch_ms``/``frame_ms`` simulate
+    the fixed and per-frame cost of a forward pass.
+    """
+    labels = ('spanner', 'hammer', 'screwdriver', 'pliers', 'wrench')
+
+    def __init__(self, batch_ms=0, frame_ms=0):
+        self.batch_ms = batch_ms
+        self.frame_ms = frame_ms
+
+    def prepare(self, data):
+        width, height = image_size(data)
+        return hashlib.sha256(data).digest(), width, height
+
+    def predict(self, frames):
+        time.sleep((self.batch_ms + self.frame_ms * len(frames)) / 1000)
+        return [self._detect(*frame) for frame in frames]
+
+    def _detect(self, digest, width, height):
+        detections = []
+        for i in range(digest[0] % 4):
+            a, b, c, d, e = digest[1 + i * 5:6 + i * 5]
+            w, h = width * (0.1 + c / 510), height * (0.1 + d / 510)
+            detections.append({
+                'label': self.labels[a % len(self.labels)],
+                'score': round(0.3 + e / 365, 3),
+                'bbox': [round((width - w) * b / 255, 1), round((height - h) * e / 255, 1), round(w, 1), round(h, 1)],
+            })
+        return detections
+
+
+def _nms(boxes, scores, iou):
+    """Greedy non-maximum suppression over (x1, y1, x2, y2) boxes; returns kept indices."""
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        overlap = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        order = rest[overlap / (areas[best] + areas[rest] - overlap + 1e-9) <= iou]
+    return keep
+
+
+class OnnxRunner:
+    """
+    YOLOv8-style detector (one output of shape [batch, 4 + classes, anchors],
+    boxes as cx, cy, w, h in input pixels). Frames are letterboxed to the
+    model's input size; boxes are mapped back to frame pixels as [x, y, w, h].
+
+    With ``preprocess_workers`` frames are decoded in a process pool and
+    handed over through shared memory (detection/preprocess.py); otherwise
+    in the request thread.
+    """
+
+    def __init__(self, model_path, labels=None, threads=None, min_score=MIN_SCORE, iou=0.45,
+                 preprocess_workers=0, preprocess_slots=None, prepare_timeout=None,
+                 preprocess_timeout=None):
+        if ort is None or preprocess.np is None:
+            raise ImproperlyConfigured("The 'onnx' inference runner needs onnxruntime, numpy and Pillow installed")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        # Exports with a fixed batch of 1 are run frame by frame
+        self.single = batch == 1
+        self.height = height if isinstance(height, int) else 640
+        self.width = width if isinstance(width, int) else 640
+        if labels is None:
+            names = self.session.get_modelmeta().custom_metadata_map.get('names')
+            names = ast.literal_eval(names) if names else {}
+            labels = [names[i] for i in sorted(names)] if isinstance(names, dict) else list(names)
+        self.labels = list(labels)
+        self.min_score = min_score
+        self.iou = iou
+        self.prepare_timeout = prepare_timeout
+        self.frames = None
+        if preprocess_workers:
+            slots = preprocess_slots or 2 * MAX_BATCH * WORKERS + preprocess_workers
+            self.frames = preprocess.FramePool(self.height, self.width, slots, preprocess_workers,
+                                               frame_timeout=preprocess_timeout)
+
+    def prepare(self, data):
+        """(pixels or ring slot, geometry) for one encoded frame."""
+        try:
+            if self.frames is not None:
+                return self.frames.prepare(data, self.prepare_timeout)
+            pixels = np.empty((3, self.height, self.width), np.float32)
+            return pixels, preprocess.letterbox(data, self.height, self.width, pixels)
+        except (preprocess.NoFreeSlot, preprocess.WorkerCrashed) as e:
+            raise Overloaded(str(e))
+        except ValueError as e:
+            raise InferenceError(str(e))
+
+    def discard(self, prepared):
+        """Frees a prepared frame that will not be predicted."""
+        if self.frames is not None:
+            self.frames.release(prepared[0])
+
+    def predict(self, frames):
+        if self.frames is None:
+            batch = np.stack([pixels for pixels, _ in frames])
+        else:
+            try:
+                batch = np.stack([self.frames.tensor(slot) for slot, _ in frames])
+            finally:
+                for slot, _ in frames:
+                    self.frames.release(slot)
+        if self.single:
+            outputs = [self.session.run(None, {self.input_name: batch[i:i + 1]})[0][0] for i in range(len(frames))]
+        else:
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+        return [self._decode(output, geometry) for output, (_, geometry) in zip(outputs, frames)]
+
+    def _decode(self, output, geometry):
+        scale, pad_x, pad_y, width, height = geometry
+        predictions = output.T
+        class_scores = predictions[:, 4:]
+        classes = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(classes)), classes]
+        keep = scores >= self.min_score
+        predictions, classes, scores = predictions[keep], classes[keep], scores[keep]
+        if not len(scores):
+            return []
+
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / scale).clip(0, width)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / scale).clip(0, height)
+        # Offset each class so one NMS pass never suppresses across classes
+        offsets = classes[:, None] * float(max(width, height) + 1)
+        detections = []
+        for i in _nms(boxes + offsets, scores, self.iou):
+            x1, y1, x2, y2 = boxes[i].tolist()
+            label = self.labels[classes[i]] if classes[i] < len(self.labels) else str(classes[i])
+            detections.append({'label': label, 'score': round(float(scores[i]), 4),
+                               'bbox': [round(x1, 1), round(y1, 1), round(x2 - x1, 1), round(y2 - y1, 1)]})
+        return detections
+
+
+def build_runner():
+    name = getattr(settings, 'INFERENCE_RUNNER', 'stub')
+    if name == 'stub':
+        return StubRunner(getattr(settings, 'INFERENCE_STUB_BATCH_MS', 0), getattr(settings, 'INFERENCE_STUB_FRAME_MS', 0))
+    if name == 'onnx':
+        path = getattr(settings, 'INFERENCE_MODEL_PATH', None)
+        if not path:
+            raise ImproperlyConfigured("INFERENCE_MODEL_PATH is required for the 'onnx' inference runner")
+        return OnnxRunner(
+            path, getattr(settings, 'INFERENCE_LABELS', None), getattr(settings, 'INFERENCE_THREADS', None),
+            preprocess_workers=getattr(settings, 'INFERENCE_PREPROCESS_WORKERS', 0),
+            preprocess_slots=getattr(settings, 'INFERENCE_PREPROCESS_SLOTS', None),
+            prepare_timeout=getattr(settings, 'INFERENCE_TIMEOUT', 10),
+            preprocess_timeout=getattr(settings, 'INFERENCE_PREPROCESS_TIMEOUT', 5),
+        )
+    return import_string(name)()
+
+
+class MicroBatcher:
+    """
+    Bounded queue of prepared frames drained by WORKERS daemon threads. Each
+    worker blocks for one frame, then gathers more until ``max_batch`` frames
+    are in hand or ``max_wait`` seconds have passed since the first, and runs
+    them through the runner together.
+    """
+
+    def __init__(self, runner, max_batch=MAX_BATCH, max_wait=MAX_WAIT_MS / 1000, max_pending=MAX_PENDING,
+                 workers=WORKERS):
+        self.runner = runner
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+
+        self.frames = 0
+        self.batches = 0
+        self.rejected_frames = 0
+        self.failed_batches = 0
+        self.largest_batch = 0
+        self.last_batch_ms = 0.0
+
+    def submit(self, prepared):
+        """Queues a prepared frame; returns a Future of its detections."""
+        self._ensure_started()
+        future = futures.Future()
+        try:
+            self._queue.put_nowait((prepared, future))
+        except queue.Full:
+            with self._lock:
+                self.rejected_frames += 1
+            raise Overloaded("Inference queue full, retry later")
+        return future
+
+    def detect(self, data, timeout=None):
+        """Detections for one encoded frame; blocks until its batch has run."""
+        prepared = self.runner.prepare(data)
+        try:
+            future = self.submit(prepared)
+        except Overloaded:
+            self._discard(prepared)
+            raise
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError("Timed out waiting for inference")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "frames": self.frames,
+                "batches": self.batches,
+                "mean_batch": round(self.frames / self.batches, 2) if self.batches else 0,
+                "largest_batch": self.largest_batch,
+                "rejected_frames": self.rejected_frames,
+                "failed_batches": self.failed_batches,
+                "last_batch_ms": round(self.last_batch_ms, 2),
+            }
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._run, name=f"inference-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+                atexit.register(self.stop)
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        items = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                items.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Frames whose caller gave up are skipped
+        live = []
+        for prepared, future in items:
+            if future.set_running_or_notify_cancel():
+                live.append((prepared, future))
+            else:
+                self._discard(prepared)
+        return live
+
+    def _discard(self, prepared):
+        discard = getattr(self.runner, 'discard', None)
+        if discard is not None:
+            discard(prepared)
+
+    def _run_batch(self, items):
+        started = time.perf_counter()
+        try:
+            results = self.runner.predict([prepared for prepared, _ in items])
+        except Exception as e:
+            logger.exception("Inference failed for a batch of %d frames", len(items))
+            with self._lock:
+                self.failed_batches += 1
+            for _, future in items:
+                future.set_exception(e)
+            return
+        for (_, future), detections in zip(items, results):
+            future.set_result(detections)
+        with self._lock:
+            self.batches += 1
+            self.frames += len(items)
+            self.largest_batch = max(self.largest_batch, len(items))
+            self.last_batch_ms = (time.perf_counter() - started) * 1000
+
+    def _run(self):
+        while not self._stopping.is_set():
+            items = self._collect()
+            if items:
+                self._run_batch(items)
+
+    def stop(self):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout=1)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def batcher():
+    """The process-wide MicroBatcher, built from settings on first use."""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(build_runner())
+    return _batcher
+
+
+def stats():
+    """Batcher stats, or None before the first detection request."""
+    return _batcher.stats() if _batcher is not None else None
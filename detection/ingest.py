@@ -0,0 +1,278 @@
+import datetime
+import gzip
+import json
+import time
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metrics, rollups
+from .models import ToolsTracking
+
+try:
+    import msgpack
+except ImportError:  # optional: only needed for application/msgpack uploads
+    msgpack = None
+
+# Rows per INSERT statement; keeps us under SQLite's variable limit.
+BULK_BATCH_SIZE = getattr(settings, 'DETECTION_BULK_BATCH_SIZE', 500)
+MAX_FRAMES_PER_REQUEST = getattr(settings, 'DETECTION_MAX_FRAMES_PER_REQUEST', 1000)
+# Rows buffered before each commit when streaming a backlog upload.
+STREAM_CHUNK_ROWS = getattr(settings, 'DETECTION_STREAM_CHUNK_ROWS', 5000)
+MAX_REPORTED_ERRORS = 100
+# Upper bound on a decompressed gzip JSON body (streamed bodies are not capped).
+MAX_DECODED_BODY = getattr(settings, 'DETECTION_MAX_DECODED_BODY', 50 * 1024 * 1024)
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonlines')
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+class PayloadError(ValueError):
+    """Raised when a detection payload cannot be turned into rows."""
+
+
+def is_gzipped(request):
+    return request.headers.get("Content-Encoding", "").lower() == "gzip"
+
+
+def request_body(request):
+    """Returns request.body, gunzipped when the sender compressed it."""
+    if not is_gzipped(request):
+        return request.body
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        body = inflater.decompress(request.body, MAX_DECODED_BODY)
+    except zlib.error as e:
+        raise PayloadError(f"Invalid gzip body: {e}")
+    if inflater.unconsumed_tail:
+        raise PayloadError("Decompressed body too large")
+    return body
+
+
+def request_stream(request):
+    """File-like view of the request body for the streaming formats."""
+    return gzip.GzipFile(fileobj=request, mode="rb") if is_gzipped(request) else request
+
+
+def iter_frames(data):
+    """
+    Yields the frames of a decoded payload.
+
+    Accepts the legacy single-frame document ({"device_id", "detections", ...})
+    as well as a batch ({"device_id"?, "frames": [...]}) where each frame may
+    override the top-level device_id.
+    """
+    if not isinstance(data, dict):
+        raise PayloadError("Payload must be a JSON object")
+
+    if "frames" not in data:
+        yield data
+        return
+
+    frames = data["frames"]
+    if not isinstance(frames, list):
+        raise PayloadError("'frames' must be a list")
+    if len(frames) > MAX_FRAMES_PER_REQUEST:
+        raise PayloadError(f"Too many frames (max {MAX_FRAMES_PER_REQUEST})")
+
+    default_device = data.get("device_id")
+    for frame in frames:
+        if not isinstance(frame, dict):
+            raise PayloadError("Each frame must be a JSON object")
+        if default_device and not frame.get("device_id"):
+            frame = {**frame, "device_id": default_device}
+        yield frame
+
+
+def parse_timestamp(value, default=None):
+    if value is None or value == "":
+        return default or timezone.now()
+    if isinstance(value, datetime.datetime):
+        return value if timezone.is_aware(value) else timezone.make_aware(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Epoch seconds, as MessagePack senders usually send them.
+        try:
+            return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise PayloadError(f"Timestamp out of range: {value!r}")
+    if not isinstance(value, str):
+        raise PayloadError(f"Invalid timestamp: {value!r}")
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:  # well formed but not a real date, e.g. month 13
+        parsed = None
+    if parsed is None:
+        raise PayloadError(f"Invalid timestamp: {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _checked_text(value, field, label):
+    """``value`` as stored in ToolsTracking.<field>; rejects what the column cannot hold."""
+    if value is None:
+        return None
+    value = str(value)
+    max_length = ToolsTracking._meta.get_field(field).max_length
+    if len(value) > max_length:
+        raise PayloadError(f"{label} is longer than {max_length} characters")
+    return value
+
+
+def frame_rows(frame, received_at=None):
+    """
+    Builds unsaved ToolsTracking rows for one frame.
+
+    Frame-level meta is stored once, on the first row of the frame, instead of
+    being copied into every detection. Any extra keys on a detection (bbox,
+    class id, ...) are kept in that row's meta.
+    """
+    device_id = frame.get("device_id")
+    if not device_id:
+        raise PayloadError("device_id is required")
+    device_id = _checked_text(device_id, "device_id", "device_id")
+
+    detections = frame.get("detections", [])
+    if not isinstance(detections, list):
+        raise PayloadError("'detections' must be a list")
+
+    timestamp = parse_timestamp(frame.get("timestamp"), received_at)
+    frame_id = _checked_text(frame.get("frame_id"), "frame_id", "frame_id")
+    frame_meta = frame.get("meta") or {}
+
+    rows = []
+    for d in detections:
+        if not isinstance(d, dict) or not d.get("tool"):
+            raise PayloadError("Each detection needs a 'tool'")
+        tool_name = _checked_text(d["tool"], "tool_name", "tool")
+        try:
+            confidence = float(d.get("confidence", 0.0))
+        except (TypeError, ValueError):
+            raise PayloadError(f"Invalid confidence: {d.get('confidence')!r}")
+
+        meta = {k: v for k, v in d.items() if k not in ("tool", "confidence")}
+        if not rows and frame_meta:
+            meta = {**frame_meta, **meta}
+
+        rows.append(ToolsTracking(
+            device_id=device_id,
+            tool_name=tool_name,
+            confidence=confidence,
+            timestamp=timestamp,
+            frame_id=frame_id,
+            meta=meta,
+        ))
+    return rows
+
+
+def build_rows(data, received_at=None):
+    """
+    Validates a whole payload up front and returns (rows, acks).
+
+    Each ack is a compact {"frame_id", "device_id", "saved"} entry, in the
+    order the frames were received.
+    """
+    received_at = received_at or timezone.now()
+    rows, acks = [], []
+    for frame in iter_frames(data):
+        frame_objs = frame_rows(frame, received_at)
+        rows.extend(frame_objs)
+        acks.append({
+            "frame_id": frame.get("frame_id"),
+            "device_id": frame.get("device_id"),
+            "saved": len(frame_objs),
+        })
+    return rows, acks
+
+
+def save_rows(rows):
+    """Writes all rows, and their rollups, with batched INSERTs inside a single transaction."""
+    if not rows:
+        return 0
+    started = time.perf_counter()
+    with transaction.atomic():
+        ToolsTracking.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+        rollups.record(rows)
+    metrics.record_detection_write(rows, time.perf_counter() - started)
+    return len(rows)
+
+
+def iter_ndjson(stream):
+    """
+    Yields (line_number, document) for a newline-delimited JSON stream.
+
+    Reads one line at a time, so memory stays flat however large the upload
+    is. A line that is not valid JSON is yielded as a PayloadError.
+    """
+    try:
+        for lineno, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield lineno, json.loads(line)
+            except ValueError as e:
+                yield lineno, PayloadError(f"Invalid JSON: {e}")
+    except (OSError, EOFError) as e:
+        # Truncated or corrupt gzip stream
+        raise PayloadError(f"Invalid gzip body: {e}")
+
+
+def iter_msgpack(stream):
+    """Yields (position, document) for a stream of concatenated MessagePack maps."""
+    if msgpack is None:
+        raise PayloadError("MessagePack support is not installed")
+    unpacker = msgpack.Unpacker(stream, raw=False, timestamp=3)
+    try:
+        for position, doc in enumerate(unpacker, 1):
+            yield position, doc
+    except (msgpack.UnpackException, ValueError, OSError, EOFError) as e:
+        raise PayloadError(f"Invalid MessagePack: {e}")
+
+
+def save_stream(documents, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Inserts frames from an iterator of (position, document) pairs.
+
+    Rows are committed every ``chunk_rows`` rows, so a failure half way
+    through keeps what was already written; the summary says how far it got.
+    Each document may be a single frame or a {"frames": [...]} batch. Invalid
+    documents are skipped and reported by position; if the stream itself
+    becomes undecodable the summary gets an "aborted" reason, and "read" is
+    the position of the last document handled before that.
+    """
+    received_at = timezone.now()
+    summary = {"frames": 0, "saved": 0, "rejected": 0, "errors": [], "read": 0}
+    pending = []
+
+    try:
+        for position, doc in documents:
+            summary["read"] = position
+            try:
+                if isinstance(doc, PayloadError):
+                    raise doc
+                frame_objs = []
+                frames = 0
+                for frame in iter_frames(doc):
+                    frame_objs.extend(frame_rows(frame, received_at))
+                    frames += 1
+            except PayloadError as e:
+                summary["rejected"] += 1
+                if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                    summary["errors"].append({"position": position, "detail": str(e)})
+                continue
+
+            summary["frames"] += frames
+            pending.extend(frame_objs)
+            if len(pending) >= chunk_rows:
+                summary["saved"] += save_rows(pending)
+                pending = []
+    except PayloadError as e:
+        # The stream itself is unreadable past this point; keep what we have.
+        summary["aborted"] = str(e)
+
+    summary["saved"] += save_rows(pending)
+    return summary
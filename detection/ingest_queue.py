@@ -0,0 +1,156 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import ingest
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING_BATCHES = getattr(settings, 'DETECTION_QUEUE_MAX_BATCHES', 1000)
+FLUSH_MAX_ROWS = getattr(settings, 'DETECTION_FLUSH_MAX_ROWS', 2000)
+FLUSH_INTERVAL = getattr(settings, 'DETECTION_FLUSH_INTERVAL', 0.5)  # seconds
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-memory queue of validated ToolsTracking batches.
+
+    Request handlers only call enqueue(), which never touches the database.
+    A single daemon thread drains the queue and writes with
+    ingest.save_rows() once FLUSH_MAX_ROWS rows are pending or FLUSH_INTERVAL
+    seconds have passed since the first pending batch, whichever comes first.
+    Anything still queued is flushed at interpreter exit.
+    """
+
+    def __init__(self, maxsize=MAX_PENDING_BATCHES, max_rows=FLUSH_MAX_ROWS, interval=FLUSH_INTERVAL):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.max_rows = max_rows
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+        self.enqueued_batches = 0
+        self.rejected_batches = 0
+        self.dropped_batches = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def enqueue(self, rows):
+        """Returns False (and counts a rejection) when the queue is full."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            with self._lock:
+                self.rejected_batches += 1
+            return False
+        with self._lock:
+            self.enqueued_batches += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "enqueued_batches": self.enqueued_batches,
+                "rejected_batches": self.rejected_batches,
+                "dropped_batches": self.dropped_batches,
+                "flushed_rows": self.flushed_rows,
+                "flushes": self.flushes,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+                "max_flush_ms": round(self.max_flush_ms, 2),
+            }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="detection-flusher", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _collect(self):
+        """Blocks for the first batch, then gathers more until a bound is hit."""
+        try:
+            first = self._queue.get(timeout=self.interval)
+        except queue.Empty:
+            return []
+        batches = [first]
+        pending = len(first)
+        deadline = time.monotonic() + self.interval
+        while pending < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batches.append(batch)
+            pending += len(batch)
+        return batches
+
+    def _flush(self, batches):
+        """
+        Writes ``batches`` in one transaction. If that fails, each batch is
+        retried on its own, so one bad batch does not take the others with it.
+        """
+        rows = [row for batch in batches for row in batch]
+        started = time.perf_counter()
+        try:
+            close_old_connections()
+            ingest.save_rows(rows)
+        except Exception:
+            if len(batches) == 1:
+                logger.exception("Dropping a detection batch (%d rows)", len(rows))
+                with self._lock:
+                    self.dropped_batches += 1
+                return
+            logger.warning("Flushing %d detection batches together failed; retrying one by one", len(batches))
+            for row in rows:
+                row.pk = None  # ids handed out by the rolled-back INSERTs
+            for batch in batches:
+                self._flush([batch])
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batches = self._collect()
+            if batches:
+                self._flush(batches)
+
+    def drain(self):
+        """Synchronously writes whatever is queued right now."""
+        batches = []
+        while True:
+            try:
+                batches.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batches:
+            self._flush(batches)
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+        self.drain()
+
+
+write_behind = WriteBehindQueue()
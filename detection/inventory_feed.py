@@ -0,0 +1,190 @@
+import asyncio
+import datetime
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+
+from .models import Inventory
+
+# How often one process checks for new Inventory changes, however many
+# browsers are subscribed.
+POLL_INTERVAL = getattr(settings, 'INVENTORY_FEED_POLL_INTERVAL', 0.5)
+# Rows updated this close before the cursor are sent again with each new
+# delta, so a transaction that committed late with an earlier last_updated is
+# not missed. Clients apply full row state, so a repeat is harmless.
+OVERLAP = datetime.timedelta(seconds=getattr(settings, 'INVENTORY_FEED_OVERLAP', 2))
+HEARTBEAT = 15  # seconds between SSE keep-alive comments
+MAX_ROWS = 500
+# SSE needs an ASGI server: under WSGI the streaming response would never send
+# anything and would hold a worker for good, so the page long-polls instead.
+SSE_ENABLED = getattr(settings, 'INVENTORY_FEED_SSE', False)
+
+
+def encode_cursor(last_updated, inventory_id=""):
+    """Cursor for the keyset position (last_updated, inventory_id)."""
+    return f"{last_updated.isoformat()}|{inventory_id}" if last_updated else ""
+
+
+def decode_cursor(cursor):
+    """(last_updated, inventory_id), or None; a bare timestamp (older clients) sorts before its rows."""
+    value, _, inventory_id = (cursor or "").partition("|")
+    last_updated = parse_datetime(value) if value else None
+    return (last_updated, inventory_id) if last_updated else None
+
+
+def current_cursor():
+    latest = Inventory.objects.order_by('-last_updated', '-inventory_id').values_list(
+        'last_updated', 'inventory_id').first()
+    return encode_cursor(*latest) if latest else ""
+
+
+def row_json(item):
+    return {
+        'inventoryId': item.inventory_id,
+        'toolId': item.tool_id,
+        'totalQuantity': item.total_quantity,
+        'inStock': item.in_stock,
+        'assignedQuantity': item.assigned_quantity,
+        'availableQuantity': item.available_quantity,
+        'inUse': item.in_use,
+        'damaged': item.damaged,
+        'location': item.location,
+        'lastUpdated': item.last_updated.strftime('%Y-%m-%d %H:%M'),
+        'remarks': item.remarks or '',
+    }
+
+
+def changes_since(cursor):
+    """
+    Returns (rows, new_cursor) for Inventory rows changed after ``cursor``,
+    at most MAX_ROWS at a time in (last_updated, inventory_id) order, so a
+    burst of changes is paged through rather than cut off. Returns nothing
+    when the cursor is current.
+    """
+    since = decode_cursor(cursor)
+    items = Inventory.objects.order_by('last_updated', 'inventory_id')
+    if since is None:
+        new = list(items[:MAX_ROWS])
+        late = []
+    else:
+        last_updated, inventory_id = since
+        after = Q(last_updated__gt=last_updated) | Q(last_updated=last_updated, inventory_id__gt=inventory_id)
+        new = list(items.filter(after)[:MAX_ROWS])
+        late = list(items.filter(last_updated__gt=last_updated - OVERLAP).exclude(after)[:MAX_ROWS]) if new else []
+    if not new:
+        return [], cursor
+    return [row_json(i) for i in late + new], encode_cursor(new[-1].last_updated, new[-1].inventory_id)
+
+
+class InventoryWatcher:
+    """
+    One background thread per process polls MAX(last_updated) while anyone
+    is subscribed, and bumps ``version`` when it moves. Subscribers compare
+    versions in memory and only query for deltas after a change.
+    """
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.version = 0
+        self._latest = None
+        self._subscribers = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+
+    def subscribe(self):
+        with self._lock:
+            self._subscribers += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="inventory-watcher", daemon=True)
+                self._thread.start()
+            return self.version
+
+    def unsubscribe(self):
+        with self._lock:
+            self._subscribers -= 1
+
+    def wait(self, version, timeout):
+        """Blocks (sync callers) until version moves past ``version``."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._subscribers <= 0:
+                    self._thread = None
+                    return
+            try:
+                close_old_connections()
+                latest = Inventory.objects.aggregate(latest=Max('last_updated'))['latest']
+            except Exception:
+                latest = self._latest
+            if latest != self._latest:
+                with self._changed:
+                    self._latest = latest
+                    self.version += 1
+                    self._changed.notify_all()
+            time.sleep(self.interval)
+
+
+watcher = InventoryWatcher()
+
+
+def wait_for_changes(cursor, timeout):
+    """Long-poll helper: returns as soon as there is a delta or on timeout."""
+    rows, cursor = changes_since(cursor)
+    if rows:
+        return rows, cursor
+    version = watcher.subscribe()
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return [], cursor
+            new_version = watcher.wait(version, remaining)
+            if new_version != version:
+                version = new_version
+                rows, cursor = changes_since(cursor)
+                if rows:
+                    return rows, cursor
+    finally:
+        watcher.unsubscribe()
+
+
+async def sse_events(cursor):
+    """Async generator of server-sent-event chunks for the inventory feed (ASGI only)."""
+    fetch = sync_to_async(changes_since, thread_sensitive=True)
+    version = watcher.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        rows, cursor = await fetch(cursor)
+        if rows:
+            yield f"id: {cursor}\nevent: inventory\ndata: {json.dumps(rows, cls=DjangoJSONEncoder)}\n\n"
+        idle = 0.0
+        while True:
+            if not rows:
+                await asyncio.sleep(POLL_INTERVAL)
+                if watcher.version == version:
+                    idle += POLL_INTERVAL
+                    if idle >= HEARTBEAT:
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+                    continue
+            # After a delta, fetch again straight away in case it was one page of several
+            version = watcher.version
+            idle = 0.0
+            rows, cursor = await fetch(cursor)
+            if rows:
+                yield f"id: {cursor}\nevent: inventory\ndata: {json.dumps(rows, cls=DjangoJSONEncoder)}\n\n"
+    finally:
+        watcher.unsubscribe()
@@ -0,0 +1,245 @@
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+from detection.models import ToolEventTracking, ToolsTracking
+from detection.rollups import LEVELS
+from detection.stats import reconcile
+
+PREFIX = "loadgen-"
+EVENTS = ['tool_Issued', 'tool_Returned', 'tool_Damaged', 'tray_open', 'tray_close']
+TOOLS = ["Spanner 7 inch", "Spanner 10 inch", "Hammer 5 kg", "Screw Driver", "Hammer 10 kg", "Spanner 20 inch"]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def ok(self, seconds, items=1):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.items += items
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates devices posting detections and users generating tool events at a target "
+        "rate, then reports throughput, p50/p95/p99 write latency and error rate. Runs against "
+        "the configured default database (set DJANGO_DB=sqlite for the local SQLite file)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=12, help="Simulated cameras posting detections.")
+        parser.add_argument('--users', type=int, default=20, help="Simulated users writing tool events.")
+        parser.add_argument('--detection-rate', type=float, default=50,
+                            help="Target POSTs per second across all devices (0 disables).")
+        parser.add_argument('--event-rate', type=float, default=20,
+                            help="Target tool events per second across all users (0 disables).")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to run.")
+        parser.add_argument('--frames-per-post', type=int, default=1)
+        parser.add_argument('--detections-per-frame', type=int, default=3)
+        parser.add_argument('--url', help="Post to a running server (e.g. http://localhost:8000/api/detections/) "
+                                          "instead of calling the view in-process.")
+        parser.add_argument('--token', default="MY_SECRET_KEY")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+        parser.add_argument('--keep', action='store_true', help="Keep generated rows instead of deleting them.")
+
+    # --- workers ------------------------------------------------------
+
+    def _paced(self, rate, deadline, action):
+        """Calls action() every 1/rate seconds until deadline, catching up when behind."""
+        interval = 1.0 / rate
+        next_at = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if next_at > now:
+                time.sleep(min(next_at - now, deadline - now))
+                continue
+            action()
+            next_at += interval
+
+    def _frame(self, device_id, n):
+        return {
+            "device_id": device_id,
+            "timestamp": timezone.now().isoformat(),
+            "frame_id": f"{device_id}-{n}",
+            "detections": [
+                {"tool": random.choice(TOOLS), "confidence": round(random.uniform(0.3, 1.0), 3)}
+                for _ in range(self.options['detections_per_frame'])
+            ],
+        }
+
+    def _device(self, index, rate, deadline, recorder):
+        device_id = f"{PREFIX}cam-{index}"
+        headers = {"Authorization": f"Bearer {self.options['token']}", "Content-Type": "application/json"}
+        counter = [0]
+
+        if self.options['url']:
+            parts = urlsplit(self.options['url'])
+            conn_cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+            conn = conn_cls(parts.netloc, timeout=30)
+
+            def post(body):
+                conn.request("POST", parts.path or "/", body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                return response.status
+        else:
+            client = Client(HTTP_HOST="localhost")
+
+            def post(body):
+                return client.post("/api/detections/", body, content_type="application/json",
+                                   HTTP_AUTHORIZATION=headers["Authorization"]).status_code
+
+        def send():
+            frames = []
+            for _ in range(self.options['frames_per_post']):
+                counter[0] += 1
+                frames.append(self._frame(device_id, counter[0]))
+            body = json.dumps({"device_id": device_id, "frames": frames})
+            started = time.perf_counter()
+            try:
+                status = post(body)
+            except Exception:
+                recorder.error()
+                return
+            if status >= 400:
+                recorder.error()
+            else:
+                recorder.ok(time.perf_counter() - started,
+                            len(frames) * self.options['detections_per_frame'])
+
+        try:
+            self._paced(rate, deadline, send)
+        finally:
+            connection.close()
+
+    def _user(self, index, rate, deadline, recorder):
+        user_id = f"{PREFIX}{index}"
+
+        def write():
+            tool = random.randrange(len(TOOLS))
+            started = time.perf_counter()
+            try:
+                ToolEventTracking.objects.create(
+                    timestamp=timezone.now(),
+                    user_id=user_id,
+                    user_name=f"mechanic{index}",
+                    event=random.choice(EVENTS),
+                    tray_id=1,
+                    unit_id=1,
+                    tool_id=f"{PREFIX}tool-{tool}",
+                    tool_name=TOOLS[tool],
+                )
+            except Exception:
+                recorder.error()
+                return
+            recorder.ok(time.perf_counter() - started)
+
+        try:
+            self._paced(rate, deadline, write)
+        finally:
+            connection.close()
+
+    # --- report -------------------------------------------------------
+
+    def _summary(self, name, recorder, elapsed):
+        latencies = sorted(recorder.latencies)
+        attempts = len(latencies) + recorder.errors
+        return {
+            "target": name,
+            "requests": attempts,
+            "ok": len(latencies),
+            "errors": recorder.errors,
+            "error_rate": round(recorder.errors / attempts, 4) if attempts else 0.0,
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "rows_per_sec": round(recorder.items / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        }
+
+    def handle(self, *args, **options):
+        self.options = options
+        if options['duration'] <= 0:
+            raise CommandError("--duration must be positive")
+
+        plans = []
+        if options['detection_rate'] > 0 and options['devices'] > 0:
+            plans.append(("detections", self._device, options['devices'], options['detection_rate']))
+        if options['event_rate'] > 0 and options['users'] > 0:
+            plans.append(("events", self._user, options['users'], options['event_rate']))
+        if not plans:
+            raise CommandError("Nothing to do: both rates are 0")
+
+        self.stderr.write(
+            f"Running {options['duration']}s against {connection.vendor} "
+            f"({'HTTP ' + options['url'] if options['url'] else 'in-process'})..."
+        )
+        recorders = {name: Recorder() for name, *_ in plans}
+        threads = []
+        started = time.monotonic()
+        deadline = started + options['duration']
+        for name, worker, count, rate in plans:
+            for i in range(count):
+                threads.append(threading.Thread(
+                    target=worker, args=(i, rate / count, deadline, recorders[name]), daemon=True,
+                ))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+
+        report = {
+            "database": connection.vendor,
+            "duration_s": round(elapsed, 2),
+            "results": [self._summary(name, recorders[name], elapsed) for name, *_ in plans],
+        }
+
+        if not options['keep']:
+            ToolsTracking.objects.filter(device_id__startswith=PREFIX).delete()
+            for rollup in LEVELS.values():
+                rollup.objects.filter(device_id__startswith=PREFIX).delete()
+            ToolEventTracking.objects.filter(user_id__startswith=PREFIX).delete()
+            # Take the generated events back out of the activity counters
+            reconcile()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"database={report['database']} duration={report['duration_s']}s")
+        header = f"{'target':<12}{'ok':>8}{'err%':>8}{'req/s':>10}{'rows/s':>10}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}"
+        self.stdout.write(header)
+        for r in report['results']:
+            self.stdout.write(
+                f"{r['target']:<12}{r['ok']:>8}{r['error_rate'] * 100:>7.1f}%{r['throughput_rps']:>10}"
+                f"{r['rows_per_sec']:>10}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+            )
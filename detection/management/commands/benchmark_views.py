@@ -0,0 +1,78 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import setup_databases, teardown_databases
+
+from detection import benchmarks
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'views_baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database with synthetic data at each --sizes step, requests "
+        "every route in detection/urls.py and records wall time and SQL query count per view. "
+        "Fails when a view regresses against the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                            help="Dataset sizes to run, e.g. --sizes 10000 100000 1000000")
+        parser.add_argument('--repeat', type=int, default=3, help="Requests per view; the median is kept.")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="Write these results as the new baseline instead of comparing.")
+        parser.add_argument('--time-tolerance', type=float, default=0.5,
+                            help="Allowed slowdown as a fraction of the baseline (default 0.5 = +50%%).")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Keep the seeded test database so the next run skips seeding.")
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options['baseline'])
+        baseline = {}
+        if baseline_path.exists() and not options['save_baseline']:
+            baseline = json.loads(baseline_path.read_text())
+
+        # Every alias gets a test database; the replica mirrors the primary so
+        # routed reads see the seeded rows instead of an empty database.
+        for alias in connections:
+            if alias != DEFAULT_DB_ALIAS:
+                connections[alias].settings_dict['TEST']['MIRROR'] = DEFAULT_DB_ALIAS
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'], aliases=set(connections))
+        results = {}
+        try:
+            for size in sorted(options['sizes']):
+                self.stderr.write(f"Seeding {size} rows on {connection.vendor}...")
+                benchmarks.seed(size, stdout=self.stderr)
+                results[str(size)] = benchmarks.measure_routes(repeat=options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+        regressions = []
+        for size, views in results.items():
+            self.stdout.write(f"\n{size} rows")
+            self.stdout.write(f"  {'view':<28}{'ms':>10}{'queries':>9}{'status':>8}   baseline")
+            for name, r in views.items():
+                before = baseline.get(size, {}).get(name)
+                note = f"{before['ms']}ms / {before['queries']}q" if before else "-"
+                self.stdout.write(f"  {name:<28}{r['ms']:>10}{r['queries']:>9}{r['status']:>8}   {note}")
+            regressions += [
+                f"[{size}] {line}"
+                for line in benchmarks.compare(views, baseline.get(size, {}), options['time_tolerance'])
+            ]
+
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"\nBaseline written to {baseline_path}"))
+            return
+
+        if not baseline:
+            self.stdout.write(f"\nNo baseline at {baseline_path}; run with --save-baseline to create one.")
+        elif regressions:
+            raise CommandError("View regressions:\n  " + "\n  ".join(regressions))
+        else:
+            self.stdout.write(self.style.SUCCESS("\nNo regressions against baseline."))
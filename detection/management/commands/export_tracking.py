@@ -0,0 +1,57 @@
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from detection import exports
+
+
+def _time(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date/time {value!r}")
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+class Command(BaseCommand):
+    help = "Streams ToolEventTracking (events) or ToolsTracking (detections) rows to a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exports.DATASETS))
+        parser.add_argument('-o', '--output', default='-', help="File to write (default: stdout).")
+        parser.add_argument('--format', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Gzip the output.")
+        parser.add_argument('--start', help="Only rows at or after this date/time (ISO 8601).")
+        parser.add_argument('--end', help="Only rows before this date/time (ISO 8601).")
+        parser.add_argument('--device-id')
+        parser.add_argument('--tool-name')
+        parser.add_argument('--tool-id')
+        parser.add_argument('--user-id')
+        parser.add_argument('--event')
+
+    def handle(self, *args, **options):
+        dataset = options['dataset']
+        allowed = exports.DATASETS[dataset][2]
+        filters = {name: options[name] for name in allowed if options.get(name)}
+        unused = [name for name in ('device_id', 'tool_name', 'tool_id', 'user_id', 'event')
+                  if options.get(name) and name not in allowed]
+        if unused:
+            raise CommandError(f"{dataset} cannot be filtered by {', '.join(unused)}")
+
+        rows = exports.queryset(dataset, _time(options['start']), _time(options['end']), **filters)
+        out = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for block in exports.stream(dataset, rows, options['format'], options['gzip']):
+                out.write(block)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+            else:
+                out.flush()
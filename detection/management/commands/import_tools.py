@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from detection import catalog_import
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports tools and purchases from a CSV or XLSX file, streaming it in chunks. "
+        "Columns: " + ", ".join(catalog_import.COLUMNS) + "."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=catalog_import.CHUNK_ROWS,
+                            help="Rows validated and written per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only; write nothing.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, 'rb') as fileobj:
+                summary = catalog_import.import_file(fileobj, path, options['chunk_size'], options['dry_run'])
+        except OSError as e:
+            raise CommandError(str(e))
+        except catalog_import.ImportFileError as e:
+            raise CommandError(str(e))
+
+        for error in summary['errors']:
+            self.stderr.write(f"row {error['row']}: {error['detail']}")
+        if summary['rejected'] > len(summary['errors']):
+            self.stderr.write(f"... {summary['rejected'] - len(summary['errors'])} more rejected rows not shown")
+
+        self.stdout.write(
+            f"{'Validated' if options['dry_run'] else 'Imported'} {summary['rows']} rows, "
+            f"rejected {summary['rejected']}; tools +{summary['tools_created']} "
+            f"~{summary['tools_updated']}, purchases +{summary['purchases']}, "
+            f"inventory ~{summary['inventory_updated']} +{summary['inventory_created']}"
+        )
+        if 'aborted' in summary:
+            raise CommandError(f"Stopped early: {summary['aborted']}")
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from detection.projector import BATCH_SIZE, project_pending
+
+
+class Command(BaseCommand):
+    help = "Applies new ToolEventTracking events to Inventory from the projector checkpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep running, polling for new events.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            result = project_pending(batch_size=options['batch_size'])
+            if result['events'] or not options['loop']:
+                self.stdout.write(
+                    f"Projected {result['events']} events ({result['applied']} applied, "
+                    f"{result['skipped']} skipped, {result['tools']} tools) -> checkpoint {result['checkpoint']}"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
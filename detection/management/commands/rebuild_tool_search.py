@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from detection import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Recreates the tool search index (SQLite FTS5 table and sync triggers, or the PostgreSQL "
+        "trigram index) and reindexes every tool. Run after migrations that alter ToolCreation."
+    )
+
+    def handle(self, *args, **options):
+        if search.install(connection):
+            self.stdout.write(self.style.SUCCESS(f"Tool search index rebuilt on {connection.vendor}"))
+        else:
+            self.stdout.write(f"No search index for {connection.vendor}; searches use icontains filters.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from detection.usage import rebuild_sessions
+
+
+class Command(BaseCommand):
+    help = "Rebuilds ToolUsageSession from ToolEventTracking history in one ordered pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        written = rebuild_sessions(chunk_size=options['chunk_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} usage sessions"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from detection.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recomputes the tool activity counters from ToolEventTracking. Run periodically (e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help="How many recent days of daily counts to rebuild (default: 2).")
+        parser.add_argument('--full', action='store_true', help="Rebuild daily counts for all history.")
+
+    def handle(self, *args, **options):
+        gauges = reconcile(days=None if options['full'] else options['days'])
+        summary = ", ".join(f"{name}={value}" for name, value in gauges.items())
+        self.stdout.write(self.style.SUCCESS(f"Activity stats reconciled ({summary})"))
@@ -0,0 +1,212 @@
+"""
+In-process metrics rendered in the Prometheus text format by views.metrics.
+
+Writers never take a lock: every thread increments its own shard, and a
+scrape merges the shards. Shards of threads that have exited (runserver
+starts one per request) are folded into a single retired shard at scrape
+time so they do not pile up. Counters and histograms are per process; with
+several workers, scrape each one or aggregate in Prometheus.
+
+device_id labels come from clients, so only METRICS_DEVICE_IDS (when set) or
+the first METRICS_MAX_DEVICES ids seen get their own series; the rest are
+counted under device_id="other".
+"""
+import bisect
+import math
+import threading
+import time
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+ALLOWED_DEVICES = getattr(settings, 'METRICS_DEVICE_IDS', None)
+MAX_DEVICES = getattr(settings, 'METRICS_MAX_DEVICES', 100)
+OTHER_DEVICE = 'other'
+
+# name: (type, help, buckets)
+METRICS = {
+    'fod_http_requests_total': ('counter', "HTTP requests by view, method and status.", None),
+    'fod_http_request_duration_seconds': ('histogram', "View latency by view and method.", LATENCY_BUCKETS),
+    'fod_detection_frames_total': ('counter', "Detection frames with at least one detection written, by device.", None),
+    'fod_detections_total': ('counter', "Detections written, by device.", None),
+    'fod_detection_confidence': ('histogram', "Confidence of written detections.", CONFIDENCE_BUCKETS),
+    'fod_detection_lag_seconds': ('histogram', "Frame timestamp to database write, by device.", LAG_BUCKETS),
+    'fod_detection_last_write_timestamp_seconds': ('gauge', "Unix time of the last write per device.", None),
+    'fod_detection_write_seconds': ('histogram', "Time to commit one detection batch.", LATENCY_BUCKETS),
+    'fod_tool_events_total': ('counter', "ToolEventTracking rows created, by event type.", None),
+}
+
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in list(other.histograms.items()):
+            mine = self.histograms.setdefault(key, [0] * len(values))
+            for i, v in enumerate(values):
+                mine[i] += v
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = {}  # thread -> _Shard
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+        self.gauges = {}
+        self.devices = set(ALLOWED_DEVICES or ())
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:  # once per thread
+                self._shards[threading.current_thread()] = shard
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        """Histogram slots are [bucket counts..., +Inf count, sum]."""
+        histograms = self._shard().histograms
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        slots = histograms.get(key)
+        if slots is None:
+            slots = histograms[key] = [0] * (len(buckets) + 2)
+        slots[bisect.bisect_left(buckets, value)] += 1
+        slots[-1] += value
+
+    def device_label(self, device_id):
+        """``device_id`` if it has (or may take) a series of its own, else OTHER_DEVICE."""
+        if device_id in self.devices:
+            return device_id
+        if ALLOWED_DEVICES is not None:
+            return OTHER_DEVICE
+        with self._lock:
+            if len(self.devices) < MAX_DEVICES:
+                self.devices.add(device_id)
+                return device_id
+        return OTHER_DEVICE
+
+    def set_gauge(self, name, value, labels=()):
+        self.gauges[(name, labels)] = value
+
+    def collect(self):
+        """Returns one merged _Shard covering every thread so far."""
+        merged = _Shard()
+        with self._lock:
+            for thread, shard in list(self._shards.items()):
+                if not thread.is_alive():
+                    # Its owner is gone, so nothing else can write to it.
+                    self._retired.merge(shard)
+                    del self._shards[thread]
+                else:
+                    merged.merge(shard)
+            merged.merge(self._retired)
+        return merged
+
+    def clear(self):
+        with self._lock:
+            self._shards.clear()
+            self._retired = _Shard()
+            self.gauges.clear()
+            self.devices = set(ALLOWED_DEVICES or ())
+        self._local = threading.local()
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs, extra=None):
+    pairs = list(pairs) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def render(extra=None):
+    """
+    Prometheus text exposition of everything recorded so far. ``extra`` is
+    {name: (type, help, value)} for unlabelled values read at scrape time.
+    """
+    data = registry.collect()
+    series = {}
+    for (name, labels), value in data.counters.items():
+        series.setdefault(name, []).append((labels, value))
+    for (name, labels), value in data.histograms.items():
+        series.setdefault(name, []).append((labels, value))
+    for (name, labels), value in list(registry.gauges.items()):
+        series.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(series.get(name, ()), key=lambda s: s[0]):
+            if kind != 'histogram':
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (math.inf,), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, ('le', _number(float(bound))))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(float(value[-1]))}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    for name, (kind, help_text, value) in (extra or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- hooks -------------------------------------------------------------
+
+def record_request(view, method, status, seconds):
+    registry.inc('fod_http_requests_total', (('view', view), ('method', method), ('status', status)))
+    registry.observe('fod_http_request_duration_seconds', seconds, (('view', view), ('method', method)))
+
+
+def record_detection_write(rows, seconds):
+    """Called by ingest.save_rows after a successful commit."""
+    now = time.time()
+    registry.observe('fod_detection_write_seconds', seconds)
+    frames = set()
+    for row in rows:
+        labels = (('device_id', registry.device_label(row.device_id)),)
+        registry.inc('fod_detections_total', labels)
+        registry.observe('fod_detection_confidence', row.confidence)
+        frames.add((row.device_id, row.frame_id, row.timestamp))
+    for device_id, _, timestamp in frames:
+        labels = (('device_id', registry.device_label(device_id)),)
+        registry.inc('fod_detection_frames_total', labels)
+        registry.observe('fod_detection_lag_seconds', max(now - timestamp.timestamp(), 0.0), labels)
+        registry.set_gauge('fod_detection_last_write_timestamp_seconds', now, labels)
+
+
+def record_event(event):
+    registry.inc('fod_tool_events_total', (('event', event),))
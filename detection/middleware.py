@@ -0,0 +1,231 @@
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import db_router, metrics
+
+N_PLUS_ONE_THRESHOLD = getattr(settings, 'SQL_INSPECTOR_N_PLUS_ONE_THRESHOLD', 5)
+REPORT_SIZE = getattr(settings, 'SQL_INSPECTOR_REPORT_SIZE', 200)
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:%s|\?|'[^']*'|-?\d+(?:\.\d+)?)\s*,?)+\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """Reduces a statement to its shape: literals become ?, IN lists collapse."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+class _QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.shape_seconds = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            shape = normalize_sql(sql)
+            self.count += 1
+            self.seconds += elapsed
+            self.shapes[shape] += 1
+            self.shape_seconds[shape] += elapsed
+
+
+def _recording(recorder):
+    """
+    Passes every query on this thread's connections through ``recorder``
+    until the returned ExitStack is closed.
+    """
+    stack = ExitStack()
+    for conn in connections.all(initialized_only=False):
+        stack.enter_context(conn.execute_wrapper(recorder))
+    return stack
+
+
+class SQLReport:
+    """Rolling, process-local record of recent requests and per-view totals."""
+
+    def __init__(self, size=REPORT_SIZE):
+        self.recent = deque(maxlen=size)
+        self.views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        with self._lock:
+            self.recent.appendleft(entry)
+            view = self.views.setdefault(entry['view'], {
+                'view': entry['view'], 'requests': 0, 'queries': 0, 'sql_ms': 0.0,
+                'max_queries': 0, 'n_plus_one': 0,
+            })
+            view['requests'] += 1
+            view['queries'] += entry['queries']
+            view['sql_ms'] += entry['sql_ms']
+            view['max_queries'] = max(view['max_queries'], entry['queries'])
+            view['n_plus_one'] += 1 if entry['n_plus_one'] else 0
+
+    def snapshot(self):
+        with self._lock:
+            views = sorted(
+                ({**v, 'avg_queries': round(v['queries'] / v['requests'], 1),
+                  'avg_sql_ms': round(v['sql_ms'] / v['requests'], 2)} for v in self.views.values()),
+                key=lambda v: v['queries'], reverse=True,
+            )
+            return {'views': views, 'recent': list(self.recent)}
+
+    def clear(self):
+        with self._lock:
+            self.recent.clear()
+            self.views.clear()
+
+
+report = SQLReport()
+
+
+class SQLInspectorMiddleware:
+    """
+    Opt-in (SQL_INSPECTOR_ENABLED = True, or the SQL_INSPECTOR=1 environment
+    variable) per-request SQL instrumentation that works with DEBUG off.
+
+    Adds X-SQL-Queries, X-SQL-Time-ms and, when a normalized statement repeats
+    more than SQL_INSPECTOR_N_PLUS_ONE_THRESHOLD times, X-SQL-N-Plus-One
+    headers. Each request is also added to the rolling report served by
+    views.sql_report. Runs natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_INSPECTOR_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = _QueryRecorder()
+        with _recording(recorder):
+            response = self.get_response(request)
+        return self._finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        recorder = _QueryRecorder()
+        # Connections are per thread; the ORM runs in sync_to_async's thread
+        recording = await sync_to_async(_recording)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        return self._finish(request, response, recorder)
+
+    def _finish(self, request, response, recorder):
+        repeated = [
+            {'sql': shape, 'count': count, 'ms': round(recorder.shape_seconds[shape] * 1000, 2)}
+            for shape, count in recorder.shapes.most_common()
+            if count > N_PLUS_ONE_THRESHOLD
+        ]
+        sql_ms = round(recorder.seconds * 1000, 2)
+        match = getattr(request, 'resolver_match', None)
+
+        response['X-SQL-Queries'] = str(recorder.count)
+        response['X-SQL-Time-ms'] = str(sql_ms)
+        if repeated:
+            response['X-SQL-N-Plus-One'] = "; ".join(f"{r['count']}x {r['sql'][:120]}" for r in repeated[:3])
+
+        report.add({
+            'view': match.view_name if match else request.path,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'sql_ms': sql_ms,
+            'n_plus_one': repeated,
+        })
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Records per-view latency and status counts for /metrics. Requests that
+    match no route are grouped under "unmatched" to keep label sets bounded.
+    Runs natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, started)
+        return response
+
+    def _record(self, request, response, started):
+        match = getattr(request, 'resolver_match', None)
+        metrics.record_request(
+            match.view_name if match else 'unmatched', request.method,
+            response.status_code, time.perf_counter() - started,
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Tracks writes for detection/db_router.py. Sits after SessionMiddleware so
+    that saving the session does not count as a write. Under ASGI the routing
+    state is set in the request's own context, which the sync views and ORM
+    calls below inherit.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with db_router.request_routing(sticky=db_router.is_sticky(request)) as state:
+            response = self.get_response(request)
+        if state.wrote:
+            db_router.set_sticky(response)
+        return response
+
+    async def __acall__(self, request):
+        with db_router.request_routing(sticky=db_router.is_sticky(request)) as state:
+            response = await self.get_response(request)
+        if state.wrote:
+            db_router.set_sticky(response)
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0006_delete_toolevent_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ToolUsageSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('user_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('tool_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('tool_name', models.CharField(blank=True, max_length=200, null=True)),
+                ('issued_at', models.DateTimeField()),
+                ('returned_at', models.DateTimeField(blank=True, null=True)),
+                ('duration', models.DurationField(blank=True, null=True)),
+                ('issued_event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='usage_session', to='detection.tooleventtracking')),
+                ('returned_event', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='closed_session', to='detection.tooleventtracking')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='toolusagesession',
+            index=models.Index(fields=['returned_at', 'issued_at'], name='usage_returned_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='toolusagesession',
+            index=models.Index(condition=models.Q(('returned_at__isnull', True)), fields=['user_id', 'tool_id', 'issued_at'], name='usage_open_idx'),
+        ),
+    ]
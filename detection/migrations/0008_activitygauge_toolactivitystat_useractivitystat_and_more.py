@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0007_toolusagesession_delete_toolevent_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityGauge',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ToolActivityStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tool_id', models.CharField(max_length=50, unique=True)),
+                ('tool_name', models.CharField(blank=True, max_length=200, null=True)),
+                ('in_use', models.IntegerField(default=0)),
+                ('issued', models.BigIntegerField(default=0)),
+                ('returned', models.BigIntegerField(default=0)),
+                ('damaged', models.BigIntegerField(default=0)),
+                ('last_event_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserActivityStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=50, unique=True)),
+                ('user_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('in_use', models.IntegerField(default=0)),
+                ('issued', models.BigIntegerField(default=0)),
+                ('returned', models.BigIntegerField(default=0)),
+                ('damaged', models.BigIntegerField(default=0)),
+                ('last_event_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyEventCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('event', models.CharField(max_length=50)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'event'), name='daily_event_count_unique')],
+            },
+        ),
+    ]
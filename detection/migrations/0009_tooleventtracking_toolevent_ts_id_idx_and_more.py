@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0008_activitygauge_toolactivitystat_useractivitystat_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tooleventtracking',
+            index=models.Index(fields=['timestamp', 'id'], name='toolevent_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='toolstracking',
+            index=models.Index(fields=['timestamp', 'id'], name='toolstracking_ts_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0009_tooleventtracking_toolevent_ts_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventory',
+            name='last_updated',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:37
+
+from django.db import migrations, models
+
+
+def start_at_current_event(apps, schema_editor):
+    # Existing Inventory already reflects past events; only project new ones.
+    ToolEventTracking = apps.get_model('detection', 'ToolEventTracking')
+    ProjectorCheckpoint = apps.get_model('detection', 'ProjectorCheckpoint')
+    db = schema_editor.connection.alias
+    last = ToolEventTracking.objects.using(db).order_by('-id').values_list('id', flat=True).first()
+    ProjectorCheckpoint.objects.using(db).update_or_create(name='inventory', defaults={'last_event_id': last or 0})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0010_alter_inventory_last_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectorCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(start_at_current_event, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:43
+
+from django.db import migrations, models
+
+
+def _names(value):
+    return [n.strip() for n in (value or "").split(",") if n.strip()]
+
+
+def scope_from_display_names(apps, schema_editor):
+    # Only the display strings were ever persisted, so match on names.
+    UserProfile = apps.get_model('detection', 'UserProfile')
+    ServiceStation = apps.get_model('detection', 'ServiceStation')
+    Unit = apps.get_model('detection', 'Unit')
+    Tray = apps.get_model('detection', 'Tray')
+    db = schema_editor.connection.alias
+    for profile in UserProfile.objects.using(db).exclude(role='Admin'):
+        profile.stations.set(ServiceStation.objects.using(db).filter(name__in=_names(profile.stations_display)))
+        if profile.role == 'Mechanic':
+            profile.units.set(Unit.objects.using(db).filter(name__in=_names(profile.units_display)))
+            profile.trays.set(Tray.objects.using(db).filter(tray_name__in=_names(profile.trays_display)))
+
+
+def display_names_from_scope(apps, schema_editor):
+    UserProfile = apps.get_model('detection', 'UserProfile')
+    for profile in UserProfile.objects.using(schema_editor.connection.alias).prefetch_related('stations', 'units', 'trays'):
+        profile.stations_display = ", ".join(s.name for s in profile.stations.all()) or None
+        profile.units_display = ", ".join(u.name for u in profile.units.all()) or None
+        profile.trays_display = ", ".join(t.tray_name for t in profile.trays.all()) or None
+        profile.save(update_fields=['stations_display', 'units_display', 'trays_display'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0011_projectorcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='stations',
+            field=models.ManyToManyField(blank=True, related_name='scoped_profiles', to='detection.servicestation'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='trays',
+            field=models.ManyToManyField(blank=True, related_name='scoped_profiles', to='detection.tray'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='units',
+            field=models.ManyToManyField(blank=True, related_name='scoped_profiles', to='detection.unit'),
+        ),
+        migrations.RunPython(scope_from_display_names, display_names_from_scope),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='stations_display',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='trays_display',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='units_display',
+        ),
+    ]
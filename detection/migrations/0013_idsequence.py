@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:45
+
+import re
+
+from django.db import migrations, models
+
+# model, field, prefix; frozen copy of detection.ids.SEQUENCES
+SEQUENCES = [
+    ('Inventory', 'inventory_id', 'INV'),
+    ('ServiceStation', 'station_id', 'SS'),
+    ('Unit', 'unit_id', 'U'),
+    ('Tray', 'tray_id', 'T'),
+]
+
+
+def repair_ids(apps, schema_editor):
+    """
+    Starts each counter after the numerically largest existing id (the old
+    code compared strings, so INV999 beat INV1000) and gives rows whose id
+    is blank or malformed a fresh one. Inventory ids are primary keys that
+    TrayTool points at, so those are only counted, never rewritten.
+    """
+    IdSequence = apps.get_model('detection', 'IdSequence')
+    db = schema_editor.connection.alias
+    for model_name, field, prefix in SEQUENCES:
+        model = apps.get_model('detection', model_name)
+        pattern = re.compile(rf"{re.escape(prefix)}(\d+)")
+        highest, broken = 0, []
+        for pk, value in model.objects.using(db).values_list('pk', field).order_by('pk'):
+            match = pattern.fullmatch(value or "")
+            if match:
+                highest = max(highest, int(match.group(1)))
+            else:
+                broken.append(pk)
+        if model_name != 'Inventory':
+            for pk in broken:
+                highest += 1
+                model.objects.using(db).filter(pk=pk).update(**{field: f"{prefix}{highest:03d}"})
+        IdSequence.objects.using(db).update_or_create(
+            name=f"detection.{model_name.lower()}", defaults={'next_value': highest + 1},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0012_userprofile_scope'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(repair_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:50
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from detection import search
+    search.install(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    from detection import search
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0013_idsequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0014_tool_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionDayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('device_id', models.CharField(max_length=100)),
+                ('tool_name', models.CharField(max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0)),
+                ('confidence_min', models.FloatField()),
+                ('confidence_max', models.FloatField()),
+            ],
+            options={
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'device_id', 'tool_name'), name='detectiondayrollup_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DetectionHourRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('device_id', models.CharField(max_length=100)),
+                ('tool_name', models.CharField(max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0)),
+                ('confidence_min', models.FloatField()),
+                ('confidence_max', models.FloatField()),
+            ],
+            options={
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'device_id', 'tool_name'), name='detectionhourrollup_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DetectionMinuteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('device_id', models.CharField(max_length=100)),
+                ('tool_name', models.CharField(max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0)),
+                ('confidence_min', models.FloatField()),
+                ('confidence_max', models.FloatField()),
+            ],
+            options={
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'device_id', 'tool_name'), name='detectionminuterollup_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0015_detection_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectorcheckpoint',
+            name='gaps',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
+from . import ids
+
 class ToolCreation(models.Model):
     tool_id = models.CharField(max_length=50, unique=True)
     tool_name = models.CharField(max_length=200)
@@ -38,18 +40,16 @@ class Inventory(models.Model):
     available_quantity = models.PositiveIntegerField(default=0)
     in_use = models.PositiveIntegerField(default=0)
     damaged = models.PositiveIntegerField(default=0)
-    last_updated = models.DateTimeField(auto_now=True)
+    # Indexed: the inventory change feed uses it as its cursor. Bulk
+    # .update() calls must set it explicitly (auto_now only fires on save()).
+    last_updated = models.DateTimeField(auto_now=True, db_index=True)
     remarks = models.TextField(blank=True, null=True)
 
     def save(self, *args, **kwargs):
         if not self.inventory_id:
-            last = Inventory.objects.order_by('-inventory_id').first()
-            if last:
-                # Extract numeric part safely from something like "INV005"
-                last_num = int(last.inventory_id.replace('INV', ''))
-                self.inventory_id = f"INV{last_num + 1:03d}"
-            else:
-                self.inventory_id = "INV001"
+            ids.assign([self])
+            # A freshly allocated primary key cannot exist yet; skip the UPDATE attempt
+            kwargs.setdefault('force_insert', True)
         super().save(*args, **kwargs)
 
 class ServiceStation(models.Model):
@@ -63,10 +63,7 @@ class ServiceStation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
-        if not self.station_id:
-            last = ServiceStation.objects.order_by('-id').first()
-            next_id = 1 if not last else last.id + 1
-            self.station_id = f"SS{next_id:03d}"
+        ids.assign([self])
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -83,10 +80,7 @@ class Unit(models.Model):
     remarks = models.TextField(blank=True, null=True)
 
     def save(self, *args, **kwargs):
-        if not self.unit_id:
-            last = Unit.objects.order_by('-id').first()
-            next_id = 1 if not last else last.id + 1
-            self.unit_id = f"U{next_id:03d}"
+        ids.assign([self])
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -101,10 +95,7 @@ class Tray(models.Model):
     remarks = models.TextField(blank=True, null=True)
 
     def save(self, *args, **kwargs):
-        if not self.tray_id:
-            last = Tray.objects.order_by('-id').first()
-            next_id = 1 if not last else last.id + 1
-            self.tray_id = f"T{next_id:03d}"
+        ids.assign([self])
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -132,10 +123,11 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, null=True, blank=True)
 
-    # Only store readable names
-    stations_display = models.CharField(max_length=255, null=True, blank=True)
-    units_display = models.CharField(max_length=255, null=True, blank=True)
-    trays_display = models.CharField(max_length=255, null=True, blank=True)
+    # Access scope, see detection/scope.py. Admins need no rows here and a
+    # Supervisor only stores stations: their units and trays are derived.
+    stations = models.ManyToManyField(ServiceStation, blank=True, related_name='scoped_profiles')
+    units = models.ManyToManyField(Unit, blank=True, related_name='scoped_profiles')
+    trays = models.ManyToManyField(Tray, blank=True, related_name='scoped_profiles')
 
     def __str__(self):
         return f"{self.user.username} - {self.role}"
@@ -163,6 +155,18 @@ class ToolEventTracking(models.Model):
     tool_name = models.CharField(max_length=200, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination key (see detection/pagination.py)
+            models.Index(fields=['timestamp', 'id'], name='toolevent_ts_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # One transaction with the usage/activity updates post_save makes, so
+        # stats.reconcile() never sees the event without its counter changes.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.event} - {self.tool_name or self.tool_id}"
 
@@ -174,5 +178,141 @@ class ToolsTracking(models.Model):
     frame_id = models.CharField(max_length=100, blank=True, null=True)
     meta = models.JSONField(default=dict, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='toolstracking_ts_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.device_id} - {self.tool_name} ({self.confidence:.2f})"
+
+class ToolUsageSession(models.Model):
+    """
+    One issue → return cycle of a tool by a user, kept up to date from
+    ToolEventTracking (see detection/usage.py). Open sessions have no
+    returned_at.
+    """
+    user_id = models.CharField(max_length=50, null=True, blank=True)
+    user_name = models.CharField(max_length=100, null=True, blank=True)
+    tool_id = models.CharField(max_length=50, null=True, blank=True)
+    tool_name = models.CharField(max_length=200, null=True, blank=True)
+    issued_event = models.OneToOneField(
+        ToolEventTracking, on_delete=models.CASCADE, related_name='usage_session'
+    )
+    returned_event = models.OneToOneField(
+        ToolEventTracking, on_delete=models.SET_NULL, null=True, blank=True, related_name='closed_session'
+    )
+    issued_at = models.DateTimeField()
+    returned_at = models.DateTimeField(null=True, blank=True)
+    duration = models.DurationField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['returned_at', 'issued_at'], name='usage_returned_issued_idx'),
+            models.Index(
+                fields=['user_id', 'tool_id', 'issued_at'], name='usage_open_idx',
+                condition=models.Q(returned_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_name} - {self.tool_name} ({self.issued_at:%Y-%m-%d %H:%M})"
+
+# Materialized activity counters, maintained by detection/stats.py and
+# reconciled by the reconcile_activity_stats command.
+class DailyEventCount(models.Model):
+    day = models.DateField()
+    event = models.CharField(max_length=50)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'event'], name='daily_event_count_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.event}: {self.count}"
+
+class ToolActivityStat(models.Model):
+    tool_id = models.CharField(max_length=50, unique=True)
+    tool_name = models.CharField(max_length=200, null=True, blank=True)
+    in_use = models.IntegerField(default=0)
+    issued = models.BigIntegerField(default=0)
+    returned = models.BigIntegerField(default=0)
+    damaged = models.BigIntegerField(default=0)
+    last_event_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.tool_id} (in use: {self.in_use})"
+
+class UserActivityStat(models.Model):
+    user_id = models.CharField(max_length=50, unique=True)
+    user_name = models.CharField(max_length=100, null=True, blank=True)
+    in_use = models.IntegerField(default=0)
+    issued = models.BigIntegerField(default=0)
+    returned = models.BigIntegerField(default=0)
+    damaged = models.BigIntegerField(default=0)
+    last_event_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user_id} (in use: {self.in_use})"
+
+class ActivityGauge(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class ProjectorCheckpoint(models.Model):
+    """High-water mark (last applied ToolEventTracking id) of an event projector."""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_event_id = models.BigIntegerField(default=0)
+    # [first id, last id, unix time noticed] ranges below last_event_id that
+    # held no event when the checkpoint passed them; re-checked until they expire
+    gaps = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_event_id}"
+
+class IdSequence(models.Model):
+    """Counter behind the business ids handed out by detection/ids.py."""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name} -> {self.next_value}"
+
+# Detection rollups per device and tool, maintained by detection/rollups.py
+# and rebuilt by the backfill_detection_rollups command.
+class DetectionRollup(models.Model):
+    bucket = models.DateTimeField()  # start of the minute / hour / day
+    device_id = models.CharField(max_length=100)
+    tool_name = models.CharField(max_length=100)
+    count = models.BigIntegerField(default=0)
+    confidence_sum = models.FloatField(default=0)
+    confidence_min = models.FloatField()
+    confidence_max = models.FloatField()
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'device_id', 'tool_name'], name='%(class)s_unique'),
+        ]
+
+    @property
+    def confidence_mean(self):
+        return self.confidence_sum / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.bucket:%Y-%m-%d %H:%M} {self.device_id} {self.tool_name}: {self.count}"
+
+class DetectionMinuteRollup(DetectionRollup):
+    pass
+
+class DetectionHourRollup(DetectionRollup):
+    pass
+
+class DetectionDayRollup(DetectionRollup):
+    pass
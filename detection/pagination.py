@@ -0,0 +1,99 @@
+import base64
+from dataclasses import dataclass, field
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj, direction):
+    raw = f"{direction}|{obj.timestamp.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, timestamp, pk = base64.urlsafe_b64decode(padded).decode().split("|")
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if direction not in ("next", "prev") or timestamp is None:
+        raise InvalidCursor(cursor)
+    return direction, timestamp, pk
+
+
+@dataclass
+class KeysetPage:
+    object_list: list = field(default_factory=list)
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_page(queryset, cursor=None, per_page=25):
+    """
+    Newest-first page of ``queryset`` keyed on (timestamp, id).
+
+    Each page is a single "WHERE (timestamp, id) < (..) ORDER BY timestamp
+    DESC, id DESC LIMIT n+1" query, so page 10,000 costs the same as page 1
+    and no COUNT(*) is needed. The comparison is spelled out with a plain
+    bound on timestamp as well, which is what lets the (timestamp, id) index
+    start at the cursor instead of scanning up to it. An invalid cursor
+    falls back to the first page.
+    """
+    direction, timestamp, pk = "next", None, None
+    if cursor:
+        try:
+            direction, timestamp, pk = decode_cursor(cursor)
+        except InvalidCursor:
+            cursor = None
+
+    if not cursor:
+        rows = list(queryset.order_by("-timestamp", "-id")[:per_page + 1])
+        has_more, rows = len(rows) > per_page, rows[:per_page]
+        return KeysetPage(
+            object_list=rows,
+            next_cursor=encode_cursor(rows[-1], "next") if has_more else None,
+        )
+
+    if direction == "next":
+        rows = list(
+            queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk), timestamp__lte=timestamp)
+            .order_by("-timestamp", "-id")[:per_page + 1]
+        )
+        has_more, rows = len(rows) > per_page, rows[:per_page]
+        return KeysetPage(
+            object_list=rows,
+            next_cursor=encode_cursor(rows[-1], "next") if has_more else None,
+            previous_cursor=encode_cursor(rows[0], "prev") if rows else None,
+        )
+
+    rows = list(
+        queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk), timestamp__gte=timestamp)
+        .order_by("timestamp", "id")[:per_page + 1]
+    )
+    has_more, rows = len(rows) > per_page, rows[:per_page]
+    rows.reverse()
+    return KeysetPage(
+        object_list=rows,
+        next_cursor=encode_cursor(rows[-1], "next") if rows else None,
+        previous_cursor=encode_cursor(rows[0], "prev") if has_more else None,
+    )
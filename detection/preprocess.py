@@ -0,0 +1,170 @@
+"""
+Frame preprocessing for the ONNX detector, run in a process pool.
+
+Pool workers decode the PNG/JPEG, letterbox it to the model's input size
+and write the normalized float32 CHW tensor straight into a slot of a
+multiprocessing.shared_memory ring; only the slot number and a few numbers
+of geometry cross the process boundary. The inference stage reads the slots
+back as NumPy views (FramePool.tensor) and frees them once the batch is
+stacked.
+
+Pool workers import only this module, so it must not touch Django.
+"""
+import atexit
+import io
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FrameTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # optional: only needed for the 'onnx' inference runner
+    np = Image = None
+
+PAD = 114 / 255
+
+
+class NoFreeSlot(Exception):
+    """Every ring slot is taken by a frame still waiting for inference."""
+
+
+class WorkerCrashed(Exception):
+    """A pool worker died or hung mid-frame; the pool has been restarted."""
+
+
+def letterbox(data, height, width, out):
+    """
+    Decodes ``data`` and writes it, scaled to fit and centred on grey, into
+    ``out`` (a float32 array of shape (3, height, width)) with values in 0..1.
+    Returns (scale, pad_x, pad_y, original_width, original_height).
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        original_width, original_height = image.size
+        scale = min(width / original_width, height / original_height)
+        new_width = max(1, round(original_width * scale))
+        new_height = max(1, round(original_height * scale))
+        # JPEG only: decode straight at 1/2, 1/4 or 1/8 size when that is still big enough
+        image.draft('RGB', (new_width, new_height))
+        pixels = np.asarray(image.convert('RGB').resize((new_width, new_height), Image.BILINEAR))
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Unreadable image: {e}")
+
+    pad_x, pad_y = (width - new_width) // 2, (height - new_height) // 2
+    out.fill(PAD)
+    np.multiply(pixels.transpose(2, 0, 1), np.float32(1 / 255),
+                out=out[:, pad_y:pad_y + new_height, pad_x:pad_x + new_width], casting='unsafe')
+    return scale, pad_x, pad_y, original_width, original_height
+
+
+# --- pool worker side --------------------------------------------------
+
+_attached = {}
+
+
+def _attach(name):
+    block = _attached.get(name)
+    if block is None:
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13; spawned workers share the parent's tracker, which dedupes
+            block = shared_memory.SharedMemory(name=name)
+        _attached[name] = block
+    return block
+
+
+def _letterbox_into_slot(data, name, slot, height, width):
+    block = _attach(name)
+    out = np.ndarray((3, height, width), np.float32, buffer=block.buf, offset=slot * 3 * height * width * 4)
+    return letterbox(data, height, width, out)
+
+
+# --- server side -------------------------------------------------------
+
+class FramePool:
+    """
+    ``workers`` spawned processes plus a shared ring of ``slots`` input
+    tensors. prepare() blocks the calling thread (not the GIL) until its
+    frame is in a slot, or for ``frame_timeout`` seconds at most.
+    """
+
+    def __init__(self, height, width, slots, workers, frame_timeout=None):
+        if np is None:
+            raise RuntimeError("Frame preprocessing needs numpy and Pillow installed")
+        self.height, self.width = height, width
+        self.slot_bytes = 3 * height * width * 4
+        self.block = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        self._free = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+        self.workers = workers
+        self.frame_timeout = frame_timeout
+        self._restart_lock = threading.Lock()
+        self.pool = self._new_pool()
+        atexit.register(self.close)
+
+    def _new_pool(self):
+        # spawn, not fork: the server process has threads and open connections
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def _restart(self, broken, kill=False):
+        """Replaces ``broken`` unless another thread already has; ``kill`` stops its workers first."""
+        with self._restart_lock:
+            if kill:
+                # shutdown() leaves a hung worker running, and writing into
+                # a slot that is about to be handed to another frame
+                for process in list((broken._processes or {}).values()):
+                    process.terminate()
+                    process.join()
+            if self.pool is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._new_pool()
+
+    def prepare(self, data, timeout=None):
+        """Returns (slot, geometry); raises NoFreeSlot, WorkerCrashed or ValueError (bad image)."""
+        try:
+            slot = self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise NoFreeSlot("No free preprocessing slot")
+        pool = self.pool
+        try:
+            future = pool.submit(
+                _letterbox_into_slot, data, self.block.name, slot, self.height, self.width,
+            )
+            geometry = future.result(self.frame_timeout)
+        except FrameTimeout:
+            future.cancel()
+            self._restart(pool, kill=True)
+            self._free.put(slot)
+            raise WorkerCrashed("A preprocessing worker hung; retry")
+        except BrokenProcessPool:
+            # Every frame in flight on that pool fails with it; later ones get a fresh pool
+            self._free.put(slot)
+            self._restart(pool)
+            raise WorkerCrashed("A preprocessing worker died; retry")
+        except BaseException:
+            self._free.put(slot)
+            raise
+        return slot, geometry
+
+    def tensor(self, slot):
+        return np.ndarray((3, self.height, self.width), np.float32, buffer=self.block.buf,
+                          offset=slot * self.slot_bytes)
+
+    def release(self, slot):
+        self._free.put(slot)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        try:
+            self.block.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            self.block.close()
+        except BufferError:
+            pass  # a tensor view is still alive; the mapping goes with the process
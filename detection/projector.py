@@ -0,0 +1,167 @@
+import bisect
+import datetime
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import response_cache
+from .models import Inventory, ProjectorCheckpoint, ToolEventTracking
+
+CHECKPOINT = 'inventory'
+BATCH_SIZE = getattr(settings, 'INVENTORY_PROJECTOR_BATCH_SIZE', 1000)
+# Only events whose row is at least this old are consumed, so an event whose
+# id was allocated before a later one but committed after it is rarely
+# passed over in the first place.
+SETTLE = datetime.timedelta(seconds=getattr(settings, 'INVENTORY_PROJECTOR_SETTLE_SECONDS', 2))
+# Ids the checkpoint passed while they held no event (a commit later than
+# SETTLE, or a rolled-back insert) are looked up again on every batch for
+# this long, then given up on.
+GAP_TIMEOUT = datetime.timedelta(seconds=getattr(settings, 'INVENTORY_PROJECTOR_GAP_TIMEOUT_SECONDS', 3600))
+
+INVENTORY_EVENTS = ('tool_Issued', 'tool_Returned', 'tool_Damaged')
+
+
+def _apply(state, event):
+    """
+    Applies one event to an in-memory copy of the inventory counters, with
+    the same guards inventory_update_api always had. Returns True if applied.
+    """
+    if event == 'tool_Issued' and state['available_quantity'] > 0:
+        state['in_use'] += 1
+        state['available_quantity'] -= 1
+    elif event == 'tool_Returned' and state['in_use'] > 0:
+        state['in_use'] -= 1
+        state['available_quantity'] += 1
+    elif event == 'tool_Damaged' and state['available_quantity'] > 0:
+        state['damaged'] += 1
+        state['available_quantity'] -= 1
+    else:
+        return False
+    return True
+
+
+def _missing(previous, ids, noticed):
+    """[first, last, noticed] ranges of the ids between ``previous`` and each of ``ids`` (ascending)."""
+    ranges = []
+    for i in ids:
+        if i > previous + 1:
+            ranges.append([previous + 1, i - 1, noticed])
+        previous = i
+    return ranges
+
+
+def _without(gaps, found):
+    """``gaps`` with the ``found`` ids (sorted) cut out."""
+    remaining = []
+    for first, last, noticed in gaps:
+        start = first
+        for i in found[bisect.bisect_left(found, first):bisect.bisect_right(found, last)]:
+            if i > start:
+                remaining.append([start, i - 1, noticed])
+            start = i + 1
+        if start <= last:
+            remaining.append([start, last, noticed])
+    return remaining
+
+
+def project_batch(batch_size=BATCH_SIZE, settle=SETTLE):
+    """
+    Consumes the next batch of events after the checkpoint, plus any that
+    have since turned up in the checkpoint's gaps, and applies them.
+
+    Everything happens in one transaction: the checkpoint row is locked
+    first (so concurrent projectors queue up instead of double-applying), the
+    affected Inventory rows are locked in one query, the net change per tool
+    is applied with a single UPDATE each, and the checkpoint moves forward.
+    A crash anywhere rolls the whole batch back. Each event is applied once;
+    one that commits more than GAP_TIMEOUT after the checkpoint passed its
+    id is never applied. Returns a summary dict.
+    """
+    with transaction.atomic():
+        checkpoint, _ = ProjectorCheckpoint.objects.select_for_update().get_or_create(name=CHECKPOINT)
+
+        now = timezone.now()
+        gaps = [g for g in checkpoint.gaps if g[2] > (now - GAP_TIMEOUT).timestamp()]
+        late = []
+        if gaps:
+            in_gap = Q()
+            for first, last, _ in gaps:
+                in_gap |= Q(id__range=(first, last))
+            late = list(ToolEventTracking.objects.filter(in_gap).order_by('id').values('id', 'event', 'tool_id'))
+            gaps = _without(gaps, [e['id'] for e in late])
+
+        events = ToolEventTracking.objects.filter(id__gt=checkpoint.last_event_id)
+        if settle:
+            events = events.filter(created_at__lte=now - settle)
+        events = list(
+            events.order_by('id').values('id', 'event', 'tool_id')[:batch_size]
+        )
+        if events:
+            # A fresh checkpoint has nothing below the first event to wait for
+            previous = checkpoint.last_event_id or events[0]['id'] - 1
+            gaps += _missing(previous, [e['id'] for e in events], now.timestamp())
+            checkpoint.last_event_id = events[-1]['id']
+        if gaps != checkpoint.gaps:
+            checkpoint.gaps = gaps
+        elif not events:
+            return {'events': 0, 'applied': 0, 'skipped': 0, 'tools': 0,
+                    'checkpoint': checkpoint.last_event_id}
+        # Late events were due before the new ones
+        events = late + events
+
+        tool_ids = {e['tool_id'] for e in events if e['event'] in INVENTORY_EVENTS and e['tool_id']}
+        inventories = OrderedDict()
+        for inv in (Inventory.objects.select_for_update(of=('self',))
+                    .filter(tool__tool_id__in=tool_ids)
+                    .select_related('tool').order_by('inventory_id')):
+            # Same row inventory_update_api picks when a tool has several
+            inventories.setdefault(inv.tool.tool_id, inv)
+
+        fields = ('in_use', 'available_quantity', 'damaged')
+        states = {tool_id: {f: getattr(inv, f) for f in fields} for tool_id, inv in inventories.items()}
+        applied = skipped = 0
+        for e in events:
+            state = states.get(e['tool_id'])
+            if e['event'] not in INVENTORY_EVENTS:
+                continue
+            if state is not None and _apply(state, e['event']):
+                applied += 1
+            else:
+                skipped += 1
+
+        touched = 0
+        for tool_id, state in states.items():
+            inv = inventories[tool_id]
+            deltas = {f: state[f] - getattr(inv, f) for f in fields}
+            if not any(deltas.values()):
+                continue
+            Inventory.objects.filter(pk=inv.pk).update(
+                **{f: F(f) + d for f, d in deltas.items() if d},
+                last_updated=now,
+            )
+            touched += 1
+
+        checkpoint.save(update_fields=['last_event_id', 'gaps', 'updated_at'])
+        if touched:
+            transaction.on_commit(lambda: response_cache.bump('inventory'))
+
+    return {'events': len(events), 'applied': applied, 'skipped': skipped, 'tools': touched,
+            'checkpoint': checkpoint.last_event_id}
+
+
+def project_pending(batch_size=BATCH_SIZE, settle=SETTLE, max_batches=None):
+    """Runs batches until caught up (or ``max_batches``); returns the totals."""
+    totals = {'events': 0, 'applied': 0, 'skipped': 0, 'tools': 0, 'checkpoint': None}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        result = project_batch(batch_size, settle)
+        batches += 1
+        for key in ('events', 'applied', 'skipped', 'tools'):
+            totals[key] += result[key]
+        totals['checkpoint'] = result['checkpoint']
+        if result['events'] < batch_size:
+            break
+    return totals
@@ -0,0 +1,90 @@
+"""
+Whole-response caching for read-mostly pages.
+
+Each cached view names the data groups it renders. A group has a
+generation token in the default cache, which every process shares (see
+CACHES in settings); signals (and the bulk writers that bypass signals)
+bump it, which changes every key built from it, so stale pages are simply
+never looked up again and age out of the LRU backend.
+Entries live in the ``responses`` cache alias (local memory or
+detection.cache_backends.LRUFileBasedCache, see settings).
+
+Pages that embed a CSRF token are stored per CSRF cookie, and never for a
+request without one (its token would belong to a cookie the client has not
+received yet). Both variants are fetched with one get_many call.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+ALIAS = 'responses'
+GROUPS = ('tools', 'inventory', 'stations', 'users')
+
+
+def _gen_key(group):
+    return f'resp-gen:{group}'
+
+
+def generations(groups):
+    keys = [_gen_key(g) for g in groups]
+    found = cache.get_many(keys)
+    missing = {k: uuid.uuid4().hex for k in keys if k not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return ":".join(found[k] for k in keys)
+
+
+def bump(*groups):
+    cache.set_many({_gen_key(g): uuid.uuid4().hex for g in groups}, None)
+
+
+def _key(view_name, request, groups):
+    raw = f"{view_name}|{request.get_full_path()}|{generations(groups)}"
+    return 'resp:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def cached_view(*groups):
+    """Caches 200 GET responses of a view until one of ``groups`` is bumped."""
+    for group in groups:
+        if group not in GROUPS:
+            raise ValueError(f"Unknown cache group {group!r}")
+
+    def decorator(view):
+        view_name = f"{view.__module__}.{view.__qualname__}"
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not getattr(settings, 'RESPONSE_CACHE_ENABLED', True):
+                return view(request, *args, **kwargs)
+
+            store = caches[ALIAS]
+            key = _key(view_name, request, groups)
+            csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+            csrf_key = f"{key}:{hashlib.sha1(csrf_cookie.encode()).hexdigest()}" if csrf_cookie else None
+            hits = store.get_many([key, csrf_key] if csrf_key else [key])
+            response = hits.get(key) or (hits.get(csrf_key) if csrf_key else None)
+            if response is not None:
+                response['X-Response-Cache'] = 'hit'
+                return response
+
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                # The page embeds a CSRF token, which is tied to the cookie
+                if csrf_key:
+                    store.set(csrf_key, response)
+            else:
+                store.set(key, response)
+            response['X-Response-Cache'] = 'miss'
+            return response
+
+        return wrapper
+
+    return decorator
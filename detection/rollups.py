@@ -0,0 +1,259 @@
+"""
+Per device and tool detection counts at minute, hour and day granularity.
+
+ingest.save_rows() folds every batch into all three tables inside its
+transaction (record): the batch is grouped in Python and each table gets one
+multi-row INSERT ... ON CONFLICT DO UPDATE that adds to the counts. backfill()
+rebuilds whole days from ToolsTracking. query() answers a time range from
+the coarsest table whose buckets line up with it.
+
+Buckets start on minute, hour and day boundaries in the current time zone.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Greatest, Least, TruncMinute
+from django.utils import timezone
+
+from .models import DetectionDayRollup, DetectionHourRollup, DetectionMinuteRollup, ToolsTracking
+
+# Finest first
+LEVELS = {
+    'minute': DetectionMinuteRollup,
+    'hour': DetectionHourRollup,
+    'day': DetectionDayRollup,
+}
+STEPS = {
+    'minute': datetime.timedelta(minutes=1),
+    'hour': datetime.timedelta(hours=1),
+    'day': datetime.timedelta(days=1),
+}
+GROUP_FIELDS = ('device_id', 'tool_name')
+# Series longer than this make query() step up to a coarser table
+MAX_POINTS = getattr(settings, 'DETECTION_ROLLUP_MAX_POINTS', 1000)
+UPSERT_BATCH_SIZE = 500
+
+
+def truncate(value, level):
+    """Start of the bucket holding ``value``."""
+    local = timezone.localtime(value)
+    if level == 'day':
+        return timezone.make_aware(datetime.datetime.combine(local.date(), datetime.time.min))
+    local = local.replace(second=0, microsecond=0)
+    if level == 'hour':
+        local = local.replace(minute=0)
+    return local
+
+
+def next_bucket(bucket, level):
+    if level == 'day':
+        day = timezone.localtime(bucket).date() + datetime.timedelta(days=1)
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return bucket + STEPS[level]
+
+
+# --- maintenance -------------------------------------------------------
+
+def _fold(groups, key, count, total, low, high):
+    group = groups.get(key)
+    if group is None:
+        groups[key] = [count, total, low, high]
+    else:
+        group[0] += count
+        group[1] += total
+        group[2] = min(group[2], low)
+        group[3] = max(group[3], high)
+
+
+def _upsert(model, groups):
+    """Adds {(bucket, device_id, tool_name): [count, sum, min, max]} to ``model``'s table."""
+    if not groups:
+        return
+    # Same order in every transaction, so concurrent batches cannot deadlock
+    items = sorted(groups.items())
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for (bucket, device_id, tool_name), (count, total, low, high) in items:
+            lookup = {'bucket': bucket, 'device_id': device_id, 'tool_name': tool_name}
+            updated = model.objects.filter(**lookup).update(
+                count=F('count') + count, confidence_sum=F('confidence_sum') + total,
+                confidence_min=Least('confidence_min', low), confidence_max=Greatest('confidence_max', high),
+            )
+            if not updated:
+                model.objects.create(**lookup, count=count, confidence_sum=total,
+                                     confidence_min=low, confidence_max=high)
+        return
+
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+    columns = ', '.join(qn(c) for c in ('bucket', 'device_id', 'tool_name', 'count',
+                                        'confidence_sum', 'confidence_min', 'confidence_max'))
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[start:start + UPSERT_BATCH_SIZE]
+            params = []
+            for (bucket, device_id, tool_name), (count, total, low, high) in batch:
+                params += [adapt(bucket), device_id, tool_name, count, total, low, high]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES "
+                + ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+                + f" ON CONFLICT ({qn('bucket')}, {qn('device_id')}, {qn('tool_name')}) DO UPDATE SET "
+                f"{qn('count')} = {table}.{qn('count')} + excluded.{qn('count')}, "
+                f"{qn('confidence_sum')} = {table}.{qn('confidence_sum')} + excluded.{qn('confidence_sum')}, "
+                f"{qn('confidence_min')} = {least}({table}.{qn('confidence_min')}, excluded.{qn('confidence_min')}), "
+                f"{qn('confidence_max')} = {greatest}({table}.{qn('confidence_max')}, excluded.{qn('confidence_max')})",
+                params,
+            )
+
+
+def record(rows):
+    """Adds newly written ToolsTracking rows to every rollup. Call inside their transaction."""
+    minutes = {}
+    for row in rows:
+        c = row.confidence
+        _fold(minutes, (truncate(row.timestamp, 'minute'), row.device_id, row.tool_name), 1, c, c, c)
+    _save_levels(minutes)
+
+
+def _save_levels(minutes):
+    """Writes minute groups and the hour and day groups derived from them."""
+    groups = minutes
+    for level, model in LEVELS.items():
+        if level != 'minute':
+            coarser = {}
+            for (bucket, device_id, tool_name), values in groups.items():
+                _fold(coarser, (truncate(bucket, level), device_id, tool_name), *values)
+            groups = coarser
+        _upsert(model, groups)
+
+
+def _lock_detections():
+    """
+    Holds off new ToolsTracking writes (and waits for those in flight) until
+    the transaction ends; reads go on. PostgreSQL only: on SQLite the DELETE
+    that follows already takes the database's single write lock.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {connection.ops.quote_name(ToolsTracking._meta.db_table)} IN SHARE MODE")
+
+
+def backfill(start=None, end=None):
+    """
+    Rebuilds the rollups for the local days from ``start`` up to ``end``
+    (datetimes; default: all of ToolsTracking) one day per transaction.
+    Returns the number of minute buckets written.
+
+    Ingest into ToolsTracking waits while a day is rebuilt, so a batch is
+    either in the rebuilt counts or added on top of them, never lost or
+    counted twice.
+    """
+    if start is None or end is None:
+        bounds = ToolsTracking.objects.aggregate(first=Min('timestamp'), last=Max('timestamp'))
+        if bounds['first'] is None:
+            return 0
+        start = start or bounds['first']
+        end = end or bounds['last']
+    day = truncate(start, 'day')
+    last = truncate(end, 'day')
+    written = 0
+    while day <= last:
+        following = next_bucket(day, 'day')
+        per_minute = (
+            ToolsTracking.objects.filter(timestamp__gte=day, timestamp__lt=following)
+            .annotate(bucket=TruncMinute('timestamp', tzinfo=timezone.get_current_timezone()))
+            .values('bucket', 'device_id', 'tool_name')
+            .annotate(n=Count('id'), total=Sum('confidence'), low=Min('confidence'), high=Max('confidence'))
+            .order_by()
+        )
+        with transaction.atomic():
+            _lock_detections()
+            # Delete before reading, so on SQLite no ingest can commit in between
+            for model in LEVELS.values():
+                model.objects.filter(bucket__gte=day, bucket__lt=following).delete()
+            minutes = {}
+            for row in per_minute:
+                _fold(minutes, (row['bucket'], row['device_id'], row['tool_name']),
+                      row['n'], row['total'], row['low'], row['high'])
+            _save_levels(minutes)
+        written += len(minutes)
+        day = following
+    return written
+
+
+# --- reading -----------------------------------------------------------
+
+def choose_level(start, end, max_points=MAX_POINTS):
+    """
+    The coarsest level whose buckets start and end exactly on ``start`` and
+    ``end``, or a coarser one if that would give more than ``max_points``
+    buckets (the range is then widened to whole buckets).
+    """
+    names = list(LEVELS)
+    level = 'minute'
+    for name in names:
+        if truncate(start, name) == start and truncate(end, name) == end:
+            level = name
+    while (end - start) / STEPS[level] > max_points and level != names[-1]:
+        level = names[names.index(level) + 1]
+    return level
+
+
+def query(start, end, level=None, device_id=None, tool_name=None, group_by=()):
+    """
+    Detection counts and confidence stats between ``start`` and ``end``,
+    per bucket (and per ``group_by`` field). Times are rounded down to the
+    minute; with a coarser ``level`` they are widened to whole buckets.
+    """
+    start, end = truncate(start, 'minute'), truncate(end, 'minute')
+    level = level or choose_level(start, end)
+    exact = truncate(start, level) == start and truncate(end, level) == end
+    start = truncate(start, level)
+    if truncate(end, level) != end:
+        end = next_bucket(truncate(end, level), level)
+
+    rows = LEVELS[level].objects.filter(bucket__gte=start, bucket__lt=end)
+    if device_id:
+        rows = rows.filter(device_id=device_id)
+    if tool_name:
+        rows = rows.filter(tool_name=tool_name)
+    rows = (
+        rows.values('bucket', *group_by)
+        .annotate(n=Sum('count'), total=Sum('confidence_sum'),
+                  low=Min('confidence_min'), high=Max('confidence_max'))
+        .order_by('bucket', *group_by)
+    )
+
+    series = []
+    totals = {'count': 0, 'total': 0.0, 'low': None, 'high': None}
+    for row in rows:
+        series.append({
+            'bucket': row['bucket'],
+            **{field: row[field] for field in group_by},
+            'count': row['n'],
+            'min_confidence': row['low'],
+            'max_confidence': row['high'],
+            'mean_confidence': row['total'] / row['n'] if row['n'] else None,
+        })
+        totals['count'] += row['n']
+        totals['total'] += row['total']
+        totals['low'] = row['low'] if totals['low'] is None else min(totals['low'], row['low'])
+        totals['high'] = row['high'] if totals['high'] is None else max(totals['high'], row['high'])
+
+    return {
+        'interval': level,
+        'start': start,
+        'end': end,
+        'exact': exact,
+        'totals': {
+            'count': totals['count'],
+            'min_confidence': totals['low'],
+            'max_confidence': totals['high'],
+            'mean_confidence': totals['total'] / totals['count'] if totals['count'] else None,
+        },
+        'series': series,
+    }
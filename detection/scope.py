@@ -0,0 +1,93 @@
+"""
+Which trays a user may see.
+
+UserProfile.stations/units/trays hold the scope. It is resolved once per
+session into a list of permitted tray ids, kept in the session next to a
+generation token. The tokens live in the cache: one per user, bumped when
+that user's scope changes, and one shared, bumped when trays or units move
+(signals.py). A session whose token no longer matches resolves again.
+
+With several server processes, point CACHES at a shared backend so an
+invalidation in one process is seen by the others.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Tray, UserProfile
+
+SESSION_KEY = 'tray_scope'
+_ALL_KEY = 'scope-gen:all'
+SCOPED_ROLES = ('Supervisor', 'Mechanic')
+
+
+def _user_key(user_id):
+    return f'scope-gen:{user_id}'
+
+
+def _new_token():
+    return uuid.uuid4().hex
+
+
+def generation(user_id):
+    return f"{cache.get_or_set(_user_key(user_id), _new_token, None)}:{cache.get_or_set(_ALL_KEY, _new_token, None)}"
+
+
+def invalidate_user(user_id):
+    cache.set(_user_key(user_id), _new_token(), None)
+
+
+def invalidate_all():
+    cache.set(_ALL_KEY, _new_token(), None)
+
+
+def resolve_tray_ids(user):
+    """
+    Reads the scope from the database. Returns None for unrestricted users
+    (superusers, Admins, and users without a scoped role), else a sorted
+    list of tray ids; anonymous users get an empty list.
+    """
+    if not user.is_authenticated:
+        return []
+    if user.is_superuser:
+        return None
+    # Always the primary: the result is cached under the current token, and a
+    # lagging replica could pin a stale scope to it.
+    profile = UserProfile.objects.using(DEFAULT_DB_ALIAS).filter(user=user).only('id', 'role').first()
+    if profile is None or profile.role not in SCOPED_ROLES:
+        return None
+    if profile.role == 'Supervisor':
+        trays = Tray.objects.using(DEFAULT_DB_ALIAS).filter(unit__station__scoped_profiles=profile)
+    else:
+        trays = profile.trays.all()
+    return sorted(trays.values_list('id', flat=True))
+
+
+def permitted_tray_ids(request):
+    """Cached resolve_tray_ids() for the request's user; None means all trays."""
+    if hasattr(request, '_tray_scope'):
+        return request._tray_scope
+    user = request.user
+    if not user.is_authenticated:
+        # Logging out must never widen what a scoped user can see
+        request._tray_scope = frozenset()
+        return request._tray_scope
+
+    token = generation(user.pk)
+    cached = request.session.get(SESSION_KEY)
+    if cached and cached.get('gen') == token and cached.get('user') == user.pk:
+        trays = cached['trays']
+    else:
+        trays = resolve_tray_ids(user)
+        request.session[SESSION_KEY] = {'gen': token, 'user': user.pk, 'trays': trays}
+    request._tray_scope = None if trays is None else frozenset(trays)
+    return request._tray_scope
+
+
+def filter_by_scope(request, queryset, tray_field='tray'):
+    """Restricts ``queryset`` to rows whose ``tray_field`` is in the user's scope."""
+    trays = permitted_tray_ids(request)
+    if trays is None:
+        return queryset
+    return queryset.filter(**{f'{tray_field}__in': trays})
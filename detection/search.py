@@ -0,0 +1,149 @@
+"""
+Ranked tool search over ToolCreation (tool_id, tool_name, part_number,
+brand, tool_type).
+
+- SQLite: an FTS5 table, detection_toolsearch, kept in sync with
+  detection_toolcreation by triggers (so bulk_create/bulk_update and raw SQL
+  are covered too). Every query term is a prefix match; ranked by bm25 with
+  tool_name weighted highest.
+- PostgreSQL: a pg_trgm GIN index over the same columns; every term must
+  appear as a substring, ranked by word_similarity. Indexes need no syncing.
+- Anything else falls back to icontains filters.
+
+Both are created by migration 0014. SQLite drops triggers when Django
+rebuilds a table, so run ``manage.py rebuild_tool_search`` after a migration
+that alters ToolCreation.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import ToolCreation
+
+# Most ids a page filters on; keeps the IN list within bound-variable limits
+MAX_RESULTS = getattr(settings, 'TOOL_SEARCH_MAX_RESULTS', 200)
+FTS_TABLE = 'detection_toolsearch'
+FTS_COLUMNS = ('tool_id', 'tool_name', 'part_number', 'brand', 'tool_type')
+# bm25 weights, same order as FTS_COLUMNS
+FTS_WEIGHTS = (4.0, 10.0, 4.0, 1.0, 1.0)
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {', '.join(FTS_COLUMNS)},
+        content='detection_toolcreation', content_rowid='id',
+        prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON detection_toolcreation BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON detection_toolcreation BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON detection_toolcreation BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+]
+SQLITE_DROP = [f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}" for suffix in ('ai', 'ad', 'au')] + [
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+PG_DOCUMENT = " || ' ' || ".join(f"coalesce({c}, '')" for c in FTS_COLUMNS)
+POSTGRES_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS tool_search_trgm_idx ON detection_toolcreation "
+    f"USING gin (lower({PG_DOCUMENT}) gin_trgm_ops)",
+]
+POSTGRES_DROP = ["DROP INDEX IF EXISTS tool_search_trgm_idx"]
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def terms(query):
+    return _TERM.findall((query or "").lower())[:8]
+
+
+def install(conn=connection):
+    """Creates (or repairs) the index for ``conn``'s vendor and reindexes SQLite."""
+    if conn.vendor == 'sqlite':
+        statements = SQLITE_SCHEMA + [f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"]
+    elif conn.vendor == 'postgresql':
+        statements = POSTGRES_SCHEMA
+    else:
+        return False
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+    return True
+
+
+def uninstall(conn=connection):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def _sqlite_ids(words, limit):
+    match = " ".join(f'"{w}"*' for w in words)
+    sql = (f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+           f"ORDER BY bm25({FTS_TABLE}, {', '.join(map(str, FTS_WEIGHTS))})")
+    params = [match]
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _postgres_ids(words, limit):
+    document = f"lower({PG_DOCUMENT})"
+    sql = ("SELECT id FROM detection_toolcreation WHERE "
+           + " AND ".join(f"{document} LIKE %s" for _ in words)
+           + f" ORDER BY word_similarity(%s, {document}) DESC, tool_name")
+    params = [
+        "%" + w.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for w in words
+    ] + [" ".join(words)]
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_ids(words, limit):
+    tools = ToolCreation.objects.all()
+    for w in words:
+        tools = tools.filter(
+            Q(tool_name__icontains=w) | Q(tool_id__icontains=w) | Q(part_number__icontains=w)
+            | Q(brand__icontains=w) | Q(tool_type__icontains=w)
+        )
+    ids = tools.order_by('tool_name', 'id').values_list('id', flat=True)
+    return list(ids[:limit] if limit else ids)
+
+
+def tool_ids(query, limit=None):
+    """ToolCreation ids matching every term of ``query``, best match first."""
+    words = terms(query)
+    if not words:
+        return []
+    if connection.vendor == 'sqlite':
+        return _sqlite_ids(words, limit)
+    if connection.vendor == 'postgresql':
+        return _postgres_ids(words, limit)
+    return _fallback_ids(words, limit)
+
+
+def search_tools(query, limit=10):
+    """Top ``limit`` ToolCreation rows for ``query``, in rank order."""
+    ids = tool_ids(query, limit)
+    found = ToolCreation.objects.in_bulk(ids)
+    return [found[i] for i in ids if i in found]
@@ -0,0 +1,281 @@
+"""
+Machine B — detection sender.
+
+Runs on the edge machine next to the camera and does not need Django.
+Detections are buffered into frames, coalesced into batches and POSTed as
+gzip-compressed {"frames": [...]} documents over one keep-alive session.
+When the master cannot be reached, batches go to an append-only NDJSON spool
+on disk and are replayed (as a gzip NDJSON stream) with exponential backoff.
+
+    sender = DetectionSender("http://192.168.1.100:8000/api/detections/", "MY_SECRET_KEY",
+                             spool_path="/var/spool/detections.ndjson")
+    sender.send_detection("spanner", 0.97, frame_id="frame_001")
+    ...
+    sender.close()
+"""
+import gzip
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying later; anything else in 4xx means the batch
+# itself is bad and resending it would fail again.
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class DetectionSender:
+    def __init__(self, api_url, api_key, device_id=None, spool_path="detections.spool.ndjson",
+                 max_batch_frames=100, max_delay=1.0, timeout=5.0, pool_size=4,
+                 backoff_base=1.0, backoff_max=60.0, replay_chunk_bytes=1024 * 1024):
+        self.api_url = api_url
+        self.device_id = device_id or socket.gethostname()
+        self.spool_path = spool_path
+        self.offset_path = f"{spool_path}.offset"
+        self.max_batch_frames = max_batch_frames
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.replay_chunk_bytes = replay_chunk_bytes
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Encoding": "gzip",
+        })
+
+        self._buffer = []
+        self._buffer_started = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._failures = 0
+        self._next_attempt = 0.0
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        self.sent_frames = 0
+        self.spooled_frames = 0
+        self.rejected_frames = 0
+
+        self._thread = threading.Thread(target=self._run, name="detection-sender", daemon=True)
+        self._thread.start()
+
+    # --- public API -----------------------------------------------------
+
+    def send_detection(self, tool_name, confidence, frame_id=None, **extra):
+        """Queues a single detection as its own frame (the old send_to_master call)."""
+        self.add_frame([{"tool": tool_name, "confidence": confidence, **extra}], frame_id=frame_id)
+
+    def add_frame(self, detections, frame_id=None, timestamp=None, meta=None):
+        frame = {
+            "device_id": self.device_id,
+            "timestamp": timestamp or time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "frame_id": frame_id,
+            "detections": detections,
+        }
+        if meta:
+            frame["meta"] = meta
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("DetectionSender is closed")
+            if not self._buffer:
+                self._buffer_started = time.monotonic()
+            self._buffer.append(frame)
+            full = len(self._buffer) >= self.max_batch_frames
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Sends whatever is buffered now; failed batches land in the spool."""
+        with self._lock:
+            frames, self._buffer = self._buffer, []
+            self._buffer_started = None
+        for start in range(0, len(frames), self.max_batch_frames):
+            self._deliver(frames[start:start + self.max_batch_frames])
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=self.timeout * 2)
+        self.flush()
+        self.session.close()
+
+    def pending_spool_bytes(self):
+        try:
+            return os.path.getsize(self.spool_path) - self._read_offset()
+        except OSError:
+            return 0
+
+    # --- delivery ---------------------------------------------------------
+
+    def _post(self, body, content_type):
+        return self.session.post(
+            self.api_url, data=gzip.compress(body, compresslevel=5),
+            headers={"Content-Type": content_type}, timeout=self.timeout,
+        )
+
+    def _deliver(self, frames):
+        # Keep ordering: while older data is spooled, new batches queue behind it.
+        if self.pending_spool_bytes() > 0 or time.monotonic() < self._next_attempt:
+            self._spool(frames)
+            return
+
+        body = json.dumps({"device_id": self.device_id, "frames": frames}).encode()
+        with self._send_lock:
+            try:
+                response = self._post(body, "application/json")
+            except requests.RequestException as e:
+                logger.warning("Master unreachable (%s); spooling %d frames", e, len(frames))
+                self._record_failure()
+                self._spool(frames)
+                return
+
+        if response.status_code in RETRY_STATUSES:
+            logger.warning("Master returned %s; spooling %d frames", response.status_code, len(frames))
+            self._record_failure()
+            self._spool(frames)
+        elif response.status_code >= 400:
+            logger.error("Master rejected %d frames: %s %s", len(frames), response.status_code, response.text[:200])
+            self.rejected_frames += len(frames)
+        else:
+            self._failures = 0
+            self.sent_frames += len(frames)
+
+    def _record_failure(self):
+        self._failures += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+        self._next_attempt = time.monotonic() + delay * random.uniform(0.5, 1.0)
+
+    # --- spool ------------------------------------------------------------
+
+    def _spool(self, frames):
+        line = json.dumps({"device_id": self.device_id, "frames": frames}) + "\n"
+        with self._lock, open(self.spool_path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            self.spooled_frames += len(frames)
+
+    def _read_offset(self):
+        try:
+            with open(self.offset_path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_offset(self, offset):
+        tmp = f"{self.offset_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+        os.replace(tmp, self.offset_path)
+
+    def replay_spool(self):
+        """
+        Uploads spooled batches as gzip NDJSON, one chunk of whole lines at a
+        time, recording the byte offset after each accepted chunk. The spool
+        is truncated once fully replayed. Returns True when nothing is left.
+        """
+        if time.monotonic() < self._next_attempt:
+            return False
+        with self._send_lock:
+            offset = self._read_offset()
+            try:
+                f = open(self.spool_path, "rb")
+            except FileNotFoundError:
+                return True
+            with f:
+                f.seek(offset)
+                while True:
+                    chunk = f.readlines(self.replay_chunk_bytes)
+                    if not chunk:
+                        break
+                    if not chunk[-1].endswith(b"\n"):
+                        # Half-written line from a crash; it will be completed or skipped later.
+                        chunk.pop()
+                        if not chunk:
+                            break
+                    try:
+                        response = self._post(b"".join(chunk), "application/x-ndjson")
+                    except requests.RequestException as e:
+                        logger.warning("Spool replay failed (%s)", e)
+                        self._record_failure()
+                        return False
+                    if response.status_code in RETRY_STATUSES:
+                        self._record_failure()
+                        return False
+                    handled = self._handled_lines(response, len(chunk))
+                    offset += sum(len(line) for line in chunk[:handled])
+                    self._write_offset(offset)
+                    if handled < len(chunk):
+                        # The master stopped part way; send the rest again later.
+                        logger.warning("Master kept %d of %d spooled lines; retrying the rest", handled, len(chunk))
+                        self._record_failure()
+                        return False
+                    self._failures = 0
+
+            if offset >= os.path.getsize(self.spool_path):
+                with self._lock:
+                    # Nothing new was appended while we were uploading; start a fresh spool.
+                    if offset >= os.path.getsize(self.spool_path):
+                        for path in (self.spool_path, self.offset_path):
+                            if os.path.exists(path):
+                                os.remove(path)
+                return True
+        return False
+
+    @staticmethod
+    def _handled_lines(response, lines):
+        """
+        How many lines of a replayed chunk the master is done with. A
+        "partial" reply (the stream broke off) names the last line it read;
+        any other 4xx rejects the whole chunk for good.
+        """
+        if response.status_code < 400:
+            return lines
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if isinstance(body, dict) and "aborted" in body:
+            return min(int(body.get("read") or 0), lines)
+        logger.error("Master rejected spooled chunk: %s %s", response.status_code, response.text[:200])
+        return lines
+
+    # --- background loop --------------------------------------------------
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(timeout=min(self.max_delay, 0.25))
+            self._wakeup.clear()
+
+            with self._lock:
+                due = self._buffer and (
+                    len(self._buffer) >= self.max_batch_frames
+                    or time.monotonic() - self._buffer_started >= self.max_delay
+                )
+            if self.pending_spool_bytes() > 0:
+                self.replay_spool()
+            if due:
+                self.flush()
+
+
+if __name__ == "__main__":
+    # Example usage
+    logging.basicConfig(level=logging.INFO)
+    sender = DetectionSender("http://192.168.1.100:8000/api/detections/", "MY_SECRET_KEY")
+    sender.send_detection("spanner", 0.97, frame_id="frame_001")
+    sender.close()
@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import hierarchy, metrics, response_cache, scope, stats, usage
+from .models import Inventory, ServiceStation, ToolCreation, ToolEventTracking, Tray, Unit, UserProfile
+
+# Cached page groups (detection/response_cache.py) each model feeds
+RESPONSE_GROUPS = {
+    ToolCreation: ('tools', 'inventory'),
+    Inventory: ('inventory',),
+    ServiceStation: ('stations', 'users'),
+    Unit: ('users',),
+    Tray: ('users',),
+    User: ('stations', 'users'),
+    UserProfile: ('users',),
+}
+
+
+@receiver(post_save, sender=ToolEventTracking)
+def track_tool_usage(sender, instance, created, raw=False, **kwargs):
+    # raw is set by loaddata; rebuild_usage_sessions and
+    # reconcile_activity_stats cover fixtures.
+    if created and not raw:
+        with transaction.atomic():
+            change = usage.apply_event(instance)
+            stats.record_event(instance, change)
+        metrics.record_event(instance.event)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_scope_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: scope.invalidate_user(instance.user_id))
+
+
+@receiver(m2m_changed, sender=UserProfile.stations.through)
+@receiver(m2m_changed, sender=UserProfile.units.through)
+@receiver(m2m_changed, sender=UserProfile.trays.through)
+def profile_scope_relations_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Changed from the station/unit/tray side; cheaper to drop everyone's.
+        transaction.on_commit(scope.invalidate_all)
+    else:
+        transaction.on_commit(lambda: scope.invalidate_user(instance.user_id))
+    transaction.on_commit(lambda: response_cache.bump('users'))
+
+
+@receiver(post_save, sender=Tray)
+@receiver(post_delete, sender=Tray)
+@receiver(post_save, sender=Unit)
+@receiver(post_delete, sender=Unit)
+@receiver(post_save, sender=ServiceStation)
+@receiver(post_delete, sender=ServiceStation)
+def hierarchy_changed(sender, **kwargs):
+    transaction.on_commit(hierarchy.invalidate)
+    if sender is not ServiceStation:
+        # Supervisors' trays are derived from their stations.
+        transaction.on_commit(scope.invalidate_all)
+
+
+def cached_pages_changed(sender, update_fields=None, **kwargs):
+    if sender is User and update_fields and set(update_fields) == {'last_login'}:
+        return  # every login saves the user; nothing cached shows it
+    transaction.on_commit(lambda: response_cache.bump(*RESPONSE_GROUPS[sender]))
+
+
+for _model in RESPONSE_GROUPS:
+    post_save.connect(cached_pages_changed, sender=_model, dispatch_uid=f'response_cache_save_{_model.__name__}')
+    post_delete.connect(cached_pages_changed, sender=_model, dispatch_uid=f'response_cache_delete_{_model.__name__}')
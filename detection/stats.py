@@ -0,0 +1,192 @@
+import datetime
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import usage
+from .models import (
+    ActivityGauge, DailyEventCount, ToolActivityStat, ToolEventTracking, ToolUsageSession,
+    UserActivityStat,
+)
+
+ACTIVE_TOOLS = 'active_tools'
+ACTIVE_USERS = 'active_users'
+DAMAGED_TOOLS = 'damaged_tools'
+
+DAMAGED = 'tool_Damaged'
+# Which per-tool / per-user total each event type feeds.
+EVENT_TOTALS = {usage.ISSUED: 'issued', usage.RETURNED: 'returned', DAMAGED: 'damaged'}
+
+
+def _increment(model, lookup, defaults=None, **deltas):
+    """UPDATE ... SET col = col + delta, creating the row on first use."""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    updates.update(defaults or {})
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **(defaults or {}), **deltas)
+    except IntegrityError:
+        # Somebody else created it in the meantime
+        model.objects.filter(**lookup).update(**updates)
+
+
+def _adjust_in_use(model, lookup, defaults, delta):
+    """Moves in_use by delta and returns +1/-1 when the row turns active/idle."""
+    stat, _ = model.objects.select_for_update().get_or_create(**lookup, defaults=defaults)
+    was_active = stat.in_use > 0
+    stat.in_use = max(stat.in_use + delta, 0)
+    stat.save(update_fields=['in_use'])
+    is_active = stat.in_use > 0
+    return 0 if was_active == is_active else (1 if is_active else -1)
+
+
+def record_event(event, change=None):
+    """
+    Updates the counters for one newly written ToolEventTracking row.
+    ``change`` is what usage.apply_event() did with it (OPENED/CLOSED/None).
+    """
+    tool_key = {'tool_id': event.tool_id or ''}
+    tool_defaults = {'tool_name': event.tool_name}
+    user_key = {'user_id': event.user_id or ''}
+    user_defaults = {'user_name': event.user_name}
+
+    with transaction.atomic():
+        _increment(DailyEventCount, {'day': timezone.localdate(event.timestamp), 'event': event.event}, count=1)
+
+        total = EVENT_TOTALS.get(event.event)
+        if total:
+            _increment(ToolActivityStat, tool_key, {**tool_defaults, 'last_event_at': event.timestamp}, **{total: 1})
+            _increment(UserActivityStat, user_key, {**user_defaults, 'last_event_at': event.timestamp}, **{total: 1})
+        if event.event == DAMAGED:
+            _increment(ActivityGauge, {'name': DAMAGED_TOOLS}, value=1)
+
+        if change in (usage.OPENED, usage.CLOSED):
+            delta = 1 if change == usage.OPENED else -1
+            _increment(ActivityGauge, {'name': ACTIVE_TOOLS}, value=delta)
+            _adjust_in_use(ToolActivityStat, tool_key, tool_defaults, delta)
+            user_change = _adjust_in_use(UserActivityStat, user_key, user_defaults, delta)
+            if user_change:
+                _increment(ActivityGauge, {'name': ACTIVE_USERS}, value=user_change)
+
+
+def summary(day=None):
+    """Dashboard summary cards; a handful of primary-key / unique-index reads."""
+    day = day or timezone.localdate()
+    gauges = dict(ActivityGauge.objects.filter(
+        name__in=[ACTIVE_TOOLS, ACTIVE_USERS, DAMAGED_TOOLS]
+    ).values_list('name', 'value'))
+    total_events = DailyEventCount.objects.filter(day=day).aggregate(total=Sum('count'))['total'] or 0
+    return {
+        'day': day.isoformat(),
+        'total_events': total_events,
+        'active_users': max(gauges.get(ACTIVE_USERS, 0), 0),
+        'active_tools': max(gauges.get(ACTIVE_TOOLS, 0), 0),
+        'damaged_tools': max(gauges.get(DAMAGED_TOOLS, 0), 0),
+    }
+
+
+def _per_key_totals(key_field, name_field):
+    """Per tool or per user totals straight from the event and session tables."""
+    totals = (
+        ToolEventTracking.objects.filter(event__in=EVENT_TOTALS)
+        .values(key_field)
+        .annotate(
+            name=Max(name_field),
+            issued=Count('id', filter=Q(event=usage.ISSUED)),
+            returned=Count('id', filter=Q(event=usage.RETURNED)),
+            damaged=Count('id', filter=Q(event=DAMAGED)),
+            last_event_at=Max('timestamp'),
+        )
+    )
+    in_use = dict(
+        ToolUsageSession.objects.filter(returned_at__isnull=True)
+        .values(key_field).annotate(n=Count('id')).values_list(key_field, 'n')
+    )
+    rows = {}
+    for row in totals:
+        key = row[key_field] or ''
+        merged = rows.setdefault(key, {
+            key_field: key, name_field: row['name'], 'in_use': 0,
+            'issued': 0, 'returned': 0, 'damaged': 0, 'last_event_at': None,
+        })
+        for field in ('issued', 'returned', 'damaged'):
+            merged[field] += row[field]
+        if merged['last_event_at'] is None or row['last_event_at'] > merged['last_event_at']:
+            merged['last_event_at'] = row['last_event_at']
+    for key, n in in_use.items():
+        rows.setdefault(key or '', {key_field: key or '', name_field: None})
+        rows[key or '']['in_use'] = rows[key or ''].get('in_use', 0) + n
+    return rows.values()
+
+
+def _lock_for_rebuild(*models):
+    """
+    Blocks other writers to ``models`` until the transaction ends; reads go on.
+    PostgreSQL only: SQLite already lets one transaction write at a time.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    tables = ', '.join(connection.ops.quote_name(model._meta.db_table) for model in models)
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {tables} IN SHARE ROW EXCLUSIVE MODE")
+
+
+def reconcile(days=2):
+    """
+    Recomputes the counters from the source tables, correcting any drift from
+    bulk writes that skip signals or from crashes between writes. Daily counts
+    are rebuilt for the last ``days`` days (all history when days is None);
+    the per-tool/per-user totals and gauges are always rebuilt in full.
+
+    New events and their counter updates wait until the rebuild commits, so
+    none is lost or counted twice while it runs.
+    """
+    since = None
+    if days is not None:
+        since = timezone.localdate() - datetime.timedelta(days=days - 1)
+
+    with transaction.atomic():
+        # Events first, in the order record_event's transactions take them
+        _lock_for_rebuild(ToolEventTracking, ToolUsageSession, DailyEventCount, ToolActivityStat,
+                          UserActivityStat, ActivityGauge)
+        # Delete before reading, so on SQLite this transaction holds the write lock from here on
+        stale = DailyEventCount.objects.all()
+        if since:
+            stale = stale.filter(day__gte=since)
+        stale.delete()
+        ToolActivityStat.objects.all().delete()
+        UserActivityStat.objects.all().delete()
+
+        events = ToolEventTracking.objects.all()
+        if since:
+            start = timezone.make_aware(datetime.datetime.combine(since, datetime.time.min))
+            events = events.filter(timestamp__gte=start)
+        daily = (
+            events.annotate(day=TruncDate('timestamp', tzinfo=timezone.get_current_timezone()))
+            .values('day', 'event')
+            .annotate(n=Count('id'))
+        )
+        DailyEventCount.objects.bulk_create(
+            [DailyEventCount(day=row['day'], event=row['event'], count=row['n']) for row in daily],
+            batch_size=1000,
+        )
+        ToolActivityStat.objects.bulk_create(
+            [ToolActivityStat(**row) for row in _per_key_totals('tool_id', 'tool_name')], batch_size=1000,
+        )
+        UserActivityStat.objects.bulk_create(
+            [UserActivityStat(**row) for row in _per_key_totals('user_id', 'user_name')], batch_size=1000,
+        )
+
+        open_sessions = ToolUsageSession.objects.filter(returned_at__isnull=True)
+        gauges = {
+            ACTIVE_TOOLS: open_sessions.count(),
+            ACTIVE_USERS: UserActivityStat.objects.filter(in_use__gt=0).count(),
+            DAMAGED_TOOLS: ToolEventTracking.objects.filter(event=DAMAGED).count(),
+        }
+        for name, value in gauges.items():
+            ActivityGauge.objects.update_or_create(name=name, defaults={'value': value})
+    return gauges
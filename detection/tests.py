@@ -1,3 +1,1140 @@
-from django.test import TestCase
+import base64
+import datetime
+import gzip
+import io
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.auth.models import Group, User
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    benchmarks, catalog_import, db_router, exports, hierarchy, ids, inference, ingest, inventory_feed,
+    metrics, pagination, preprocess, projector, response_cache, rollups, scope, search, stats, usage,
+)
+from .ingest_queue import WriteBehindQueue
+from . import middleware as sql_inspector
+from .middleware import MetricsMiddleware, ReplicaRoutingMiddleware
+from .models import (
+    Inventory, ProjectorCheckpoint, ServiceStation, ToolActivityStat, ToolCreation, ToolPurchase, ToolEventTracking, ToolUsageSession, ToolsTracking, Tray, TrayTool, Unit,
+    UserActivityStat, UserProfile,
+)
+from .sender import DetectionSender
+
+
+class _StandInMaster(BaseHTTPRequestHandler):
+    """Minimal stand-in for /api/detections/ that records what it receives."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        server = self.server
+        server.requests.append({
+            "content_type": self.headers.get("Content-Type"),
+            "body": raw,
+            "client_port": self.client_address[1],
+        })
+        status, reply = server.replies.pop(0) if server.replies else (server.status, {"status": "ok"})
+        body = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DetectionSenderTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInMaster)
+        self.server.requests = []
+        self.server.status = 200
+        self.server.replies = []  # one-off (status, body) answers, used first
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.spool = os.path.join(tmp.name, "spool.ndjson")
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/detections/"
+
+    def make_sender(self, **kwargs):
+        options = {"device_id": "cam-1", "spool_path": self.spool, "max_batch_frames": 5,
+                   "max_delay": 60, "backoff_base": 0.01, "backoff_max": 0.01}
+        options.update(kwargs)
+        sender = DetectionSender(self.url, "MY_SECRET_KEY", **options)
+        self.addCleanup(sender.close)
+        return sender
+
+    def wait_for(self, predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return
+            time.sleep(0.02)
+        self.fail("condition not met in time")
+
+    def test_batches_frames_over_one_connection(self):
+        sender = self.make_sender()
+        for i in range(10):
+            sender.send_detection("spanner", 0.9, frame_id=str(i))
+        self.wait_for(lambda: sender.sent_frames == 10)
+
+        frames = [json.loads(r["body"])["frames"] for r in self.server.requests]
+        self.assertEqual([len(f) for f in frames], [5, 5])
+        self.assertEqual(len({r["client_port"] for r in self.server.requests}), 1)
+
+    def test_spools_when_master_fails_and_replays(self):
+        self.server.status = 503
+        sender = self.make_sender()
+        for i in range(5):
+            sender.send_detection("hammer", 0.8, frame_id=str(i))
+        self.wait_for(lambda: sender.spooled_frames == 5)
+        self.assertTrue(os.path.exists(self.spool))
+
+        self.server.status = 200
+        self.wait_for(lambda: not os.path.exists(self.spool))
+        replayed = self.server.requests[-1]
+        self.assertEqual(replayed["content_type"], "application/x-ndjson")
+        doc = json.loads(replayed["body"].splitlines()[0])
+        self.assertEqual(len(doc["frames"]), 5)
+
+    def test_partial_replay_resends_the_unread_tail(self):
+        self.server.status = 503
+        sender = self.make_sender()
+        for i in range(15):
+            sender.send_detection("hammer", 0.8, frame_id=str(i))
+        sender.flush()
+        self.wait_for(lambda: sender.spooled_frames == 15)
+
+        # The stream broke off after the first of three spooled lines
+        self.server.replies = [(400, {"status": "partial", "aborted": "Invalid gzip body", "read": 1})]
+        self.server.status = 200
+        self.wait_for(lambda: not os.path.exists(self.spool))
+
+        partial, retried = self.server.requests[-2:]
+        self.assertEqual(len(partial["body"].splitlines()), 3)
+        frame_ids = [f["frame_id"] for line in retried["body"].splitlines() for f in json.loads(line)["frames"]]
+        self.assertEqual(frame_ids, [str(i) for i in range(5, 15)])
+
+
+class DetectionIngestTests(TestCase):
+    def post(self, payload, **headers):
+        return self.client.post("/api/detections/", json.dumps(payload), content_type="application/json",
+                                HTTP_AUTHORIZATION="Bearer MY_SECRET_KEY", **headers)
+
+    def test_multi_frame_payload_is_saved_with_acks(self):
+        response = self.post({"device_id": "cam-1", "frames": [
+            {"frame_id": "1", "detections": [{"tool": "spanner", "confidence": 0.9}, {"tool": "hammer"}]},
+            {"frame_id": "2", "device_id": "cam-2", "detections": []},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["saved"], 2)
+        self.assertEqual([(a["frame_id"], a["device_id"], a["saved"]) for a in body["frames"]],
+                         [("1", "cam-1", 2), ("2", "cam-2", 0)])
+        self.assertEqual(sorted(ToolsTracking.objects.values_list("tool_name", flat=True)), ["hammer", "spanner"])
+
+    def test_one_bad_frame_rejects_the_whole_payload(self):
+        cases = [
+            {"frame_id": "x", "detections": [{"confidence": 0.5}]},
+            {"frame_id": "x", "timestamp": 1e20, "detections": [{"tool": "spanner"}]},
+            {"frame_id": "x", "timestamp": "2024-13-45T00:00:00", "detections": [{"tool": "spanner"}]},
+            {"frame_id": "x", "detections": [{"tool": "t" * 101}]},
+            {"frame_id": "x", "device_id": "d" * 101, "detections": [{"tool": "spanner"}]},
+        ]
+        for bad in cases:
+            with self.subTest(bad=bad):
+                response = self.post({"device_id": "cam-1", "frames": [
+                    {"frame_id": "ok", "detections": [{"tool": "spanner"}]}, bad,
+                ]})
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(ToolsTracking.objects.exists())
+
+    def post_stream(self, body, content_type="application/x-ndjson", **headers):
+        return self.client.post("/api/detections/", body, content_type=content_type,
+                                HTTP_AUTHORIZATION="Bearer MY_SECRET_KEY", **headers)
+
+    def test_gzipped_ndjson_stream_skips_bad_lines(self):
+        lines = [json.dumps({"device_id": "cam-1", "frame_id": str(i), "detections": [{"tool": "spanner"}]})
+                 for i in range(5)]
+        lines[2] = "{not json"
+        lines.append(json.dumps({"device_id": "cam-1", "detections": [{"tool": "t" * 101}]}))
+        body = gzip.compress(("\n".join(lines) + "\n").encode())
+        response = self.post_stream(body, HTTP_CONTENT_ENCODING="gzip")
+
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+        self.assertEqual((summary["frames"], summary["saved"], summary["rejected"]), (4, 4, 2))
+        self.assertEqual([e["position"] for e in summary["errors"]], [3, 6])
+        self.assertEqual(ToolsTracking.objects.count(), 4)
+
+    def test_truncated_stream_keeps_what_was_read(self):
+        line = json.dumps({"device_id": "cam-1", "detections": [{"tool": "spanner"}]}) + "\n"
+        body = gzip.compress((line * 3).encode())[:-12]
+        response = self.post_stream(body, HTTP_CONTENT_ENCODING="gzip")
+
+        self.assertEqual(response.status_code, 400)
+        summary = response.json()
+        self.assertEqual(summary["status"], "partial")
+        self.assertIn("aborted", summary)
+        self.assertEqual(ToolsTracking.objects.count(), summary["saved"])
+
+    @skipUnless(ingest.msgpack is not None, "needs msgpack")
+    def test_msgpack_stream(self):
+        body = b"".join(ingest.msgpack.packb({"device_id": "cam-1", "timestamp": 1700000000 + i,
+                                              "detections": [{"tool": "hammer"}]}) for i in range(3))
+        response = self.post_stream(body, content_type="application/msgpack")
+        self.assertEqual(response.json()["saved"], 3)
+
+    def test_requires_the_token(self):
+        response = self.client.post("/api/detections/", "{}", content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+
+
+class WriteBehindQueueTests(TransactionTestCase):
+    def rows(self, device_id, *tools):
+        return ingest.build_rows({"device_id": device_id, "detections": [{"tool": t} for t in tools]})[0]
+
+    def test_a_failing_batch_does_not_drop_the_others(self):
+        bad = self.rows("cam-2", "hammer")
+        bad[0].confidence = None  # NOT NULL violation when written
+        queue = WriteBehindQueue()
+        with self.assertLogs("detection.ingest_queue", "WARNING"):
+            queue._flush([self.rows("cam-1", "spanner", "pliers"), bad, self.rows("cam-3", "wrench")])
+
+        stats = queue.stats()
+        self.assertEqual((stats["dropped_batches"], stats["flushed_rows"]), (1, 3))
+        self.assertEqual(sorted(ToolsTracking.objects.values_list("device_id", flat=True)),
+                         ["cam-1", "cam-1", "cam-3"])
+
+    def test_async_endpoint_validates_before_queueing(self):
+        response = self.client.post("/api/detections/async/", json.dumps({
+            "device_id": "cam-1", "detections": [{"tool": "t" * 101}],
+        }), content_type="application/json", HTTP_AUTHORIZATION="Bearer MY_SECRET_KEY")
+        self.assertEqual(response.status_code, 400)
+
+    def test_stats_require_the_token(self):
+        self.assertEqual(self.client.get("/api/detections/queue/").status_code, 401)
+        response = self.client.get("/api/detections/queue/", HTTP_AUTHORIZATION="Bearer MY_SECRET_KEY")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("dropped_batches", response.json())
+
+
+class MetricsTests(SimpleTestCase):
+    def test_device_labels_are_capped(self):
+        self.addCleanup(metrics.registry.clear)
+        metrics.registry.clear()
+        rows = [ToolsTracking(device_id=f"cam-{i}", tool_name="spanner", confidence=0.9, timestamp=timezone.now())
+                for i in range(5)]
+        with mock.patch.object(metrics, "MAX_DEVICES", 2):
+            metrics.record_detection_write(rows + rows[:1], 0.01)
+        body = metrics.render()
+
+        self.assertIn('fod_detections_total{device_id="cam-0"} 2', body)
+        self.assertIn('fod_detections_total{device_id="cam-1"} 1', body)
+        self.assertIn('fod_detections_total{device_id="other"} 3', body)
+        self.assertNotIn("cam-4", body)
+
+    async def test_middleware_stays_async(self):
+        self.addCleanup(metrics.registry.clear)
+        metrics.registry.clear()
+
+        async def view(request):
+            return HttpResponse(status=204)
+
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get("/nowhere/"))
+        self.assertEqual(response.status_code, 204)
+        self.assertIn('fod_http_requests_total{view="unmatched",method="GET",status="204"} 1', metrics.render())
+
+
+@override_settings(SQL_INSPECTOR_ENABLED=True)
+class SQLInspectorTests(TestCase):
+    def setUp(self):
+        self.addCleanup(sql_inspector.report.clear)
+        ServiceStation.objects.bulk_create([ServiceStation(station_id=f"SS-{i}", name=f"S{i}") for i in range(8)])
+
+    async def test_async_requests_are_inspected(self):
+        @sync_to_async
+        def read():
+            return ServiceStation.objects.count()
+
+        async def view(request):
+            return HttpResponse(str(await read()))
+
+        middleware = sql_inspector.SQLInspectorMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get("/"))
+        self.assertEqual(response.content, b"8")
+        self.assertEqual(response["X-SQL-Queries"], "1")
+
+    def test_headers_only_when_enabled(self):
+        response = self.client.get("/api/tool-events/")
+        self.assertEqual(response["X-SQL-Queries"], "1")
+        self.assertGreaterEqual(float(response["X-SQL-Time-ms"]), 0)
+        self.assertEqual(sql_inspector.report.snapshot()["views"][0]["view"], "tool_events_api")
+        with self.settings(SQL_INSPECTOR_ENABLED=False):
+            response = self.client_class().get("/api/tool-events/")  # middleware is loaded per client
+        self.assertNotIn("X-SQL-Queries", response)
+
+    def test_repeated_statements_are_flagged(self):
+        def view(request, lookups):
+            for pk in ServiceStation.objects.values_list("pk", flat=True)[:lookups]:
+                ServiceStation.objects.get(pk=pk)
+            return HttpResponse()
+
+        middleware = sql_inspector.SQLInspectorMiddleware(lambda request: view(request, request.lookups))
+        for lookups, flagged in ((5, False), (6, True)):
+            request = RequestFactory().get("/")
+            request.lookups = lookups
+            with self.subTest(lookups=lookups), mock.patch.object(sql_inspector, "N_PLUS_ONE_THRESHOLD", 5):
+                response = middleware(request)
+                self.assertEqual(response["X-SQL-Queries"], str(lookups + 1))
+                self.assertEqual("X-SQL-N-Plus-One" in response, flagged)
+        self.assertTrue(response["X-SQL-N-Plus-One"].startswith("6x SELECT"))
+
+    def test_normalize_sql(self):
+        shapes = {
+            sql_inspector.normalize_sql(sql) for sql in (
+                "SELECT * FROM t WHERE id = 1 AND name = 'a''b' AND id IN (1, 2, 3)",
+                "SELECT *  FROM t WHERE id = 42 AND name = 'x'\nAND id IN (7)",
+                'SELECT * FROM t WHERE id = %s AND name = %s AND id IN (%s, %s)',
+            )
+        }
+        self.assertEqual(shapes, {"SELECT * FROM t WHERE id = ? AND name = ? AND id IN (...)"})
+        self.assertEqual(sql_inspector.normalize_sql('SELECT "t1"."c2" FROM "t1"'), 'SELECT "t1"."c2" FROM "t1"')
+
+
+class UsageSessionTests(TestCase):
+    HISTORY = [
+        # (minute, event, user, tool)
+        (0, "tool_Issued", "U1", "T1"),
+        (1, "tool_Issued", "U1", "T1"),
+        (2, "tool_Returned", "U2", "T1"),  # nothing open for U2
+        (3, "tool_Damaged", "U1", "T1"),
+        (4, "tool_Returned", "U1", "T1"),
+        (5, "tool_Issued", "U1", "T2"),
+        (7, "tool_Returned", "U1", "T1"),
+        (8, "tool_Returned", "U1", "T1"),  # both T1 sessions already closed
+    ]
+
+    def setUp(self):
+        start = timezone.make_aware(datetime.datetime(2026, 1, 1, 8))
+        # bulk_create skips the signal, so each test decides how sessions are built
+        self.events = ToolEventTracking.objects.bulk_create([
+            ToolEventTracking(timestamp=start + datetime.timedelta(minutes=minute), event=event,
+                              user_id=user, user_name=user.lower(), tool_id=tool, tool_name=tool)
+            for minute, event, user, tool in self.HISTORY
+        ])
+
+    def sessions(self):
+        return list(ToolUsageSession.objects.order_by("issued_at", "id").values_list(
+            "user_id", "tool_id", "issued_event_id", "returned_event_id", "duration"))
+
+    def test_apply_event_matches_returns_first_in_first_out(self):
+        changes = [usage.apply_event(e) for e in self.events]
+        self.assertEqual(changes, [usage.OPENED, usage.OPENED, None, None, usage.CLOSED, usage.OPENED,
+                                   usage.CLOSED, None])
+        e = self.events
+        self.assertEqual(self.sessions(), [
+            ("U1", "T1", e[0].id, e[4].id, datetime.timedelta(minutes=4)),
+            ("U1", "T1", e[1].id, e[6].id, datetime.timedelta(minutes=6)),
+            ("U1", "T2", e[5].id, None, None),
+        ])
+        # Applying an issue twice does not open a second session
+        self.assertIsNone(usage.apply_event(e[0]))
+
+    def test_rebuild_matches_incremental(self):
+        for event in self.events:
+            usage.apply_event(event)
+        incremental = self.sessions()
+
+        self.assertEqual(usage.rebuild_sessions(chunk_size=1), 3)
+        self.assertEqual(self.sessions(), incremental)
+
+
+class ActivityStatsTests(TestCase):
+    def event(self, event, tool_id="T1", user_id="U1"):
+        return ToolEventTracking.objects.create(timestamp=timezone.now(), event=event, tool_id=tool_id,
+                                                tool_name=f"Tool {tool_id}", user_id=user_id, user_name="Ann")
+
+    def test_events_update_counters_and_reconcile_repairs_drift(self):
+        self.event("tool_Issued")
+        self.event("tool_Issued", tool_id="T2")
+        self.event("tool_Returned")
+        self.event("tool_Damaged", tool_id="T2")
+        expected = stats.summary()
+        self.assertEqual((expected["total_events"], expected["active_tools"], expected["damaged_tools"]), (4, 1, 1))
+
+        ToolActivityStat.objects.filter(tool_id="T1").update(issued=99, in_use=5)
+        UserActivityStat.objects.all().delete()
+        stats.reconcile()
+
+        self.assertEqual(stats.summary(), expected)
+        self.assertEqual(
+            list(ToolActivityStat.objects.order_by("tool_id").values_list("tool_id", "issued", "returned", "in_use")),
+            [("T1", 1, 1, 0), ("T2", 1, 0, 1)],
+        )
+        self.assertEqual(UserActivityStat.objects.get(user_id="U1").issued, 2)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        start = timezone.make_aware(datetime.datetime(2026, 1, 1))
+        # Three rows share each timestamp, so pages split ties
+        ToolEventTracking.objects.bulk_create([
+            ToolEventTracking(timestamp=start + datetime.timedelta(minutes=i // 3), event="tray_open", tool_id=str(i))
+            for i in range(8)
+        ])
+        self.newest_first = list(ToolEventTracking.objects.order_by("-timestamp", "-id").values_list("id", flat=True))
+
+    def ids(self, page):
+        return [row.id for row in page]
+
+    def test_next_and_previous_pages(self):
+        queryset = ToolEventTracking.objects.all()
+        seen, page, pages = [], pagination.keyset_page(queryset, per_page=3), []
+        while True:
+            pages.append(page)
+            seen += self.ids(page)
+            if not page.has_next:
+                break
+            page = pagination.keyset_page(queryset, page.next_cursor, per_page=3)
+        self.assertEqual(seen, self.newest_first)
+        self.assertEqual([len(p) for p in pages], [3, 3, 2])
+
+        back = pagination.keyset_page(queryset, pages[2].previous_cursor, per_page=3)
+        self.assertEqual(self.ids(back), self.ids(pages[1]))
+        first = pagination.keyset_page(queryset, back.previous_cursor, per_page=3)
+        self.assertEqual(self.ids(first), self.ids(pages[0]))
+        self.assertFalse(first.has_previous)
+
+    def test_invalid_cursors_fall_back_to_the_first_page(self):
+        queryset = ToolEventTracking.objects.all()
+        tampered = base64.urlsafe_b64encode(b"next|2026-01-01T00:00:00+00:00|x").decode()
+        sideways = base64.urlsafe_b64encode(b"up|2026-01-01T00:00:00+00:00|1").decode()
+        for cursor in ("not base64!", tampered, sideways, "bmV4dHw"):
+            with self.subTest(cursor=cursor):
+                page = pagination.keyset_page(queryset, cursor, per_page=3)
+                self.assertEqual(self.ids(page), self.newest_first[:3])
+                self.assertFalse(page.has_previous)
+
+    def test_cursor_pages_search_the_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("checks the SQLite plan")
+        with CaptureQueriesContext(connection) as captured:
+            pagination.keyset_page(ToolEventTracking.objects.all(),
+                                   pagination.keyset_page(ToolEventTracking.objects.all(), per_page=3).next_cursor,
+                                   per_page=3)
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + captured[-1]["sql"])
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("SEARCH", plan)
+
+    def test_apis(self):
+        body = self.client.get("/api/tool-events/", {"limit": 5}).json()
+        self.assertEqual([r["id"] for r in body["results"]], self.newest_first[:5])
+        self.assertIsNone(body["previous"])
+        body = self.client.get("/api/tool-events/", {"limit": 5, "cursor": body["next"]}).json()
+        self.assertEqual([r["id"] for r in body["results"]], self.newest_first[5:])
+        self.assertIsNone(body["next"])
+
+        start = timezone.make_aware(datetime.datetime(2026, 1, 1))
+        ToolsTracking.objects.bulk_create([
+            ToolsTracking(device_id=f"cam-{i % 2}", tool_name="spanner", confidence=0.5,
+                          timestamp=start, frame_id=str(i))
+            for i in range(5)
+        ])
+        body = self.client.get("/api/tools-tracking/", {"limit": 2, "device_id": "cam-0"}).json()
+        rest = self.client.get("/api/tools-tracking/", {"limit": 2, "device_id": "cam-0", "cursor": body["next"]}).json()
+        self.assertEqual([r["frame_id"] for r in body["results"] + rest["results"]], ["4", "2", "0"])
+        self.assertIsNone(rest["next"])
+
+
+class AccessScopeTests(TestCase):
+    databases = "__all__"  # global_assigned_tools reads from the replica when there is one
+
+    def setUp(self):
+        self.trays = {}
+        for name in ("North", "South"):
+            station = ServiceStation.objects.create(name=name)
+            unit = Unit.objects.create(station=station, name=f"{name} unit")
+            self.trays[name] = Tray.objects.create(unit=unit, tray_name=f"{name} tray")
+        user = User.objects.create_user("sam", password="pw")
+        profile = UserProfile.objects.create(user=user, role="Supervisor")
+        profile.stations.set([self.trays["North"].unit.station])
+        hierarchy.invalidate()  # signals only bump it on commit
+
+    def test_supervisor_sees_only_their_stations(self):
+        self.client.login(username="sam", password="pw")
+        stations = self.client.get("/api/hierarchy/").json()["results"]
+        self.assertEqual([s["name"] for s in stations], ["North"])
+        response = self.client.get("/assigned-tools/")
+        self.assertEqual([s["name"] for s in response.context["stations"]], ["North"])
+
+    def test_hierarchy_snapshot_expires(self):
+        before = hierarchy.get()
+        ServiceStation.objects.bulk_create([ServiceStation(station_id="SS-X", name="East")])  # no signals
+        self.assertIs(hierarchy.get(), before)
+        with mock.patch("detection.hierarchy.time.monotonic", return_value=before.built_at + hierarchy.MAX_AGE + 1):
+            after = hierarchy.get()
+        self.assertEqual([s["name"] for s in after.stations], ["North", "South", "East"])
+
+    def test_role_repair_refreshes_cached_pages_and_scope(self):
+        sam = User.objects.get(username="sam")
+        sam.is_staff = True
+        sam.save()
+        self.client.login(username="sam", password="pw")
+        self.assertIn("Supervisor", self.client.get("/users/assigned/").content.decode())
+        tokens = scope.generation(sam.pk)
+
+        # The group says Admin; opening the page repairs the profile with bulk_update
+        sam.groups.add(Group.objects.create(name="Admin"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get("/users/manage/")
+        self.assertEqual(UserProfile.objects.get(user=sam).role, "Admin")
+        self.assertNotEqual(scope.generation(sam.pk), tokens)
+        page = self.client.get("/users/assigned/")
+        self.assertEqual(page["X-Response-Cache"], "miss")
+        self.assertNotIn("Supervisor", page.content.decode())
+
+    def test_logging_out_does_not_widen_the_scope(self):
+        self.assertEqual(self.client.get("/api/hierarchy/").status_code, 401)
+        for url in ("/assigned-tools/", f"/trays/{self.trays['South'].id}/assigned-tools/"):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 302)
+        request = RequestFactory().get("/")
+        request.user = mock.Mock(is_authenticated=False)
+        self.assertEqual(scope.permitted_tray_ids(request), frozenset())
+
+
+class TrayAssignmentTests(TestCase):
+    def setUp(self):
+        station = ServiceStation.objects.create(name="North")
+        unit = Unit.objects.create(station=station, name="North unit")
+        self.tray = Tray.objects.create(unit=unit, tray_name="North tray")
+        other = ServiceStation.objects.create(name="South")
+        self.other_tray = Tray.objects.create(unit=Unit.objects.create(station=other, name="South unit"),
+                                              tray_name="South tray")
+        self.stock = {}
+        for tool_id, in_stock in (("TL1", 5), ("TL2", 1)):
+            tool = ToolCreation.objects.create(tool_id=tool_id, tool_name=tool_id)
+            self.stock[tool_id] = Inventory.objects.create(tool=tool, total_quantity=in_stock, in_stock=in_stock)
+        self.user = User.objects.create_user("sam", password="pw")
+        UserProfile.objects.create(user=self.user, role="Supervisor").stations.set([station])
+        self.client.login(username="sam", password="pw")
+
+    def post_api(self, tray, items):
+        return self.client.post(f"/api/trays/{tray.id}/assign/", json.dumps({"items": items}),
+                                content_type="application/json")
+
+    def test_batch_is_all_or_nothing(self):
+        items = [{"inventory_id": self.stock["TL1"].inventory_id, "quantity": 2},
+                 {"inventory_id": self.stock["TL2"].inventory_id, "quantity": 2}]
+        response = self.post_api(self.tray, items)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([e["item"] for e in response.json()["errors"]], [1])
+        self.assertFalse(TrayTool.objects.exists())
+        self.assertEqual(Inventory.objects.get(pk=self.stock["TL1"].pk).in_stock, 5)
+
+        items[1]["quantity"] = 1
+        self.assertEqual(self.post_api(self.tray, items).status_code, 200)
+        self.assertEqual(
+            sorted(TrayTool.objects.values_list("inventory__tool__tool_id", "assigned_quantity", "assigned_by")),
+            [("TL1", 2, self.user.pk), ("TL2", 1, self.user.pk)],
+        )
+        self.assertEqual(Inventory.objects.get(pk=self.stock["TL1"].pk).in_stock, 3)
+
+    def test_trays_outside_the_scope_are_refused(self):
+        items = {f"assign_qty_{self.stock['TL1'].inventory_id}": "1"}
+        self.assertEqual(self.client.post(f"/trays/{self.other_tray.id}/assign-tools/", items).status_code, 403)
+        self.assertEqual(self.post_api(self.other_tray, [{"inventory_id": self.stock["TL1"].inventory_id,
+                                                          "quantity": 1}]).status_code, 403)
+        self.assertFalse(TrayTool.objects.exists())
+
+        self.client.logout()
+        self.assertEqual(self.client.post(f"/trays/{self.tray.id}/assign-tools/", items).status_code, 302)
+        self.assertFalse(TrayTool.objects.exists())
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        caches[response_cache.ALIAS].clear()
+        self.calls = 0
+        self.factory = RequestFactory()
+
+    def counting_view(self, status=200, csrf=False):
+        @response_cache.cached_view("stations")
+        def view(request):
+            self.calls += 1
+            token = get_token(request) if csrf else ""
+            return HttpResponse(f"{self.calls}:{token}", status=status)
+        return view
+
+    def test_hit_after_miss(self):
+        view = self.counting_view()
+        self.assertEqual(view(self.factory.get("/a/"))["X-Response-Cache"], "miss")
+        response = view(self.factory.get("/a/"))
+        self.assertEqual((response["X-Response-Cache"], response.content), ("hit", b"1:"))
+        view(self.factory.get("/a/?page=2"))  # another URL, another entry
+        self.assertEqual(self.calls, 2)
+
+    def test_saving_or_deleting_a_group_model_invalidates(self):
+        view = self.counting_view()
+        view(self.factory.get("/"))
+        with self.captureOnCommitCallbacks(execute=True):
+            station = ServiceStation.objects.create(name="North")
+        self.assertEqual(view(self.factory.get("/"))["X-Response-Cache"], "miss")
+        with self.captureOnCommitCallbacks(execute=True):
+            station.delete()
+        self.assertEqual(view(self.factory.get("/"))["X-Response-Cache"], "miss")
+        self.assertEqual(view(self.factory.get("/"))["X-Response-Cache"], "hit")
+        self.assertEqual(self.calls, 3)
+
+    def test_pages_with_a_csrf_token_are_kept_per_cookie(self):
+        view = self.counting_view(csrf=True)
+        # No cookie yet: the token belongs to a cookie the client has not got, so nothing is stored
+        view(self.factory.get("/"))
+        self.assertEqual(view(self.factory.get("/"))["X-Response-Cache"], "miss")
+
+        def with_cookie(value):
+            request = self.factory.get("/")
+            request.COOKIES[settings.CSRF_COOKIE_NAME] = value
+            return view(request)
+
+        first = with_cookie("a" * 32)
+        again = with_cookie("a" * 32)
+        self.assertEqual((again["X-Response-Cache"], again.content), ("hit", first.content))
+        other = with_cookie("b" * 32)
+        self.assertEqual(other["X-Response-Cache"], "miss")
+        self.assertEqual(self.calls, 4)
+
+    def test_only_successful_gets_are_cached(self):
+        view = self.counting_view()
+        for _ in range(2):
+            self.assertNotIn("X-Response-Cache", view(self.factory.post("/")))
+        missing = self.counting_view(status=404)
+        for _ in range(2):
+            self.assertEqual(missing(self.factory.get("/")).status_code, 404)
+        self.assertEqual(self.calls, 4)
+        with self.settings(RESPONSE_CACHE_ENABLED=False):
+            self.assertNotIn("X-Response-Cache", view(self.factory.get("/")))
+
+
+class SharedGenerationTests(SimpleTestCase):
+    """Generation tokens bumped in one process must reach the others."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = directory.name
+        cache_settings = dict(settings.CACHES, default={
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": self.cache_dir,
+        })
+        override = override_settings(CACHES=cache_settings)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def run_elsewhere(self, code):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="mysite.settings", GENERATION_CACHE_DIR=self.cache_dir)
+        subprocess.run([sys.executable, "-c", f"import django; django.setup(); {code}"],
+                       cwd=settings.BASE_DIR, env=env, check=True, timeout=60)
+
+    def test_response_cache_bump_from_another_process(self):
+        tools, inventory = response_cache.generations(["tools"]), response_cache.generations(["inventory"])
+        self.run_elsewhere("from detection import response_cache; response_cache.bump('tools')")
+        self.assertNotEqual(response_cache.generations(["tools"]), tools)
+        self.assertEqual(response_cache.generations(["inventory"]), inventory)
+
+    def test_hierarchy_invalidated_from_another_process(self):
+        version = hierarchy._version()
+        self.run_elsewhere("from detection import hierarchy; hierarchy.invalidate()")
+        self.assertNotEqual(hierarchy._version(), version)
+
+
+class IdAllocationTests(TransactionTestCase):
+    def test_concurrent_allocations_never_overlap(self):
+        allocated, errors = [], []
+
+        def allocate():
+            try:
+                done = 0
+                while done < 10:
+                    try:
+                        allocated.extend(ids.allocate("detection.tray", 3))
+                        done += 1
+                    except OperationalError as e:
+                        # SQLite's shared-cache test database refuses a locked table instead of waiting
+                        if "locked" not in str(e):
+                            raise
+                        time.sleep(0.001)
+            except Exception as e:  # surfaced below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(allocated), 120)
+        self.assertEqual(len(set(allocated)), 120)
+
+    def test_assign_fills_only_missing_ids(self):
+        station = ServiceStation.objects.create(name="North")
+        units = ids.assign([Unit(station=station, name="A"), Unit(station=station, name="B", unit_id="U900")])
+        self.assertEqual([u.unit_id for u in units][1], "U900")
+        self.assertRegex(units[0].unit_id, r"^U\d{3,}$")
+
+
+class ToolSearchTests(TestCase):
+    def setUp(self):
+        self.spanner = ToolCreation.objects.create(tool_id="TL-1", tool_name="Spanner 10 inch", brand="Stanley")
+        self.socket = ToolCreation.objects.create(tool_id="TL-2", tool_name="Socket set", brand="Spanco",
+                                                  part_number="SP_100")
+        ToolCreation.objects.create(tool_id="TL-3", tool_name="Hammer", brand="Bosch")
+
+    def test_every_term_is_a_prefix_match(self):
+        self.assertEqual(search.tool_ids("span"), [self.spanner.id, self.socket.id])  # name outranks brand
+        self.assertEqual(search.tool_ids("span inch"), [self.spanner.id])
+        self.assertEqual(search.tool_ids("span", limit=1), [self.spanner.id])
+        self.assertEqual(search.tool_ids("%"), [])
+        self.assertEqual(search.tool_ids("sp_1"), [self.socket.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        ToolCreation.objects.filter(pk=self.spanner.pk).update(tool_name="Wrench")
+        self.assertEqual(search.tool_ids("wrench"), [self.spanner.id])
+        self.assertEqual(search.tool_ids("spanner"), [])
+        self.socket.delete()
+        self.assertEqual(search.tool_ids("socket"), [])
+
+    def test_api(self):
+        Inventory.objects.create(tool=self.spanner, total_quantity=3, in_stock=3)
+        body = self.client.get("/api/tools/search/", {"q": "span", "limit": 5}).json()
+        self.assertEqual([(r["tool_id"], r["in_stock"]) for r in body["results"]], [("TL-1", 3), ("TL-2", None)])
+        self.assertEqual(self.client.get("/api/tools/search/", {"q": "  "}).json()["results"], [])
+
+    def test_assign_page_caps_the_matches(self):
+        user = User.objects.create_superuser("root", password="pw")
+        self.client.force_login(user)
+        tray = Tray.objects.create(unit=Unit.objects.create(station=ServiceStation.objects.create(name="N"), name="U"),
+                                   tray_name="T")
+        for tool in ToolCreation.objects.all():
+            Inventory.objects.create(tool=tool, total_quantity=1, in_stock=1)
+        with mock.patch.object(search, "MAX_RESULTS", 1):
+            response = self.client.get(f"/trays/{tray.id}/assign-tools/", {"search": "span"})
+        self.assertEqual([i.tool_id for i in response.context["inventory_items"]], [self.spanner.id])
+
+
+class CatalogImportTests(TestCase):
+    HEADER = "tool_id,tool_name,brand,supplier_name,invoice_number,quantity,unit_cost,purchase_date\n"
+
+    def run_import(self, body, **kwargs):
+        return catalog_import.import_file(io.BytesIO((self.HEADER + body).encode()), "tools.csv", **kwargs)
+
+    def test_imports_tools_purchases_and_inventory_and_reports_bad_rows(self):
+        summary = self.run_import(
+            "TL1,Spanner,Acme,Sup,INV-1,4,2.5,2026-01-02\n"
+            "TL2,Hammer,,,,,,\n"
+            "TL3,Pliers,,Sup,INV-2,-1,1,2026-01-02\n"  # negative quantity
+            "TL9,,,Sup,INV-3,1,1,2026-01-02\n"  # unknown tool without a name
+            "TL1,,,Sup,INV-4,1,2,not-a-date\n"
+        )
+        self.assertEqual((summary["rows"], summary["tools_created"], summary["purchases"]), (2, 2, 1))
+        self.assertEqual([e["row"] for e in summary["errors"]], [4, 5, 6])
+        self.assertEqual(Inventory.objects.get(tool__tool_id="TL1").total_quantity, 4)
+        self.assertFalse(Inventory.objects.filter(tool__tool_id="TL2").exists())
+
+    def test_reimport_updates_in_place_and_adds_stock(self):
+        self.run_import("TL1,Spanner,Acme,Sup,INV-1,4,2.5,2026-01-02\n")
+        summary = self.run_import("TL1,Spanner XL,,Sup,INV-2,3,2.5,2026-02-01\nTL1,,,Sup,INV-3,1,2.5,2026-02-01\n")
+
+        self.assertEqual((summary["tools_created"], summary["tools_updated"], summary["inventory_updated"]), (0, 1, 1))
+        tool = ToolCreation.objects.get(tool_id="TL1")
+        self.assertEqual((tool.tool_name, tool.brand), ("Spanner XL", "Acme"))  # blank brand kept
+        inventory = Inventory.objects.get(tool=tool)
+        self.assertEqual((inventory.total_quantity, inventory.in_stock), (8, 8))
+        self.assertEqual(ToolPurchase.objects.filter(tool=tool).count(), 3)
+
+    def test_dry_run_writes_nothing(self):
+        summary = self.run_import("TL1,Spanner,Acme,Sup,INV-1,4,2.5,2026-01-02\n", dry_run=True)
+        self.assertEqual(summary["rows"], 1)
+        self.assertFalse(ToolCreation.objects.exists())
+
+
+class ExportTests(TestCase):
+    databases = "__all__"  # the export view is marked @replica_reads
+
+    def setUp(self):
+        start = timezone.make_aware(datetime.datetime(2026, 1, 1))
+        ToolsTracking.objects.bulk_create([
+            ToolsTracking(device_id=f"cam-{i % 2}", tool_name="spanner", confidence=0.5,
+                          timestamp=start + datetime.timedelta(hours=i), frame_id=str(i))
+            for i in range(6)
+        ])
+
+    def test_filters_and_formats(self):
+        rows = exports.queryset("detections", end="2026-01-01T04:00:00Z", device_id="cam-0")
+        lines = b"".join(exports.stream("detections", rows, "ndjson")).decode().splitlines()
+        self.assertEqual([json.loads(line)["frame_id"] for line in lines], ["0", "2"])
+
+        csv_lines = b"".join(exports.stream("detections", rows, "csv", chunk_size=1)).decode().splitlines()
+        self.assertEqual(csv_lines[0], ",".join(exports.DATASETS["detections"][1]))
+        self.assertEqual(len(csv_lines), 3)
+
+        with self.assertRaises(exports.ExportError):
+            exports.queryset("detections", event="tool_Issued")
+
+    def test_view_streams_gzip(self):
+        User.objects.create_user("sam", password="pw")
+        self.client.login(username="sam", password="pw")
+        self.client.cookies[db_router.STICKY_COOKIE] = str(time.time() + 60)  # read the primary
+
+        response = self.client.get("/api/export/detections/", {"format": "ndjson", "gzip": "1", "device_id": "cam-1"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('filename="detections.ndjson.gz"', response["Content-Disposition"])
+        body = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual([json.loads(line)["frame_id"] for line in body.splitlines()], ["1", "3", "5"])
+
+        self.assertEqual(self.client.get("/api/export/nothing/").status_code, 400)
+
+    def test_benchmark_requests_every_route(self):
+        station = ServiceStation.objects.create(name="North")
+        Tray.objects.create(unit=Unit.objects.create(station=station, name="Unit"), tray_name="Tray")
+        names = {name for name, _, _, _ in benchmarks.route_requests()}
+        self.assertIn("export", names)
+        self.assertFalse(names & benchmarks.SKIP)
+
+
+class DetectionRollupTests(TestCase):
+    def snapshot(self):
+        return {
+            level: sorted(model.objects.values_list(
+                "bucket", "device_id", "tool_name", "count", "confidence_min", "confidence_max"))
+            for level, model in rollups.LEVELS.items()
+        }
+
+    def test_recorded_batches_match_a_backfill(self):
+        start = timezone.make_aware(datetime.datetime(2026, 1, 1, 23, 58))
+        rows = ToolsTracking.objects.bulk_create([
+            ToolsTracking(device_id=f"cam-{i % 2}", tool_name="spanner", confidence=0.1 * (i + 1),
+                          timestamp=start + datetime.timedelta(seconds=50 * i), frame_id=str(i))
+            for i in range(8)  # crosses midnight
+        ])
+        rollups.record(rows[:5])
+        rollups.record(rows[5:])
+        recorded = self.snapshot()
+        self.assertEqual(sum(r[3] for r in recorded["day"]), 8)
+        self.assertEqual(len(recorded["day"]), 4)
+
+        self.assertEqual(rollups.backfill(), len(recorded["minute"]))
+        self.assertEqual(self.snapshot(), recorded)
+
+    def test_choose_level(self):
+        day = timezone.make_aware(datetime.datetime(2026, 1, 1))
+        cases = [
+            (day, day + datetime.timedelta(days=2), "day"),
+            (day + datetime.timedelta(hours=1), day + datetime.timedelta(hours=5), "hour"),
+            (day + datetime.timedelta(minutes=1), day + datetime.timedelta(hours=5), "minute"),
+            # 2000 minutes is too many points, so whole hours
+            (day + datetime.timedelta(minutes=1), day + datetime.timedelta(minutes=2001), "hour"),
+        ]
+        for start, end, level in cases:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(rollups.choose_level(start, end, max_points=1000), level)
+
+
+class InventoryProjectorTests(TestCase):
+    def setUp(self):
+        tool = ToolCreation.objects.create(tool_id="TL1", tool_name="Spanner")
+        self.inventory = Inventory.objects.create(tool=tool, total_quantity=5, in_stock=5, available_quantity=5)
+
+    def events(self, *names, tool_id="TL1"):
+        for name in names:
+            ToolEventTracking.objects.create(timestamp=timezone.now(), event=name, tool_id=tool_id, user_id="U1")
+
+    def counters(self):
+        self.inventory.refresh_from_db()
+        return self.inventory.in_use, self.inventory.available_quantity, self.inventory.damaged
+
+    def test_events_are_applied_exactly_once_from_the_checkpoint(self):
+        self.events("tool_Issued", "tool_Issued", "tray_open", "tool_Returned", "tool_Damaged")
+        self.events("tool_Issued", tool_id="UNKNOWN")
+
+        first = projector.project_pending(batch_size=2, settle=None)
+        self.assertEqual((first["events"], first["applied"], first["skipped"]), (6, 4, 1))
+        self.assertEqual(first["checkpoint"], ToolEventTracking.objects.latest("id").id)
+        self.assertEqual(self.counters(), (1, 3, 1))
+
+        again = projector.project_pending(settle=None)
+        self.assertEqual(again["events"], 0)
+        self.assertEqual(self.counters(), (1, 3, 1))
+
+        self.events("tool_Returned")
+        projector.project_pending(settle=None)
+        self.assertEqual(self.counters(), (0, 4, 1))
+
+    def test_unsettled_events_wait(self):
+        self.events("tool_Issued")
+        self.assertEqual(projector.project_pending()["events"], 0)
+        self.assertEqual(self.counters(), (0, 5, 0))
+
+    def event(self, id, name):
+        ToolEventTracking.objects.create(id=id, timestamp=timezone.now(), event=name, tool_id="TL1", user_id="U1")
+
+    def test_late_commit_below_the_checkpoint_is_applied(self):
+        self.events("tool_Issued")
+        start = projector.project_pending(settle=None)["checkpoint"]
+
+        # start + 1 was allocated first but commits after start + 2 is consumed
+        self.event(start + 2, "tool_Issued")
+        passed = projector.project_pending(settle=None)
+        self.assertEqual(passed["checkpoint"], start + 2)
+        self.assertEqual(self.counters(), (2, 3, 0))
+        checkpoint = ProjectorCheckpoint.objects.get(name=projector.CHECKPOINT)
+        self.assertEqual([g[:2] for g in checkpoint.gaps], [[start + 1, start + 1]])
+
+        self.event(start + 1, "tool_Damaged")
+        late = projector.project_pending(settle=None)
+        self.assertEqual((late["events"], late["applied"], late["checkpoint"]), (1, 1, start + 2))
+        self.assertEqual(self.counters(), (2, 2, 1))
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.gaps, [])
+
+        self.assertEqual(projector.project_pending(settle=None)["events"], 0)
+        self.assertEqual(self.counters(), (2, 2, 1))
+
+    def test_gaps_are_given_up_after_the_timeout(self):
+        self.events("tool_Issued")
+        start = projector.project_pending(settle=None)["checkpoint"]
+        self.event(start + 3, "tool_Issued")
+        projector.project_pending(settle=None)
+        checkpoint = ProjectorCheckpoint.objects.get(name=projector.CHECKPOINT)
+        self.assertEqual([g[:2] for g in checkpoint.gaps], [[start + 1, start + 2]])
+
+        self.event(start + 2, "tool_Returned")
+        later = timezone.now() + projector.GAP_TIMEOUT + datetime.timedelta(seconds=1)
+        with mock.patch.object(projector.timezone, "now", return_value=later):
+            self.assertEqual(projector.project_pending(settle=None)["events"], 0)
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.gaps, [])
+        self.assertEqual(self.counters(), (2, 3, 0))
+
+    def test_gap_helpers(self):
+        self.assertEqual(projector._missing(3, [4, 7, 8, 10], 1.0), [[5, 6, 1.0], [9, 9, 1.0]])
+        self.assertEqual(projector._without([[5, 9, 1.0]], [5, 7]), [[6, 6, 1.0], [8, 9, 1.0]])
+        self.assertEqual(projector._without([[5, 6, 1.0]], [5, 6]), [])
+
+
+class InventoryFeedTests(TestCase):
+    def test_a_burst_of_changes_is_paged_through(self):
+        tool = ToolCreation.objects.create(tool_id="TL1", tool_name="Spanner")
+        Inventory.objects.bulk_create(ids.assign([Inventory(tool=tool) for _ in range(inventory_feed.MAX_ROWS + 20)]))
+        changed = timezone.now()
+        Inventory.objects.update(last_updated=changed)  # one projector batch
+
+        cursor, seen, pages = inventory_feed.encode_cursor(changed - datetime.timedelta(minutes=1)), set(), 0
+        while True:
+            rows, cursor = inventory_feed.changes_since(cursor)
+            if not rows:
+                break
+            seen.update(row["inventoryId"] for row in rows)
+            pages += 1
+            self.assertLess(pages, 5)
+        self.assertEqual(len(seen), inventory_feed.MAX_ROWS + 20)
+        self.assertEqual(cursor, inventory_feed.current_cursor())
+
+    def test_sse_is_off_under_wsgi(self):
+        self.assertEqual(self.client.get("/inventory/stream/").status_code, 204)
+
+
+@skipUnless("replica" in settings.DATABASES, "needs a replica alias (DJANGO_DB=sqlite)")
+class ReplicaRoutingTests(TestCase):
+    """Primary and replica are separate SQLite databases here (DJANGO_DB=sqlite)."""
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        # Present only on the replica, so a read that finds it went there
+        ServiceStation.objects.using("replica").create(name="Replica only")
+        self.factory = RequestFactory()
+
+    def run_view(self, view, request=None, replica=True):
+        if replica:
+            view = db_router.replica_reads(view)
+        return ReplicaRoutingMiddleware(view)(request or self.factory.get("/"))
+
+    def station_names(self, request):
+        return HttpResponse(",".join(ServiceStation.objects.order_by("id").values_list("name", flat=True)))
+
+    def test_marked_view_reads_from_replica(self):
+        response = self.run_view(self.station_names)
+        self.assertEqual(response.content, b"Replica only")
+        self.assertNotIn(db_router.STICKY_COOKIE, response.cookies)
+
+    def test_unmarked_view_and_writes_use_primary(self):
+        self.assertEqual(self.run_view(self.station_names, replica=False).content, b"")
+        self.assertEqual(self.run_view(self.station_names, self.factory.post("/")).content, b"")
+
+    def test_reads_after_a_write_use_primary_and_stick(self):
+        def write_then_read(request):
+            ServiceStation.objects.create(name="Primary")
+            return self.station_names(request)
+
+        response = self.run_view(write_then_read)
+        self.assertEqual(response.content, b"Primary")
+        cookie = response.cookies[db_router.STICKY_COOKIE]
+
+        request = self.factory.get("/")
+        request.COOKIES[db_router.STICKY_COOKIE] = cookie.value
+        self.assertEqual(self.run_view(self.station_names, request).content, b"Primary")
+
+        request.COOKIES[db_router.STICKY_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.run_view(self.station_names, request).content, b"Replica only")
+
+    async def test_async_requests_route_in_their_own_context(self):
+        @sync_to_async
+        def write_then_read():
+            ServiceStation.objects.create(name="Primary")
+            return ",".join(ServiceStation.objects.order_by("id").values_list("name", flat=True))
+
+        async def view(request):
+            self.assertIsNotNone(db_router._current.get())
+            return HttpResponse(await write_then_read())
+
+        middleware = ReplicaRoutingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get("/"))
+        self.assertEqual(response.content, b"Primary")
+        self.assertIn(db_router.STICKY_COOKIE, response.cookies)
+        self.assertIsNone(db_router._current.get())
+
+
+def _png(width, height, shade=0):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    pixels = b"".join(b"\x00" + bytes([shade]) * width * 3 for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(pixels)) + chunk(b"IEND", b""))
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def make_batcher(self, runner=None, **kwargs):
+        batcher = inference.MicroBatcher(runner or inference.StubRunner(batch_ms=20), **kwargs)
+        self.addCleanup(batcher.stop)
+        return batcher
+
+    def test_concurrent_frames_share_forward_passes(self):
+        batcher = self.make_batcher(max_batch=4, max_wait=0.05)
+        frames = [_png(32, 24, shade) for shade in range(8)]
+        results = [None] * len(frames)
+
+        def detect(i):
+            results[i] = batcher.detect(frames[i], timeout=5)
+
+        threads = [threading.Thread(target=detect, args=(i,)) for i in range(len(frames))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = batcher.stats()
+        self.assertEqual(stats["frames"], 8)
+        self.assertLess(stats["batches"], 8)
+        self.assertLessEqual(stats["largest_batch"], 4)
+        # Every caller gets the answer for its own frame
+        self.assertEqual(results, [batcher.runner.predict([batcher.runner.prepare(f)])[0] for f in frames])
+
+    def test_rejects_unreadable_frames_and_reports_model_errors(self):
+        class Broken(inference.StubRunner):
+            def predict(self, frames):
+                raise RuntimeError("model crashed")
+
+        with self.assertRaises(inference.InferenceError):
+            self.make_batcher().detect(b"not an image")
+        with self.assertLogs("detection.inference", "ERROR"), self.assertRaisesMessage(RuntimeError, "model crashed"):
+            self.make_batcher(Broken()).detect(_png(8, 8), timeout=5)
+
+
+@skipUnless(preprocess.np is not None, "needs numpy and Pillow")
+class FramePoolTests(SimpleTestCase):
+    def test_letterboxes_into_shared_slots(self):
+        pool = preprocess.FramePool(32, 32, slots=2, workers=1)
+        self.addCleanup(pool.close)
+
+        slot, geometry = pool.prepare(_png(64, 32, shade=255), timeout=30)
+        self.assertEqual(geometry, (0.5, 0, 8, 64, 32))
+        tensor = pool.tensor(slot)
+        self.assertAlmostEqual(float(tensor[0, 0, 0]), preprocess.PAD, places=5)  # padding row
+        self.assertAlmostEqual(float(tensor[0, 16, 16]), 1.0, places=5)
+        del tensor
+        pool.release(slot)
+
+        with self.assertRaises(ValueError):
+            pool.prepare(b"not an image", timeout=30)
+        # Both slots are free again
+        self.assertEqual(pool._free.qsize(), 2)
+
+    def test_restarts_after_a_worker_dies(self):
+        pool = preprocess.FramePool(32, 32, slots=2, workers=1)
+        self.addCleanup(pool.close)
+        pool.release(pool.prepare(_png(8, 8), timeout=30)[0])
+        broken = pool.pool
+
+        for process in list(broken._processes.values()):
+            process.kill()
+        with self.assertRaises(preprocess.WorkerCrashed):
+            pool.prepare(_png(8, 8), timeout=30)
+        self.assertIsNot(pool.pool, broken)
+        self.assertEqual(pool._free.qsize(), 2)
+
+        slot, geometry = pool.prepare(_png(8, 8), timeout=30)
+        self.assertEqual(geometry, (4.0, 0, 0, 8, 8))
+        pool.release(slot)
+
+    def test_kills_and_restarts_a_hung_worker(self):
+        pool = preprocess.FramePool(32, 32, slots=2, workers=1, frame_timeout=30)
+        self.addCleanup(pool.close)
+        pool.release(pool.prepare(_png(8, 8), timeout=30)[0])  # spawns the worker
+        hung = pool.pool
+        pool.frame_timeout = 0.1
+        processes = list(hung._processes.values())
+
+        with mock.patch.object(hung, "submit", return_value=futures.Future()):
+            with self.assertRaisesMessage(preprocess.WorkerCrashed, "hung"):
+                pool.prepare(_png(8, 8), timeout=30)
+        self.assertIsNot(pool.pool, hung)
+        self.assertTrue(all(process.exitcode is not None for process in processes))
+        self.assertEqual(pool._free.qsize(), 2)
+
+        pool.frame_timeout = 30
+        slot, geometry = pool.prepare(_png(8, 8), timeout=30)
+        self.assertEqual(geometry, (4.0, 0, 0, 8, 8))
+        pool.release(slot)
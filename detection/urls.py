@@ -5,20 +5,37 @@ urlpatterns = [
     path('', views.login_view, name='login'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('dashboard/tool-activity/', views.tool_activity_dashboard, name='tool_activity_dashboard'),
+    path('dashboard/tool-activity/summary/', views.tool_activity_summary_api, name='tool_activity_summary_api'),
     path('inventory/', views.inventory_view, name='inventory'),
     path('tool_creation/', views.tool_creation_view, name='tool_creation'),
     path('tool_purchase/', views.tool_purchase_view, name='tool_purchase'),
+    path('tool_import/', views.tool_import_view, name='tool_import'),
+    path('api/tools/search/', views.tool_search_api, name='tool_search_api'),
     path('service-stations/create/', views.create_service_station, name='create_service_station'),
     path('service-stations/', views.service_station_list, name='service_station_list'),
     path('service-stations/<int:station_id>/units/create/', views.create_unit, name='create_unit'),
     path('units/<int:unit_id>/trays/create/', views.create_tray, name='create_tray'),
     path('trays/<int:tray_id>/assign-tools/', views.assign_tools, name='assign_tools'),
+    path('api/trays/<int:tray_id>/assign/', views.assign_tools_api, name='assign_tools_api'),
     path('trays/<int:tray_id>/assigned-tools/', views.assigned_tools_list, name='assigned_tools_list'),
     path('assigned-tools/', views.global_assigned_tools, name='global_assigned_tools'),
+    path('api/hierarchy/', views.hierarchy_api, name='hierarchy_api'),
     path('users/manage/', views.manage_users, name='manage_users'),
     path('users/assigned/', views.user_assigned_list, name='user_assigned_list'),
     path('inventory/update/', views.inventory_update_api, name='inventory_update_api'),
+    path('inventory/stream/', views.inventory_stream, name='inventory_stream'),
+    path('inventory/changes/', views.inventory_changes_api, name='inventory_changes_api'),
     path('api/detections/', views.receive_detections, name='receive_detections'),
+    path('api/detections/async/', views.receive_detections_async, name='receive_detections_async'),
+    path('api/detections/queue/', views.detection_queue_stats, name='detection_queue_stats'),
+    path('api/detections/analytics/', views.detection_analytics_api, name='detection_analytics_api'),
+    path('object-detection/', views.object_detection, name='object_detection'),
+    path('api/detect/', views.detect_api, name='detect_api'),
     path('tools-tracking/', views.tools_tracking_list, name='tools_tracking_list'),
+    path('api/tools-tracking/', views.tools_tracking_api, name='tools_tracking_api'),
+    path('api/tool-events/', views.tool_events_api, name='tool_events_api'),
+    path('api/export/<str:dataset>/', views.export_view, name='export'),
+    path('debug/sql/', views.sql_report, name='sql_report'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('logout/', views.logout_view, name='logout'),
 ]
\ No newline at end of file
@@ -0,0 +1,107 @@
+from collections import defaultdict, deque
+
+from django.db import transaction
+
+from .models import ToolEventTracking, ToolUsageSession
+
+ISSUED = 'tool_Issued'
+RETURNED = 'tool_Returned'
+
+OPENED = 'opened'
+CLOSED = 'closed'
+
+
+def apply_event(event):
+    """
+    Opens a session for a tool_Issued event, or closes the oldest open session
+    of the same user and tool for a tool_Returned event. Other events are
+    ignored. A return with no matching open session is dropped; the backfill
+    command rebuilds everything from history if events arrive out of order.
+
+    Returns OPENED, CLOSED or None so callers can keep derived counters in step.
+    """
+    if event.event == ISSUED:
+        _, created = ToolUsageSession.objects.get_or_create(
+            issued_event=event,
+            defaults={
+                'user_id': event.user_id,
+                'user_name': event.user_name,
+                'tool_id': event.tool_id,
+                'tool_name': event.tool_name,
+                'issued_at': event.timestamp,
+            },
+        )
+        return OPENED if created else None
+    elif event.event == RETURNED:
+        with transaction.atomic():
+            session = (
+                ToolUsageSession.objects.select_for_update()
+                .filter(user_id=event.user_id, tool_id=event.tool_id,
+                        returned_at__isnull=True, issued_at__lt=event.timestamp)
+                .order_by('issued_at', 'id')
+                .first()
+            )
+            if session:
+                session.returned_event = event
+                session.returned_at = event.timestamp
+                session.duration = event.timestamp - session.issued_at
+                session.save(update_fields=['returned_event', 'returned_at', 'duration'])
+                return CLOSED
+    return None
+
+
+def rebuild_sessions(chunk_size=2000, stdout=None):
+    """
+    Recreates ToolUsageSession from the full event history in a single ordered
+    pass. Only open sessions are held in memory; closed ones are written out
+    in chunks of ``chunk_size``.
+    """
+    events = (
+        ToolEventTracking.objects.filter(event__in=[ISSUED, RETURNED])
+        .order_by('timestamp', 'id')
+        .only('id', 'event', 'timestamp', 'user_id', 'user_name', 'tool_id', 'tool_name')
+    )
+    open_sessions = defaultdict(deque)
+    pending = []
+    written = 0
+
+    def write(rows):
+        ToolUsageSession.objects.bulk_create(rows, batch_size=chunk_size)
+        return len(rows)
+
+    with transaction.atomic():
+        ToolUsageSession.objects.all().delete()
+
+        for event in events.iterator(chunk_size=chunk_size):
+            key = (event.user_id, event.tool_id)
+            if event.event == ISSUED:
+                open_sessions[key].append(ToolUsageSession(
+                    user_id=event.user_id,
+                    user_name=event.user_name,
+                    tool_id=event.tool_id,
+                    tool_name=event.tool_name,
+                    issued_event_id=event.id,
+                    issued_at=event.timestamp,
+                ))
+                continue
+
+            queue = open_sessions.get(key)
+            if not queue or queue[0].issued_at >= event.timestamp:
+                continue
+            session = queue.popleft()
+            if not queue:
+                del open_sessions[key]
+            session.returned_event_id = event.id
+            session.returned_at = event.timestamp
+            session.duration = event.timestamp - session.issued_at
+            pending.append(session)
+            if len(pending) >= chunk_size:
+                written += write(pending)
+                pending = []
+                if stdout:
+                    stdout.write(f"  {written} sessions written")
+
+        pending.extend(s for queue in open_sessions.values() for s in queue)
+        written += write(pending)
+
+    return written
@@ -1,16 +1,29 @@
+import datetime
 import json
+import time
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.utils.timezone import now
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 from .models import ToolCreation, ToolPurchase, UserProfile
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.models import User
-from .models import ToolsTracking, ToolEventTracking
+from django.db import transaction
+from .models import ToolsTracking, ToolEventTracking, ToolUsageSession
+from . import (
+    assignment, catalog_import, exports, hierarchy, inference, ingest, inventory_feed, metrics, projector,
+    response_cache, rollups, scope, search, stats,
+)
+from . import middleware as sql_middleware
+from .db_router import replica_reads
+from .pagination import keyset_page
+from .response_cache import cached_view
+from .ingest_queue import write_behind
 
 def login_view(request):
     if request.method == 'POST':
@@ -34,75 +47,66 @@ def logout_view(request):
 def dashboard(request):
     return render(request, 'dashboard.html')
 
+@replica_reads
 def tool_activity_dashboard(request):
-    # All events ordered by latest
-    events_list = ToolEventTracking.objects.all().order_by('-timestamp')
-
-    # Pagination for events (25 per page)
-    events_paginator = Paginator(events_list, 10)
-    page_number = request.GET.get('events_page', 1)
-    events_page = events_paginator.get_page(page_number)
-
-    # Calculate Tool Usage Duration
-    durations_list = []
-    issued_events = ToolEventTracking.objects.filter(event='tool_Issued').order_by('timestamp')
-    for issued in issued_events:
-        returned = ToolEventTracking.objects.filter(
-            user_id=issued.user_id,
-            tool_id=issued.tool_id,
-            event='tool_Returned',
-            timestamp__gt=issued.timestamp
-        ).order_by('timestamp').first()
-        if returned:
-            duration = returned.timestamp - issued.timestamp
-            durations_list.append({
-                'user_name': issued.user_name,
-                'tool_name': issued.tool_name,
-                'issued_at': issued.timestamp,
-                'returned_at': returned.timestamp,
-                'duration_in_use': duration,
-            })
+    # Latest events first, cursor-paginated on (timestamp, id)
+    events_page = keyset_page(ToolEventTracking.objects.all(), request.GET.get('events_cursor'), per_page=10)
+
+    # Tool Usage Duration, from the incrementally maintained sessions
+    durations_list = ToolUsageSession.objects.filter(returned_at__isnull=False).order_by('issued_at', 'id')
 
     # Pagination for durations (25 per page)
     durations_paginator = Paginator(durations_list, 10)
     durations_page_number = request.GET.get('durations_page', 1)
     durations_page = durations_paginator.get_page(durations_page_number)
 
-    # Summary calculations
-    today = timezone.now().date()
-    todays_events = ToolEventTracking.objects.filter(timestamp__date=today)
-    total_events = todays_events.count()
-
-    # Active tools currently in use (issued not returned)
-    active_tools_count = 0
-    active_users_set = set()
-    issued_events_all = ToolEventTracking.objects.filter(event='tool_Issued')
-    for issued in issued_events_all:
-        returned_exists = ToolEventTracking.objects.filter(
-            user_id=issued.user_id,
-            tool_id=issued.tool_id,
-            event='tool_Returned',
-            timestamp__gt=issued.timestamp
-        ).exists()
-        if not returned_exists:
-            active_tools_count += 1
-            active_users_set.add(issued.user_id)
-
-    active_users = len(active_users_set)
-
-    # Damaged tools
-    damaged_tools = ToolEventTracking.objects.filter(event='tool_Damaged').values('tool_id').count()
+    # Summary cards come from the materialized counters (detection/stats.py)
+    summary = stats.summary()
 
     context = {
         'events': events_page,
         'durations': durations_page,
-        'total_events': total_events,
-        'active_users': active_users,
-        'active_tools': active_tools_count,
-        'damaged_tools': damaged_tools,
+        'total_events': summary['total_events'],
+        'active_users': summary['active_users'],
+        'active_tools': summary['active_tools'],
+        'damaged_tools': summary['damaged_tools'],
     }
     return render(request, 'tool_activity_dashboard.html', context)
 
+def tool_activity_summary_api(request):
+    return JsonResponse(stats.summary())
+
+def _event_json(e):
+    return {
+        'id': e.id,
+        'timestamp': e.timestamp,
+        'user_id': e.user_id,
+        'user_name': e.user_name,
+        'event': e.event,
+        'tray_id': e.tray_id,
+        'unit_id': e.unit_id,
+        'tool_id': e.tool_id,
+        'tool_name': e.tool_name,
+    }
+
+def _page_size(request, default=50, maximum=500):
+    try:
+        return max(1, min(int(request.GET.get('limit', default)), maximum))
+    except ValueError:
+        return default
+
+def tool_events_api(request):
+    events = ToolEventTracking.objects.all()
+    if request.GET.get('event'):
+        events = events.filter(event=request.GET['event'])
+    page = keyset_page(events, request.GET.get('cursor'), per_page=_page_size(request))
+    return JsonResponse({
+        'results': [_event_json(e) for e in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+@cached_view('tools')
 def tool_creation_view(request):
     if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         tool_id = request.POST.get('tool_id')
@@ -133,6 +137,46 @@ def tool_creation_view(request):
     tools = ToolCreation.objects.all().order_by('-created_at')
     return render(request, 'tool_creation.html', {'tools': tools})
 
+@login_required
+def tool_import_view(request):
+    # Bulk CSV/XLSX upload of tools and purchases (see detection/catalog_import.py)
+    if request.method != 'POST':
+        return JsonResponse({"detail": "Only POST allowed"}, status=405)
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({"detail": "No file uploaded"}, status=400)
+    try:
+        rows = catalog_import.iter_file(upload.file, upload.name)
+    except catalog_import.ImportFileError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    summary = catalog_import.import_rows(rows, dry_run=request.POST.get('dry_run') == '1')
+    status = 400 if "aborted" in summary else 200
+    return JsonResponse({"status": "ok" if status == 200 else "partial", **summary}, status=status)
+
+def tool_search_api(request):
+    # Typeahead: top matches for ?q=, best first
+    started = time.perf_counter()
+    tools = search.search_tools(request.GET.get('q', ''), limit=_page_size(request, default=10, maximum=50))
+    stock = dict(
+        Inventory.objects.filter(tool__in=tools).order_by('-inventory_id').values_list('tool_id', 'in_stock')
+    ) if tools else {}
+    return JsonResponse({
+        'results': [
+            {
+                'id': t.id,
+                'tool_id': t.tool_id,
+                'tool_name': t.tool_name,
+                'part_number': t.part_number,
+                'brand': t.brand,
+                'tool_type': t.tool_type,
+                'in_stock': stock.get(t.id),
+            }
+            for t in tools
+        ],
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
 @csrf_exempt
 def tool_purchase_view(request):
     if request.method == 'POST':
@@ -175,6 +219,7 @@ def tool_purchase_view(request):
 
     return JsonResponse({'status': 'invalid', 'message': 'Invalid request method'})
 
+@cached_view('inventory')
 def inventory_view(request):
     inventory_items = Inventory.objects.select_related('tool').all()
 
@@ -198,7 +243,32 @@ def inventory_view(request):
             'lastUpdated': item.last_updated.strftime('%Y-%m-%d %H:%M'),
             'remarks': item.remarks or '',
         })
-    return render(request, 'inventory.html', {'inventory_data': inventory_data})
+    return render(request, 'inventory.html', {
+        'inventory_data': inventory_data,
+        'inventory_cursor': inventory_feed.current_cursor(),
+        'inventory_sse': inventory_feed.SSE_ENABLED,
+    })
+
+# Inventory change feed. Both endpoints take a (last_updated, inventory_id)
+# cursor and only send rows that changed after it. The SSE stream needs ASGI
+# (INVENTORY_FEED_SSE); the long-poll variant works under WSGI as well.
+async def inventory_stream(request):
+    if not inventory_feed.SSE_ENABLED:
+        # 204 tells EventSource to stop reconnecting
+        return HttpResponse(status=204)
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('since', '')
+    response = StreamingHttpResponse(inventory_feed.sse_events(cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def inventory_changes_api(request):
+    try:
+        wait = max(0.0, min(float(request.GET.get('wait', 25)), 55))
+    except ValueError:
+        wait = 25
+    rows, cursor = inventory_feed.wait_for_changes(request.GET.get('since', ''), wait)
+    return JsonResponse({'changes': rows, 'cursor': cursor})
 
 @login_required
 def create_service_station(request):
@@ -222,6 +292,7 @@ def create_service_station(request):
 
 
 @login_required
+@cached_view('stations')
 def service_station_list(request):
     stations = ServiceStation.objects.all().order_by('id')
     users = User.objects.all()  # For incharge dropdown if using modal
@@ -301,24 +372,23 @@ def create_tray(request, unit_id):
     }
     return render(request, 'create_tray.html', context)
 
+@login_required
 def assign_tools(request, tray_id):
     tray = get_object_or_404(Tray, id=tray_id)
+    permitted = scope.permitted_tray_ids(request)
+    if permitted is not None and tray.id not in permitted:
+        return HttpResponse("Tray is outside your access scope", status=403)
     search_query = request.GET.get('search', '')
 
     # Join Inventory with ToolCreation
     inventory_items = Inventory.objects.select_related('tool').all()
 
-    # Apply search filter
+    # Apply search filter (indexed, see detection/search.py)
     if search_query:
-        inventory_items = inventory_items.filter(
-            Q(tool__tool_name__icontains=search_query) |
-            Q(tool__tool_id__icontains=search_query) |
-            Q(tool__part_number__icontains=search_query) |
-            Q(tool__brand__icontains=search_query) |
-            Q(tool__tool_type__icontains=search_query)
-        )
+        inventory_items = inventory_items.filter(tool_id__in=search.tool_ids(search_query, search.MAX_RESULTS))
 
     if request.method == 'POST':
+        items = []
         for key, value in request.POST.items():
             if not key.startswith('assign_qty_'):
                 continue
@@ -336,33 +406,15 @@ def assign_tools(request, tray_id):
             if assign_qty <= 0:
                 continue
 
-            remarks = request.POST.get(f'remarks_{inventory_id}', '').strip()
-            inventory_item = get_object_or_404(Inventory, inventory_id=inventory_id)
-            tool = inventory_item.tool
-
-            # Validate stock
-            if assign_qty > inventory_item.in_stock:
-                messages.error(
-                    request,
-                    f"Cannot assign {assign_qty} units of {tool.tool_name}. "
-                    f"Only {inventory_item.in_stock} available."
-                )
-                continue  # Skip instead of full redirect
-
-            # Deduct stock
-            inventory_item.in_stock -= assign_qty
-            inventory_item.assigned_quantity += assign_qty
-            inventory_item.available_quantity = inventory_item.assigned_quantity
-            inventory_item.save()
-
-            # Create TrayTool record
-            TrayTool.objects.create(
-                tray=tray,
-                inventory=inventory_item,
-                assigned_quantity=assign_qty,
-                remarks=remarks,
-                assigned_by=request.user if request.user.is_authenticated else None
-            )
+            items.append((inventory_id, assign_qty, request.POST.get(f'remarks_{inventory_id}', '').strip()))
+
+        # All or nothing: one locked batch (see detection/assignment.py)
+        try:
+            assignment.assign_batch(tray, items, assigned_by=request.user)
+        except assignment.AssignmentError as e:
+            for error in e.errors:
+                messages.error(request, error["detail"])
+            return redirect('assign_tools', tray_id=tray.id)
 
         messages.success(request, "Tools assigned successfully!")
         return redirect('assign_tools', tray_id=tray.id)
@@ -374,11 +426,45 @@ def assign_tools(request, tray_id):
     }
     return render(request, 'assign_tools.html', context)
 
+def assign_tools_api(request, tray_id):
+    # JSON batch assignment: {"items": [{"inventory_id", "quantity", "remarks"?}, ...]}
+    if request.method != "POST":
+        return JsonResponse({"detail": "Only POST allowed"}, status=405)
+    if not request.user.is_authenticated:
+        return JsonResponse({"detail": "Unauthorized"}, status=401)
+
+    tray = get_object_or_404(Tray, id=tray_id)
+    permitted = scope.permitted_tray_ids(request)
+    if permitted is not None and tray.id not in permitted:
+        return JsonResponse({"detail": "Tray is outside your access scope"}, status=403)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"detail": "Invalid JSON"}, status=400)
+
+    try:
+        items = assignment.parse_items(data.get("items") if isinstance(data, dict) else None)
+        rows = assignment.assign_batch(tray, items, assigned_by=request.user)
+    except assignment.AssignmentError as e:
+        return JsonResponse({"detail": str(e), "errors": e.errors}, status=409 if e.conflict else 400)
+
+    return JsonResponse({
+        "status": "ok",
+        "assigned": [
+            {"inventory_id": r.inventory.inventory_id, "quantity": r.assigned_quantity,
+             "in_stock": r.inventory.in_stock}
+            for r in rows
+        ],
+    })
+
+@login_required
 def assigned_tools_list(request, tray_id):
     assigned_tools = TrayTool.objects.select_related(
         'tray', 'tray__unit', 'tray__unit__station',
         'inventory', 'inventory__tool', 'assigned_by'
     ).filter(tray_id=tray_id)
+    assigned_tools = scope.filter_by_scope(request, assigned_tools)
 
     context = {
         'assigned_tools': assigned_tools,
@@ -389,9 +475,16 @@ def assigned_tools_list(request, tray_id):
     return render(request, 'assigned_tools_list.html', context)
 
 # views.py
-from django.db.models import Q, F
 from .models import TrayTool, ServiceStation, Unit, Tray, Inventory
 
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+@login_required
+@replica_reads
 def global_assigned_tools(request):
     # Get filter parameters
     station_id = request.GET.get('station_id', '')
@@ -408,6 +501,7 @@ def global_assigned_tools(request):
         'inventory__tool',
         'assigned_by'
     ).all()
+    tray_tools = scope.filter_by_scope(request, tray_tools)
 
     # Apply main filters
     if station_id:
@@ -421,18 +515,19 @@ def global_assigned_tools(request):
     if tool_name:
         tray_tools = tray_tools.filter(inventory__tool__tool_name__icontains=tool_name)
 
-    # Populate filter dropdowns based on selected station/unit
-    stations = ServiceStation.objects.all()
-    units = Unit.objects.filter(station__id=station_id) if station_id else Unit.objects.all()
-    trays = Tray.objects.filter(unit__id=unit_id) if unit_id else Tray.objects.filter(unit__station__id=station_id) if station_id else Tray.objects.all()
-    tools = Inventory.objects.filter(inventory_id__in=tray_tools.values_list('inventory__inventory_id', flat=True))
+    # Populate filter dropdowns based on selected station/unit, from the
+    # cached hierarchy (see detection/hierarchy.py)
+    tree = hierarchy.get().scoped(scope.permitted_tray_ids(request))
+    station_pk, unit_pk = _int_or_none(station_id), _int_or_none(unit_id)
+    stations = tree.stations
+    units = tree.children('station', station_pk) if station_id else tree.units
+    trays = tree.children('unit', unit_pk) if unit_id else tree.trays_of_station(station_pk) if station_id else tree.trays
 
     context = {
         'tray_tools': tray_tools,
         'stations': stations,
         'units': units,
         'trays': trays,
-        'tools': tools,
         'filters': {
             'station_id': station_id,
             'unit_id': unit_id,
@@ -445,30 +540,43 @@ def global_assigned_tools(request):
 
 from django.contrib.auth.models import Group
 
+def hierarchy_api(request):
+    # Children of one node for cascading dropdowns: ?station=<id> gives its
+    # units, ?unit=<id> its trays, no parameter the stations.
+    if not request.user.is_authenticated:
+        return JsonResponse({"detail": "Unauthorized"}, status=401)
+    tree = hierarchy.get().scoped(scope.permitted_tray_ids(request))
+    if 'unit' in request.GET:
+        kind, node = 'unit', _int_or_none(request.GET['unit'])
+    elif 'station' in request.GET:
+        kind, node = 'station', _int_or_none(request.GET['station'])
+    else:
+        kind, node = None, None
+    if kind and node is None:
+        return JsonResponse({"detail": f"Invalid {kind} id"}, status=400)
+    return JsonResponse({"results": tree.children(kind, node)})
+
+def _scope_names(profile):
+    """Station, unit and tray names a profile covers, from prefetched relations."""
+    if profile is None or not profile.role:
+        return None
+    if profile.role == "Admin":
+        return "All", "All", "All"
+    stations = list(profile.stations.all())
+    if profile.role == "Supervisor":
+        units = [u for s in stations for u in s.units.all()]
+        trays = [t for u in units for t in u.trays.all()]
+    else:
+        units = list(profile.units.all())
+        trays = list(profile.trays.all())
+    return (
+        ", ".join(s.name for s in stations),
+        ", ".join(u.name for u in units),
+        ", ".join(t.tray_name for t in trays),
+    )
+
 @login_required
 def manage_users(request):
-    users = User.objects.all().order_by('username')
-    stations = ServiceStation.objects.all()
-    units = Unit.objects.all()
-    trays = Tray.objects.all()
-
-    # Debug: print user roles before rendering
-    for user in users:
-        profile, _ = UserProfile.objects.get_or_create(user=user)
-        group_role = user.groups.first().name if user.groups.exists() else None
-
-        if profile.role:
-            if group_role and profile.role.strip() != group_role.strip():
-                profile.role = group_role.strip()
-                profile.save()
-            user.display_role = profile.role.strip()
-        elif group_role:
-            profile.role = group_role.strip()
-            profile.save()
-            user.display_role = group_role.strip()
-        else:
-            user.display_role = "Not Assigned"
-
     if request.method == 'POST':
         user_id = request.POST.get('user_id')
         role = request.POST.get('role').strip() if request.POST.get('role') else None
@@ -477,199 +585,370 @@ def manage_users(request):
         tray_ids = request.POST.getlist('trays')
 
         user = get_object_or_404(User, id=user_id)
-        profile, _ = UserProfile.objects.get_or_create(user=user)
-        profile.role = role
-
-        # --- Assign access rules and display names ---
-        if role == "Admin":
-            all_stations = ServiceStation.objects.all()
-            all_units = Unit.objects.all()
-            all_trays = Tray.objects.all()
-
-            profile.stations_display = ", ".join([s.name for s in all_stations])
-            profile.units_display = ", ".join([u.name for u in all_units])
-            profile.trays_display = ", ".join([t.tray_name for t in all_trays])
-
-        elif role == "Supervisor":
-            selected_stations = ServiceStation.objects.filter(id__in=station_ids)
-            selected_units = Unit.objects.filter(station_id__in=station_ids)
-            selected_trays = Tray.objects.filter(unit__station_id__in=station_ids)
-
-            profile.stations_display = ", ".join([s.name for s in selected_stations])
-            profile.units_display = ", ".join([u.name for u in selected_units])
-            profile.trays_display = ", ".join([t.tray_name for t in selected_trays])
-
-        elif role == "Mechanic":
-            selected_stations = ServiceStation.objects.filter(id__in=station_ids)
-            selected_units = Unit.objects.filter(id__in=unit_ids)
-            selected_trays = Tray.objects.filter(id__in=tray_ids)
-
-            profile.stations_display = ", ".join([s.name for s in selected_stations])
-            profile.units_display = ", ".join([u.name for u in selected_units])
-            profile.trays_display = ", ".join([t.tray_name for t in selected_trays])
-
-        # Save IDs as comma-separated strings
-        profile.station_id = ",".join(station_ids) if station_ids else None
-        profile.unit_ids = ",".join(unit_ids) if unit_ids else None
-        profile.tray_id = ",".join(tray_ids) if tray_ids else None
-
-        profile.save()
-
-        # --- Sync Django group ---
-        user.groups.clear()
-        group, _ = Group.objects.get_or_create(name=role)
-        user.groups.add(group)
-        user.save()
+        with transaction.atomic():
+            profile, _ = UserProfile.objects.get_or_create(user=user)
+            profile.role = role
+            profile.save()
+
+            # --- Access scope (see detection/scope.py) ---
+            if role == "Supervisor":
+                # Units and trays follow from the stations
+                profile.stations.set(ServiceStation.objects.filter(id__in=station_ids))
+                profile.units.clear()
+                profile.trays.clear()
+            elif role == "Mechanic":
+                profile.stations.set(ServiceStation.objects.filter(id__in=station_ids))
+                profile.units.set(Unit.objects.filter(id__in=unit_ids))
+                profile.trays.set(Tray.objects.filter(id__in=tray_ids))
+            else:
+                # Admins see everything
+                profile.stations.clear()
+                profile.units.clear()
+                profile.trays.clear()
+
+            # --- Sync Django group ---
+            user.groups.clear()
+            group, _ = Group.objects.get_or_create(name=role)
+            user.groups.add(group)
 
         return redirect('manage_users')
 
+    users = list(
+        User.objects.order_by('username')
+        .select_related('userprofile')
+        .prefetch_related('groups', 'userprofile__stations', 'userprofile__units', 'userprofile__trays')
+    )
+    tree = hierarchy.get()
+
+    missing = [user for user in users if not hasattr(user, 'userprofile')]
+    if missing:
+        created = UserProfile.objects.bulk_create([UserProfile(user=user) for user in missing])
+        for user, profile in zip(missing, created):
+            user.userprofile = profile
+    new_profiles = {user.pk for user in missing}
+
+    # The Django group wins when it disagrees with the profile role
+    changed = []
+    for user in users:
+        profile = user.userprofile
+        groups = user.groups.all()
+        group_role = groups[0].name.strip() if groups else None
+        if group_role and (profile.role or '').strip() != group_role:
+            profile.role = group_role
+            changed.append(profile)
+        user.display_role = profile.role.strip() if profile.role else "Not Assigned"
+        if user.pk in new_profiles:
+            user.scope_station_ids = user.scope_unit_ids = user.scope_tray_ids = ""
+            continue
+        user.scope_station_ids = ",".join(str(s.id) for s in profile.stations.all())
+        user.scope_unit_ids = ",".join(str(u.id) for u in profile.units.all())
+        user.scope_tray_ids = ",".join(str(t.id) for t in profile.trays.all())
+    if changed:
+        UserProfile.objects.bulk_update(changed, ['role'])
+    repaired = new_profiles | {profile.user_id for profile in changed}
+    if repaired:
+        # The bulk writes above skip the signals that keep these caches in step
+        def invalidate():
+            response_cache.bump('users')
+            for user_id in repaired:
+                scope.invalidate_user(user_id)
+        transaction.on_commit(invalidate)
+
     return render(request, 'manage_users.html', {
         'users': users,
-        'stations': stations,
-        'units': units,
-        'trays': trays,
+        'stations': tree.stations,
+        'units': tree.units,
+        'trays': tree.trays,
     })
 
+@cached_view('users')
 def user_assigned_list(request):
-    users = User.objects.all().select_related('userprofile')
+    users = User.objects.all().select_related('userprofile').prefetch_related(
+        'userprofile__stations__units__trays', 'userprofile__units', 'userprofile__trays',
+    )
 
     user_data = []
     for user in users:
         profile = getattr(user, 'userprofile', None)
+        names = _scope_names(profile) or ('None', 'None', 'None')
         user_data.append({
             'id': user.id,
             'username': user.username,
             'email': user.email,
-            'role': profile.role if profile else 'Not Assigned',
-            'stations_display': profile.stations_display if profile else 'None',
-            'trays_display': profile.trays_display if profile else 'None',
-            'units_display': profile.units_display if profile else 'None',
+            'role': profile.role if profile and profile.role else 'Not Assigned',
+            'stations_display': names[0],
+            'units_display': names[1],
+            'trays_display': names[2],
         })
 
     return render(request, 'user_assigned_list.html', {'users': user_data})
 
 def inventory_update_api(request):
-    latest_event = ToolEventTracking.objects.order_by('timestamp').first()
-    if not latest_event:
-        return JsonResponse({"success": False, "error": "No recent event found"})
+    # Applies any events not yet reflected in Inventory (once each, from the
+    # projector checkpoint and its gaps) and reports what it did.
+    result = projector.project_pending(max_batches=1)
+    return JsonResponse({"success": True, **result})
+
+def _authorized(request):
+    # Simple token auth
+    return request.headers.get("Authorization") == "Bearer MY_SECRET_KEY"
+
+# Machine A - Master recevies the client detections
+@csrf_exempt
+def receive_detections(request):
+    if request.method != "POST":
+        return JsonResponse({"detail": "Only POST allowed"}, status=405)
 
-    inventory = Inventory.objects.filter(tool__tool_id=latest_event.tool_id).first()
-    if not inventory:
-        return JsonResponse({"success": False, "error": "Tool not found in inventory"})
+    if not _authorized(request):
+        return JsonResponse({"detail": "Unauthorized"}, status=401)
 
-    updated = False
+    # Backlog uploads: read the body as a stream instead of request.body
+    if request.content_type in ingest.NDJSON_CONTENT_TYPES + ingest.MSGPACK_CONTENT_TYPES:
+        return _receive_detection_stream(request)
 
-    if latest_event.event == "tool_Issued":
-        if inventory.available_quantity > 0:
-            Inventory.objects.filter(pk=inventory.pk).update(
-                in_use=F('in_use') + 1,
-                available_quantity=F('available_quantity') - 1
-            )
-            updated = True
-    elif latest_event.event == "tool_Returned":
-        if inventory.in_use > 0:
-            Inventory.objects.filter(pk=inventory.pk).update(
-                in_use=F('in_use') - 1,
-                available_quantity=F('available_quantity') + 1
-            )
-            updated = True
-    elif latest_event.event == "tool_Damaged":
-        if inventory.available_quantity > 0:
-            Inventory.objects.filter(pk=inventory.pk).update(
-                damaged=F('damaged') + 1,
-                available_quantity=F('available_quantity') - 1
-            )
-            updated = True
-
-    if updated:
-        inventory.refresh_from_db()
-        return JsonResponse({
-            "success": True,
-            "tool_id": inventory.tool_id,
-            "available_quantity": inventory.available_quantity,
-            "in_use": inventory.in_use,
-            "damaged": inventory.damaged,
-            "event": latest_event.event,
-            "timestamp": latest_event.timestamp,
-        })
+    try:
+        data = json.loads(ingest.request_body(request))
+    except json.JSONDecodeError:
+        return JsonResponse({"detail": "Invalid JSON"}, status=400)
+    except ingest.PayloadError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    # Accepts a single frame or {"frames": [...]}; everything is validated
+    # before anything is written so a bad frame rejects the whole batch.
+    try:
+        rows, acks = ingest.build_rows(data)
+    except ingest.PayloadError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    saved = ingest.save_rows(rows)
+
+    return JsonResponse({"status": "ok", "saved": saved, "frames": acks})
+
+def _receive_detection_stream(request):
+    if request.content_type in ingest.MSGPACK_CONTENT_TYPES:
+        if ingest.msgpack is None:
+            return JsonResponse({"detail": "MessagePack is not supported on this server"}, status=415)
+        documents = ingest.iter_msgpack(ingest.request_stream(request))
     else:
-        return JsonResponse({
-            "success": False,
-            "error": "No inventory update possible for this event",
-            "tool_id": inventory.tool_id,
-            "event": latest_event.event
-        })
+        documents = ingest.iter_ndjson(ingest.request_stream(request))
 
-# Machine A - Master recevies the client detections
+    summary = ingest.save_stream(documents)
+    status = 400 if "aborted" in summary else 200
+    return JsonResponse({"status": "ok" if status == 200 else "partial", **summary}, status=status)
+
+# Same payload as receive_detections, but rows are handed to the write-behind
+# queue and written by the background flusher. Serve under ASGI so a slow
+# commit never holds a worker.
 @csrf_exempt
-def receive_detections(request):
+async def receive_detections_async(request):
     if request.method != "POST":
         return JsonResponse({"detail": "Only POST allowed"}, status=405)
 
-    # Simple token auth
-    token = request.headers.get("Authorization")
-    if token != "Bearer MY_SECRET_KEY":
+    if not _authorized(request):
         return JsonResponse({"detail": "Unauthorized"}, status=401)
 
     try:
-        data = json.loads(request.body)
+        data = json.loads(ingest.request_body(request))
     except json.JSONDecodeError:
         return JsonResponse({"detail": "Invalid JSON"}, status=400)
+    except ingest.PayloadError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
 
-    device_id = data.get("device_id")
-    timestamp = data.get("timestamp") or now()
-    detections = data.get("detections", [])
-
-    saved = []
-    for d in detections:
-        obj = ToolsTracking.objects.create(
-            device_id=device_id,
-            tool_name=d.get("tool"),
-            confidence=d.get("confidence", 0.0),
-            timestamp=timestamp,
-            frame_id=data.get("frame_id"),
-            meta=data.get("meta", {}),
-        )
-        saved.append(obj.id)
-
-    return JsonResponse({"status": "ok", "saved_ids": saved})
-
-
-# Machine B — Detection sender script
-# # send_to_master.py
-# import requests, json, time, socket
-#
-# MASTER_IP = "192.168.1.100"   # Machine A IP
-# API_URL = f"http://{MASTER_IP}:8000/api/detections/"
-# API_KEY = "MY_SECRET_KEY"
-#
-# def send_detection(tool_name, confidence):
-#     payload = {
-#         "device_id": socket.gethostname(),
-#         "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
-#         "detections": [
-#             {"tool": tool_name, "confidence": confidence}
-#         ],
-#         "frame_id": "frame_001"
-#     }
-#     headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
-#     try:
-#         r = requests.post(API_URL, headers=headers, data=json.dumps(payload), timeout=5)
-#         print("→ Sent", r.status_code, r.text)
-#     except Exception as e:
-#         print("Send failed:", e)
-#
-# # Example usage
-# send_detection("spanner", 0.97)
+    try:
+        rows, acks = ingest.build_rows(data)
+    except ingest.PayloadError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    if rows and not write_behind.enqueue(rows):
+        return JsonResponse({"detail": "Ingest queue full, retry later"}, status=503,
+                            headers={"Retry-After": "1"})
+
+    return JsonResponse({"status": "accepted", "queued": len(rows), "frames": acks}, status=202)
+
+def detection_queue_stats(request):
+    if not _authorized(request):
+        return JsonResponse({"detail": "Unauthorized"}, status=401)
+
+    return JsonResponse(write_behind.stats())
 
-def tools_tracking_list(request):
-    search = request.GET.get("search", "")
-    records = ToolsTracking.objects.all().order_by("-timestamp")
 
+@login_required
+def object_detection(request):
+    return render(request, 'objectDetection.html')
+
+# Runs the frame through the shared micro-batched model (detection/inference.py).
+# No side effects, so the page's plain FormData POST needs no CSRF token.
+@csrf_exempt
+def detect_api(request):
+    if request.method != "POST":
+        return JsonResponse({"detail": "Only POST allowed"}, status=405)
+
+    if not (request.user.is_authenticated or _authorized(request)):
+        return JsonResponse({"detail": "Unauthorized"}, status=401)
+
+    upload = request.FILES.get("file")
+    data = upload.read() if upload else request.body
+    if not data:
+        return JsonResponse({"detail": "Send the frame as 'file' or as the request body"}, status=400)
+    try:
+        threshold = float(request.POST.get("threshold", request.GET.get("threshold", 0.25)))
+    except ValueError:
+        return JsonResponse({"detail": "threshold must be a number"}, status=400)
+
+    try:
+        detections = inference.batcher().detect(data, timeout=getattr(settings, 'INFERENCE_TIMEOUT', 10))
+    except inference.InferenceError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+    except inference.Overloaded as e:
+        return JsonResponse({"detail": str(e)}, status=503, headers={"Retry-After": "1"})
+    except TimeoutError as e:
+        return JsonResponse({"detail": str(e)}, status=504)
+
+    return JsonResponse({"detections": [d for d in detections if d["score"] >= threshold]})
+
+# Machine B — the detection sender lives in detection/sender.py
+# (DetectionSender: pooled session, batching, gzip and an on-disk spool).
+
+def _tracking_records(request):
+    records = ToolsTracking.objects.all()
+    search = request.GET.get("search", "")
     if search:
         records = records.filter(tool_name__icontains=search)
+    if request.GET.get("device_id"):
+        records = records.filter(device_id=request.GET["device_id"])
+    return records, search
+
+@replica_reads
+def tools_tracking_list(request):
+    records, search = _tracking_records(request)
+    page = keyset_page(records, request.GET.get("cursor"), per_page=50)
 
     return render(request, "tools_tracking_list.html", {
-        "records": records,
-        "search": search
-    })
\ No newline at end of file
+        "records": page,
+        "search": search,
+        "is_first_page": not request.GET.get("cursor"),
+    })
+
+def tools_tracking_api(request):
+    records, _ = _tracking_records(request)
+    page = keyset_page(records, request.GET.get("cursor"), per_page=_page_size(request))
+    return JsonResponse({
+        "results": [
+            {
+                "id": r.id,
+                "device_id": r.device_id,
+                "tool_name": r.tool_name,
+                "confidence": r.confidence,
+                "timestamp": r.timestamp,
+                "frame_id": r.frame_id,
+                "meta": r.meta,
+            }
+            for r in page
+        ],
+        "next": page.next_cursor,
+        "previous": page.previous_cursor,
+    })
+
+def _query_time(value, name):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid {name}: {value!r}")
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+@replica_reads
+def detection_analytics_api(request):
+    """
+    Detection counts and confidence per time bucket from the rollup tables.
+    ?start=&end= (ISO date or datetime; default: the last 24 hours),
+    ?interval=minute|hour|day (default: picked from the range),
+    ?device_id=, ?tool_name=, ?group_by=device_id,tool_name.
+    """
+    try:
+        end = _query_time(request.GET["end"], "end") if request.GET.get("end") else timezone.now()
+        start = (_query_time(request.GET["start"], "start") if request.GET.get("start")
+                 else end - datetime.timedelta(days=1))
+    except ValueError as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+    if start >= end:
+        return JsonResponse({"detail": "start must be before end"}, status=400)
+
+    interval = request.GET.get("interval") or None
+    if interval and interval not in rollups.LEVELS:
+        return JsonResponse({"detail": f"interval must be one of {', '.join(rollups.LEVELS)}"}, status=400)
+    group_by = [f for f in request.GET.get("group_by", "").split(",") if f]
+    unknown = [f for f in group_by if f not in rollups.GROUP_FIELDS]
+    if unknown:
+        return JsonResponse({"detail": f"Cannot group by {', '.join(unknown)}"}, status=400)
+
+    return JsonResponse(rollups.query(
+        start, end, interval,
+        device_id=request.GET.get("device_id"), tool_name=request.GET.get("tool_name"), group_by=group_by,
+    ))
+
+@login_required
+@replica_reads
+def export_view(request, dataset):
+    """
+    Streams every matching row of ``dataset`` (events or detections).
+    ?format=csv|ndjson, ?gzip=1, ?start=&end= (ISO date or datetime) and the
+    dataset's filters (device_id, tool_name, tool_id, user_id, event).
+    """
+    fmt = request.GET.get("format", "csv")
+    compress = request.GET.get("gzip") == "1"
+    filters = {k: v for k, v in request.GET.items() if k not in ("format", "gzip", "start", "end")}
+    try:
+        start = _query_time(request.GET["start"], "start") if request.GET.get("start") else None
+        end = _query_time(request.GET["end"], "end") if request.GET.get("end") else None
+        rows = exports.queryset(dataset, start, end, **filters)
+        # Pin the alias now; the rows are read after the view has returned
+        rows = rows.using(rows.db)
+        body = exports.stream(dataset, rows, fmt, compress)
+    except (ValueError, exports.ExportError) as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+
+    content_type = "application/gzip" if compress else exports.FORMATS[fmt][0]
+    response = StreamingHttpResponse(body, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{exports.filename(dataset, fmt, compress)}"'
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@user_passes_test(lambda u: u.is_staff)
+def sql_report(request):
+    if request.method == 'POST':
+        sql_middleware.report.clear()
+        return redirect('sql_report')
+    snapshot = sql_middleware.report.snapshot()
+    if request.GET.get('format') == 'json':
+        return JsonResponse(snapshot)
+    return render(request, 'sql_report.html', {
+        **snapshot,
+        'enabled': settings.SQL_INSPECTOR_ENABLED,
+        'threshold': sql_middleware.N_PLUS_ONE_THRESHOLD,
+    })
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    queue = write_behind.stats()
+    extra = {
+        'fod_ingest_queue_depth': ('gauge', "Batches waiting in the write-behind queue.", queue['depth']),
+        'fod_ingest_queue_rejected_batches_total': (
+            'counter', "Batches refused because the queue was full.", queue['rejected_batches']),
+        'fod_ingest_queue_dropped_batches_total': (
+            'counter', "Batches lost to failed flushes.", queue['dropped_batches']),
+    }
+    inference_stats = inference.stats()
+    if inference_stats:
+        extra.update({
+            'fod_inference_frames_total': ('counter', "Frames run through the detection model.", inference_stats['frames']),
+            'fod_inference_batches_total': ('counter', "Forward passes run.", inference_stats['batches']),
+            'fod_inference_queue_depth': ('gauge', "Frames waiting for a batch.", inference_stats['depth']),
+            'fod_inference_rejected_frames_total': (
+                'counter', "Frames refused because the queue was full.", inference_stats['rejected_frames']),
+        })
+    body = metrics.render(extra)
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,15 +42,43 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'detection.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'detection.middleware.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'detection.middleware.SQLInspectorMiddleware',
 ]
 
+# Per-request SQL counts, timings and N+1 detection (response headers plus
+# the /debug/sql/ report). Off unless SQL_INSPECTOR=1; does not need DEBUG.
+SQL_INSPECTOR_ENABLED = os.environ.get('SQL_INSPECTOR') == '1'
+SQL_INSPECTOR_N_PLUS_ONE_THRESHOLD = 5
+
+# Server-side detection behind /api/detect/ (detection/inference.py). 'stub'
+# needs no model; 'onnx' loads INFERENCE_MODEL_PATH with ONNX Runtime.
+INFERENCE_RUNNER = os.environ.get('INFERENCE_RUNNER', 'stub')
+INFERENCE_MODEL_PATH = os.environ.get('INFERENCE_MODEL_PATH')
+INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH', 8))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 10))
+# Processes decoding frames for the 'onnx' runner; 0 decodes in the request
+# thread. Half the cores by default, leaving the rest to ONNX Runtime.
+INFERENCE_PREPROCESS_WORKERS = int(os.environ.get('INFERENCE_PREPROCESS_WORKERS', (os.cpu_count() or 1) // 2))
+# Seconds a worker may spend on one frame before it is killed and the
+# request gets a 503.
+INFERENCE_PREPROCESS_TIMEOUT = float(os.environ.get('INFERENCE_PREPROCESS_TIMEOUT', 5))
+
+# Bearer token required by /metrics; leave unset to let any scraper in.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Per-device series: the listed ids (comma-separated), or else the first
+# METRICS_MAX_DEVICES seen; other devices are counted as device_id="other".
+METRICS_DEVICE_IDS = [d for d in os.environ.get('METRICS_DEVICE_IDS', '').split(',') if d] or None
+METRICS_MAX_DEVICES = int(os.environ.get('METRICS_MAX_DEVICES', 100))
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -69,6 +98,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
+# Push inventory changes over SSE (/inventory/stream/). Only for deployments
+# served by an ASGI server (mysite.asgi); under WSGI the page long-polls.
+INVENTORY_FEED_SSE = os.environ.get('INVENTORY_FEED_SSE') == '1'
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -83,6 +116,68 @@ DATABASES = {
     }
 }
 
+# DJANGO_DB=sqlite switches to a local SQLite file (e.g. to compare ingest
+# benchmarks against Postgres, or to run the tests without a server).
+if os.environ.get('DJANGO_DB') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+    }
+    # A second SQLite file can stand in for the replica; by default it is the
+    # same file. The test runner gives each alias its own in-memory database.
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.environ.get('DJANGO_REPLICA_SQLITE_PATH', DATABASES['default']['NAME']),
+    )
+elif os.environ.get('DJANGO_REPLICA_HOST'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        HOST=os.environ['DJANGO_REPLICA_HOST'],
+        PORT=os.environ.get('DJANGO_REPLICA_PORT', DATABASES['default']['PORT']),
+    )
+
+# Dashboard reads go to the replica (detection/db_router.py). Connection
+# reuse and health checks are set per alias, e.g. DEFAULT_CONN_MAX_AGE=60,
+# REPLICA_CONN_HEALTH_CHECKS=1.
+DATABASE_ROUTERS = ['detection.db_router.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+for _alias, _db in DATABASES.items():
+    _db['CONN_MAX_AGE'] = int(os.environ.get(f'{_alias.upper()}_CONN_MAX_AGE', 0))
+    _db['CONN_HEALTH_CHECKS'] = os.environ.get(f'{_alias.upper()}_CONN_HEALTH_CHECKS') == '1'
+
+# Holds the generation tokens of the access scopes (detection/scope.py), the
+# hierarchy snapshot (detection/hierarchy.py) and the cached pages
+# (detection/response_cache.py); bumping one must reach every process. Files
+# are shared by the processes of one host; across hosts use Redis, Memcached
+# or the database cache. Never local memory, which each process keeps alone.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('GENERATION_CACHE_DIR', BASE_DIR / '.cache' / 'generations'),
+        # Past this, tokens are culled; a missing token reads as a bump
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Rendered pages (detection/response_cache.py). Local memory by default;
+    # set RESPONSE_CACHE_DIR to keep them on disk instead. Both evict least
+    # recently used entries past MAX_ENTRIES.
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 500},
+    },
+}
+if os.environ.get('RESPONSE_CACHE_DIR'):
+    CACHES['responses'].update({
+        'BACKEND': 'detection.cache_backends.LRUFileBasedCache',
+        'LOCATION': os.environ['RESPONSE_CACHE_DIR'],
+    })
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE', '1') != '0'
+# Upper bound on the age of the in-process hierarchy snapshot
+# (detection/hierarchy.py), for edits that bypass the signals.
+HIERARCHY_MAX_AGE = int(os.environ.get('HIERARCHY_MAX_AGE', 300))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 